@@ -1,181 +1,316 @@
-import geopandas as gpd
+import numpy as np
 import pandas as pd
+from shapely.geometry import box
 import sqlite3
-import pickle
-import lightgbm as lgb
-import generate_pdf
-
-from flask import Flask, jsonify, request, send_file
+import json
+import itertools
+import importlib
+import time
+import tempfile
+import threading
+from grid_store import get_grid_store
+from model_registry import ModelRegistry, DEFAULT_MEMORY_BUDGET
+import database
+import aqi
+import slot_statistics
+import regions
+import scenarios
+import value_encoding
+import tiles
+import report_jobs
+import spatial_index
+import geojson_stream
+import timings
+import warm_up
+import singleflight
+from feature_vector_columns import featureVectorColumnNames
+from feature_cube import FeatureCube
+from prediction_cache import PredictionCache, scenario_key, canonical_changes, DEFAULT_CACHE_BYTES
+
+from flask import Flask, jsonify, request, send_file, g
 import os
 from flask_cors import CORS
 import logging
 
-from environmental_insights import air_pollution_functions as ei_air_pollution_functions
-from environmental_insights import models as ei_models
-
 app = Flask(__name__)
-CORS(app)
-logging.basicConfig(level=logging.INFO)
+CORS(app, expose_headers=value_encoding.RAW_HEADERS + value_encoding.TIME_SERIES_HEADERS + ['Server-Timing'])
+
+# DEBUG also logs the data behind each response (DataFrame dumps and summaries); they are skipped at INFO and above
+LOG_LEVEL = os.environ.get('EII_LOG_LEVEL', 'INFO').upper()
+logging.basicConfig(level=LOG_LEVEL)
 
 # Define the base directory of the application
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
-# File paths
-GPKG_FILE = os.path.join(BASE_DIR, 'data', 'raw_data', 'uk_1km_landGrids_3395_london.gpkg')
-DATABASE_FILE = os.path.join(BASE_DIR, 'data', 'database.db')
-
-featureVectorColumnNames = ["Bicycle Score", "Car and Taxi Score", "Bus and Coach Score", "LGV Score", "HGV Score",
-                            
-                            "Week Number", "Month Number", "Day of Week Number", "Hour Number", 
-                            
-                            '100m_u_component_of_wind', 
-                            '100m_v_component_of_wind', 
-                            '10m_u_component_of_wind',
-                            '10m_v_component_of_wind', 
-                            '2m_dewpoint_temperature', 
-                            '2m_temperature',
-                            'boundary_layer_height', 
-                            'downward_uv_radiation_at_the_surface', 
-                            'instantaneous_10m_wind_gust',
-                            'surface_pressure', 
-                            'total_column_rain_water',
-                            
-                            "S5P_NO2","S5P_AAI","S5P_CO","S5P_HCHO","S5P_O3",
-                                
-                            "Road Infrastructure Distance residential",
-                            "Road Infrastructure Distance footway",
-                            "Road Infrastructure Distance service",
-                            "Road Infrastructure Distance primary",
-                            "Road Infrastructure Distance path",
-                            "Road Infrastructure Distance cycleway",
-                            "Road Infrastructure Distance tertiary",
-                            "Road Infrastructure Distance secondary",
-                            "Road Infrastructure Distance unclassified",
-                            "Road Infrastructure Distance trunk",
-                            "Road Infrastructure Distance track",
-                            "Road Infrastructure Distance motorway",
-                            "Road Infrastructure Distance pedestrian",
-                            "Road Infrastructure Distance living_street",
-                            
-                            
-                            "Total Length cycleway", "Total Length footway",
-                            "Total Length living_street", "Total Length motorway",
-                             "Total Length path",
-                            "Total Length pedestrian", "Total Length primary",
-                            "Total Length residential", "Total Length secondary",
-                             "Total Length service",
-                            "Total Length tertiary",
-                             "Total Length track",
-                            "Total Length trunk",
-                            "Total Length unclassified",
-                            
-                            
-                            'No Land',
-                            'Broadleaved woodland',
-                            'Coniferous Woodland',
-                            'Arable and Horticulture',
-                            'Improved Grassland',
-                            'Neutral Grassland',
-                            'Calcareous Grassland',
-                            'Acid grassland',
-                            'Fen Marsh and Swamp',
-                            'Heather',
-                            'Heather grassland',
-                            'Bog',
-                            'Inland Rock',
-                            'Saltwater',
-                            'Freshwater',
-                            'Supra-littoral Rock',
-                            'Supra-littoral Sediment',
-                            'Littoral Rock',
-                            'Littoral sediment',
-                            'Saltmarsh',
-                            'Urban',
-                            'Suburban',
-                           
-                            'NAEI SNAP 1 NOx',
-                            'NAEI SNAP 2 NOx',
-                            'NAEI SNAP 3 NOx',
-                            'NAEI SNAP 4 NOx',
-                            'NAEI SNAP 5 NOx',
-                            'NAEI SNAP 6 NOx',
-                            'NAEI SNAP 7 NOx',
-                            'NAEI SNAP 8 NOx',
-                            'NAEI SNAP 9 NOx',
-                            'NAEI SNAP 10 NOx',
-                            'NAEI SNAP 11 NOx',
-                            'NAEI SNAP 1 CO',
-                            'NAEI SNAP 2 CO',
-                            'NAEI SNAP 3 CO',
-                            'NAEI SNAP 4 CO',
-                            'NAEI SNAP 5 CO',
-                            'NAEI SNAP 6 CO',
-                            'NAEI SNAP 7 CO',
-                            'NAEI SNAP 8 CO',
-                            'NAEI SNAP 9 CO',
-                            'NAEI SNAP 10 CO',
-                            'NAEI SNAP 11 CO',
-                            'NAEI SNAP 1 SOx',
-                            'NAEI SNAP 2 SOx',
-                            'NAEI SNAP 3 SOx',
-                            'NAEI SNAP 4 SOx',
-                            'NAEI SNAP 5 SOx',
-                            'NAEI SNAP 6 SOx',
-                            'NAEI SNAP 7 SOx',
-                            'NAEI SNAP 8 SOx',
-                            'NAEI SNAP 9 SOx',
-                            'NAEI SNAP 10 SOx',
-                            'NAEI SNAP 11 SOx',
-                            'NAEI SNAP 1 NH3',
-                            'NAEI SNAP 2 NH3',
-                            'NAEI SNAP 3 NH3',
-                            'NAEI SNAP 4 NH3',
-                            'NAEI SNAP 5 NH3',
-                            'NAEI SNAP 6 NH3',
-                            'NAEI SNAP 7 NH3',
-                            'NAEI SNAP 8 NH3',
-                            'NAEI SNAP 9 NH3',
-                            'NAEI SNAP 10 NH3',
-                            'NAEI SNAP 11 NH3',
-                            'NAEI SNAP 1 NMVOC',
-                            'NAEI SNAP 2 NMVOC',
-                            'NAEI SNAP 3 NMVOC',
-                            'NAEI SNAP 4 NMVOC',
-                            'NAEI SNAP 5 NMVOC',
-                            'NAEI SNAP 6 NMVOC',
-                            'NAEI SNAP 7 NMVOC',
-                            'NAEI SNAP 8 NMVOC',
-                            'NAEI SNAP 9 NMVOC',
-                            'NAEI SNAP 10 NMVOC',
-                            'NAEI SNAP 11 NMVOC',
-                            'NAEI SNAP 1 PM10',
-                            'NAEI SNAP 2 PM10',
-                            'NAEI SNAP 3 PM10',
-                            'NAEI SNAP 4 PM10',
-                            'NAEI SNAP 5 PM10',
-                            'NAEI SNAP 6 PM10',
-                            'NAEI SNAP 7 PM10',
-                            'NAEI SNAP 8 PM10',
-                            'NAEI SNAP 9 PM10',
-                            'NAEI SNAP 10 PM10',
-                            'NAEI SNAP 11 PM10',
-                            'NAEI SNAP 1 PM25',
-                            'NAEI SNAP 2 PM25',
-                            'NAEI SNAP 3 PM25',
-                            'NAEI SNAP 4 PM25',
-                            'NAEI SNAP 5 PM25',
-                            'NAEI SNAP 6 PM25',
-                            'NAEI SNAP 7 PM25',
-                            'NAEI SNAP 8 PM25',
-                            'NAEI SNAP 9 PM25',
-                            'NAEI SNAP 10 PM25',
-                            'NAEI SNAP 11 PM25',
-                           
-                           
-                            
-                           
-                           
-                           ]
+# File paths, overridable to serve another build (e.g. a synthetic benchmark database)
+GPKG_FILE = os.environ.get('EII_GPKG_FILE', os.path.join(BASE_DIR, 'data', 'raw_data', 'uk_1km_landGrids_3395_london.gpkg'))
+DATABASE_FILE = os.environ.get('EII_DATABASE_FILE', os.path.join(BASE_DIR, 'data', 'database.db'))
+MODELS_DIR = os.environ.get('EII_MODELS_DIR', os.path.join(BASE_DIR, 'models', 'uk'))
+
+# When warm-up runs: 'background' starts it in a thread on import, 'preload' leaves it to the caller
+# (gunicorn.conf.py runs it in the parent before forking) and 'off' loads everything on first use
+WARM_UP = os.environ.get('EII_WARM_UP', 'background')
+
+# Model registry settings; with EII_PRELOAD_MODELS=1 every booster is parsed during warm-up instead of on first use
+MODEL_MEMORY_BUDGET = int(os.environ.get('EII_MODEL_MEMORY_BUDGET', DEFAULT_MEMORY_BUDGET))
+PRELOAD_MODELS = os.environ.get('EII_PRELOAD_MODELS', '0') == '1'
+
+# Vector tile layers and the dataType each one defaults to
+TILE_LAYERS = {'air-pollution-concentrations': 'nox', 'feature-vector': 'Bicycle Score'}
+TILE_CACHE_FILE = os.environ.get('EII_TILE_CACHE_FILE', os.path.join(BASE_DIR, 'data', 'tiles.mbtiles'))
+TILE_CACHE_BYTES = int(os.environ.get('EII_TILE_CACHE_BYTES', tiles.DEFAULT_TILE_CACHE_BYTES))
+
+# Largest number of scenarios accepted by /predict-batch
+MAX_BATCH_SCENARIOS = 2000
+
+# Prediction cache settings
+PREDICTION_CACHE_BYTES = int(os.environ.get('EII_PREDICTION_CACHE_BYTES', DEFAULT_CACHE_BYTES))
+
+# Report jobs: per-job output directories, render processes, seconds finished reports are kept,
+# and how long /generate-report waits for one
+REPORT_DIR = os.environ.get('EII_REPORT_DIR', os.path.join(tempfile.gettempdir(), 'eii-reports'))
+REPORT_WORKERS = int(os.environ.get('EII_REPORT_WORKERS', report_jobs.DEFAULT_REPORT_WORKERS))
+REPORT_TTL = int(os.environ.get('EII_REPORT_TTL', report_jobs.DEFAULT_REPORT_TTL))
+REPORT_TIMEOUT = 600
+
+# Named region sets (e.g. boroughs.gpkg) for /aggregate, and where their weight tables are kept
+REGIONS_DIR = os.environ.get('EII_REGIONS_DIR', os.path.join(BASE_DIR, 'data', 'regions'))
+REGION_WEIGHTS_DIR = os.environ.get('EII_REGION_WEIGHTS_DIR') or None
+
+# Reprojected and simplified grid geometry, with the levels of detail stored in the database, shared across requests
+grid_store = get_grid_store(GPKG_FILE, database_file=DATABASE_FILE)
+
+# Unsimplified grid in web mercator for vector tiles, and the on-disk tile cache
+tile_grid_store = get_grid_store(GPKG_FILE, epsg=3857, tolerance=None)
+tile_cache = tiles.TileCache(TILE_CACHE_FILE, max_bytes=TILE_CACHE_BYTES)
+
+# Unsimplified grid in its own CRS for region overlaps, and the cell-to-region weight tables
+region_grid_store = get_grid_store(GPKG_FILE, epsg=spatial_index.GRID_EPSG, tolerance=None)
+region_weight_cache = regions.RegionWeightCache(REGION_WEIGHTS_DIR)
+
+# Parsed LightGBM boosters, cached across requests
+model_registry = ModelRegistry(MODELS_DIR, memory_budget=MODEL_MEMORY_BUDGET)
+
+# Memory-mapped feature vectors written next to the database by the builder, if present
+feature_cube = FeatureCube(DATABASE_FILE)
+
+# Reports rendered in a process pool, deduplicated by request content
+report_queue = report_jobs.ReportJobs(REPORT_DIR, max_workers=REPORT_WORKERS, ttl=REPORT_TTL)
+
+# Statistics computed at request time, per column, time slot and scenario
+statistics_cache = slot_statistics.StatisticsCache()
+
+# Serialised /predict responses, keyed by canonicalised scenario
+prediction_cache = PredictionCache(
+    max_bytes=PREDICTION_CACHE_BYTES, cache_dir=os.environ.get('EII_PREDICTION_CACHE_DIR') or None
+)
+
+# Concurrent identical GeoJSON and /predict requests, answered by one read or prediction
+in_flight = singleflight.SingleFlight()
+
+def warm_grid_geometry():
+    # Every stored level of detail, with its encoded GeoJSON fragments, and the default level's /grid-geometry body
+    grid_store.get()
+    for min_zoom, _ in grid_store.levels().values():
+        grid_store.geometry_fragments(min_zoom)
+    grid_store.geometry_fragments()
+    grid_store.geojson()
+
+def warm_feature_cube():
+    # Opens the memory map; its pages are shared through the page cache, so nothing is read here
+    if feature_cube.available():
+        feature_cube.columns
+
+def warm_model_stack():
+    # lightgbm and environmental_insights are imported on first use; import them before the first /predict does
+    importlib.import_module('lightgbm')
+    importlib.import_module('environmental_insights.models')
+
+def warm_aqi_banding():
+    for pollutant in aqi.AQI_BREAKPOINTS:
+        aqi.vectorised_banding_matches(pollutant)
+
+# Everything requests would otherwise load on first use. Under gunicorn (see gunicorn.conf.py) this runs once in
+# the parent before workers fork, so they share it copy-on-write; none of it starts a thread pool.
+startup = warm_up.WarmUp([
+    ('grid geometry', warm_grid_geometry),
+    ('tile grid', tile_grid_store.get),
+    ('region grid', region_grid_store.get),
+    ('model stack', warm_model_stack),
+    ('feature cube', warm_feature_cube),
+    ('aqi banding', warm_aqi_banding),
+])
+
+# Loaded in each process that serves requests. Parsing a booster runs an OpenMP parallel loop, which starts
+# libgomp's thread pool, and a pool started before a fork can hang the workers on their first prediction, so under
+# gunicorn these run in every worker after it forks (post_fork), never in the parent.
+worker_startup = warm_up.WarmUp([('models', model_registry.preload)] if PRELOAD_MODELS else [])
+
+def run_warm_up():
+    # Both warm-ups in order, for a server that does not fork
+    startup.run()
+    worker_startup.run()
+
+def time_slot_error(month, day_of_week, hour):
+    return f"Could not find data for Month {month}, Day {day_of_week}, Hour {hour} in the database."
+
+def scenario_version(air_pollutant, model_type="0.5", model_dataset="All"):
+    # Modification times of the data, geometry and model a scenario response is computed from
+    paths = [DATABASE_FILE, GPKG_FILE, feature_cube.cube_file, model_registry.model_path(air_pollutant, model_type, model_dataset)]
+    return tuple(os.path.getmtime(path) if os.path.exists(path) else None for path in paths)
+
+def time_slot_args():
+    # Month, day and hour query parameters shared by the data endpoints
+    month = request.args.get('month', default='1', type=str)
+    day_of_week = request.args.get('day', default='Friday', type=str)
+    hour = int(request.args.get('hour', default='8', type=str).split(':')[0])
+    return month, day_of_week, hour
+
+def zoom_arg():
+    # Optional map zoom level, which picks the precomputed geometry detail
+    return request.args.get('zoom', default=None, type=float)
+
+def changes_arg():
+    # "Feature:change,Feature:change" query parameter, changes in percent. Canonicalised here, so scenarios
+    # are computed with exactly the values their cache keys hold
+    changes_str = request.args.get('changes', default='', type=str)
+    changes = {item.split(':')[0]: float(item.split(':')[1]) for item in changes_str.split(',') if ':' in item}
+    return dict(canonical_changes(changes))
+
+def read_air_pollution_concentrations(data_type, month, day_of_week, hour, grid_ids=None):
+    # Prediction column with its AQI bands, read from the database when the builder stored them
+    column = scenarios.prediction_column(data_type)
+    conn = sqlite3.connect(DATABASE_FILE)
+    try:
+        columns = [column]
+        if database.is_long_format(conn) and aqi.aqi_column(data_type) in database.value_columns(conn, database.AIR_POLLUTION_CONCENTRATION):
+            columns.append(aqi.aqi_column(data_type))
+        with timings.stage('sql_read'):
+            data = database.read_time_slot(
+                conn, database.AIR_POLLUTION_CONCENTRATION, month, day_of_week, hour, columns, grid_ids
+            )
+    finally:
+        conn.close()
+    with timings.stage('aqi_banding'):
+        return aqi.add_aqi_columns(data, data_type, column)
+
+def predict_scenario(air_pollutant, month, day_of_week, hour, changes, grid_ids=None, model_type="0.5", model_dataset="All"):
+    # "Grid ID" and "<pollutant> Prediction 0.5" for one time slot with the changes applied
+    observation_data = read_feature_vectors(month, day_of_week, hour, grid_ids=grid_ids)
+
+    # Load the model from the registry
+    model = model_registry.get(air_pollutant, model_type, model_dataset)
+
+    # Make predictions, reusing the stored baseline for cells the changes do not touch
+    baseline = read_baseline_predictions(model, air_pollutant, month, day_of_week, hour, observation_data, grid_ids)
+    with timings.stage('predict'):
+        predictions = scenarios.predict_scenarios(
+            model, [(observation_data, changes, baseline)], featureVectorColumnNames
+        )[0]
+    return pd.DataFrame({
+        "Grid ID": observation_data["Grid ID"].to_numpy(),
+        scenarios.prediction_column(air_pollutant): predictions,
+    })
+
+def values_response(data, column, pollutant=None):
+    # Encode a "Grid ID"-keyed column as values aligned to the grid order, with AQI bands for pollutants
+    fmt = request.args.get('format', default='raw', type=str)
+    grid_ids = grid_store.grid_ids()
+    values = value_encoding.align_values(grid_ids, data['Grid ID'], data[column])
+
+    bands = None
+    if pollutant is not None:
+        if aqi.aqi_column(pollutant) not in data:
+            with timings.stage('aqi_banding'):
+                aqi.add_aqi_columns(data, pollutant, column)
+        bands = value_encoding.align_values(
+            grid_ids, data['Grid ID'], data[aqi.aqi_column(pollutant)], dtype=np.uint8, fill=0
+        )
+
+    try:
+        with timings.stage('serialise'):
+            body, mimetype, headers = value_encoding.encode_values(values, bands, fmt)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    response = app.response_class(body, mimetype=mimetype)
+    response.headers.update(headers)
+    return response
+
+def read_baseline_predictions(model, air_pollutant, month, day_of_week, hour, observation_data, grid_ids=None):
+    # Stored baseline predictions aligned with observation_data, or None if missing or not from this model
+    conn = sqlite3.connect(DATABASE_FILE)
+    try:
+        column = scenarios.prediction_column(air_pollutant)
+        with timings.stage('sql_read'):
+            baseline = database.read_time_slot(
+                conn, database.AIR_POLLUTION_CONCENTRATION, month, day_of_week, hour, [column], grid_ids
+            )
+    except Exception as e:
+        app.logger.info(f"No baseline {air_pollutant} predictions for Month {month}, Day {day_of_week}, Hour {hour}: {e}")
+        return None
+    finally:
+        conn.close()
+
+    baseline = baseline.set_index("Grid ID")[column].reindex(observation_data["Grid ID"].to_numpy()).to_numpy(dtype=float)
+    if not scenarios.baseline_matches_model(model, observation_data, baseline, featureVectorColumnNames):
+        app.logger.warning(f"Baseline {air_pollutant} predictions do not match the model; rescoring every cell.")
+        return None
+    return baseline
+
+def read_feature_vectors(month, day_of_week, hour, columns=None, grid_ids=None):
+    # Slice the memory-mapped feature cube when it holds these columns, otherwise read SQLite
+    if feature_cube.available() and (columns is None or feature_cube.has_columns(columns)):
+        with timings.stage('cube_read'):
+            return feature_cube.frame(month, day_of_week, hour, columns, grid_ids)
+
+    conn = sqlite3.connect(DATABASE_FILE)
+    try:
+        with timings.stage('sql_read'):
+            return database.read_time_slot(conn, database.FEATURE_VECTOR, month, day_of_week, hour, columns, grid_ids)
+    finally:
+        conn.close()
+
+def viewport_grid_ids():
+    # Grid IDs inside the optional "bbox" query parameter, or None for every cell
+    bbox = request.args.get('bbox', default=None, type=str)
+    if not bbox:
+        return None
+    bbox = spatial_index.parse_bbox(bbox, request.args.get('bbox_crs', default=4326, type=int))
+
+    # Indexed query on the R*Tree of the grids table
+    grid_ids = grid_store.grid_ids()
+    conn = sqlite3.connect(DATABASE_FILE)
+    try:
+        viewport_ids = spatial_index.grid_ids_in_bbox(conn, bbox, pd.api.types.is_integer_dtype(grid_ids.dtype))
+    finally:
+        conn.close()
+    if viewport_ids is not None:
+        return viewport_ids
+
+    # Databases without a spatial index fall back to the cached geometry's index
+    bbox = spatial_index.transform_bbox(bbox, spatial_index.GRID_EPSG, 4326)
+    positions = grid_store.get().sindex.query(box(*bbox), predicate='intersects')
+    return grid_ids[positions].tolist()
+
+@app.before_request
+def start_timing():
+    g.request_start = time.perf_counter()
+    timings.start_request()
+
+@app.after_request
+def add_server_timing(response):
+    # Stages timed before the response was returned, plus the total; streamed bodies are timed into /metrics only
+    total = time.perf_counter() - g.request_start
+    timings.request_durations.observe(request.url_rule.rule if request.url_rule else 'unmatched', total)
+    stages = timings.server_timing()
+    response.headers['Server-Timing'] = (stages + ', ' if stages else '') + f'total;dur={total * 1000:.1f}'
+    return response
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    # Stage and request duration histograms of this process, in the Prometheus text format
+    return app.response_class(timings.render_metrics(), mimetype=timings.METRICS_MIMETYPE)
 
 @app.route('/')
 def serve_react_app():
@@ -183,239 +318,717 @@ def serve_react_app():
 
 @app.route('/status', methods=['GET'])
 def status():
-    return jsonify({"status": "Server is running"}), 200
+    # Always 200 once the server answers; with ?ready=true, 503 until this process's warm-up has finished
+    ready = (startup.ready and worker_startup.ready) or WARM_UP == 'off'
+    code = 503 if request.args.get('ready', default='false', type=str).lower() == 'true' and not ready else 200
+    return jsonify({
+        "status": "Server is running", "ready": ready,
+        "warm_up": startup.status(), "worker_warm_up": worker_startup.status(),
+    }), code
 
 @app.route('/air-pollution-concentrations', methods=['POST', 'GET'])
 def geojson_data():
     # Extract parameters from the query
     data_type = request.args.get('dataType', default='nox', type=str)
-    month = request.args.get('month', default='1', type=str)
-    day_of_week = request.args.get('day', default='Friday', type=str)
-    hour = int(request.args.get('hour', default='8', type=str).split(':')[0])
+    month, day_of_week, hour = time_slot_args()
 
-    print(f"Air Pollutant Requested: {data_type}")
-    print(f"Month: {month}, Day: {day_of_week}, Hour: {hour}")
+    app.logger.info(f"Air Pollutant Requested: {data_type}, Month: {month}, Day: {day_of_week}, Hour: {hour}")
 
-    # Read the GeoPackage file
-    grids = gpd.read_file(GPKG_FILE)
-
-    # Reproject to EPSG:4326 (WGS 84)
-    grids = grids.to_crs(epsg=4326)
+    try:
+        grid_ids = viewport_grid_ids()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
-    # Create a connection to the database
-    conn = sqlite3.connect(DATABASE_FILE)
+    zoom = zoom_arg()
 
-    # Construct table name and SQL query
-    table_name = f"air_pollution_concentration_Month_{month}_Day_{day_of_week}_Hour_{hour}"
-    pollutant_column = f'"{data_type} Prediction 0.5"'
-    sql_query = f'SELECT "Grid ID", {pollutant_column} FROM {table_name}'
+    def read():
+        # Read the pollutant column for this time slot
+        return read_air_pollution_concentrations(data_type, month, day_of_week, hour, grid_ids)
 
+    # Identical requests in flight share one read, keyed on the database it comes from
+    key = ('air-pollution-concentrations', data_type, month, day_of_week, hour,
+           request.args.get('bbox'), request.args.get('bbox_crs'),
+           os.path.getmtime(DATABASE_FILE) if os.path.exists(DATABASE_FILE) else None)
     try:
-        air_pollution_concentrations = pd.read_sql_query(sql_query, conn)
-        print("Air Pollution Concentrations")
-        print(air_pollution_concentrations)
+        air_pollution_concentrations = in_flight.do(key, read)
     except Exception as e:
-        print(f"Error reading table {table_name}: {e}")
-        conn.close()
-        return jsonify({"error": f"Could not find table {table_name} in the database."}), 400
+        app.logger.warning(f"Error reading {data_type} for Month {month}, Day {day_of_week}, Hour {hour}: {e}")
+        return jsonify({"error": time_slot_error(month, day_of_week, hour)}), 400
 
-    # Close the connection
-    conn.close()
+    if app.logger.isEnabledFor(logging.DEBUG):
+        app.logger.debug(f"Air Pollution Concentrations\n{air_pollution_concentrations}")
+        app.logger.debug(air_pollution_concentrations[data_type + " Prediction 0.5"].describe())
 
-    # Merge the data
-    merged_data = grids.merge(air_pollution_concentrations, left_on='Grid ID', right_on='Grid ID')
+    # Stream GeoJSON, pairing each row with the pre-encoded geometry for this zoom
+    return app.response_class(grid_store.stream_geojson(air_pollution_concentrations, zoom), mimetype='application/json')
 
-    # Simplify geometry
-    merged_data['geometry'] = merged_data['geometry'].simplify(0.001, preserve_topology=True)
+@app.route('/feature-vector', methods=['POST', 'GET'])
+def feature_vector_data():
+    # Extract parameters from the query
+    data_type = request.args.get('dataType', default='Bicycle Score', type=str)
+    month, day_of_week, hour = time_slot_args()
 
-    ei_air_pollution_functions.air_pollution_concentrations_to_UK_daily_air_quality_index(
-        merged_data, data_type, data_type + " Prediction 0.5"
-    )
+    app.logger.info(f"Feature Vector Requested: {data_type}, Month: {month}, Day: {day_of_week}, Hour: {hour}")
 
-    print(merged_data[data_type + " Prediction 0.5"].describe())
+    try:
+        grid_ids = viewport_grid_ids()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
-    # Convert to GeoJSON
-    geojson_data = merged_data.to_json()
+    # Read the feature column for this time slot
+    try:
+        feature_vector_data = read_feature_vectors(month, day_of_week, hour, [data_type], grid_ids)
+    except Exception as e:
+        app.logger.warning(f"Error reading {data_type} for Month {month}, Day {day_of_week}, Hour {hour}: {e}")
+        return jsonify({"error": time_slot_error(month, day_of_week, hour)}), 400
 
-    return geojson_data
+    app.logger.debug(f"Feature vector columns: {list(feature_vector_data.columns)}")
 
-@app.route('/feature-vector', methods=['POST', 'GET'])
-def feature_vector_data():
+    # Stream GeoJSON, pairing each row with the pre-encoded geometry for this zoom
+    return app.response_class(grid_store.stream_geojson(feature_vector_data, zoom_arg()), mimetype='application/json')
+
+@app.route('/predict', methods=['GET'])
+def predict():
     # Extract parameters from the query
-    data_type = request.args.get('dataType', default='Bicycle Score', type=str)
-    month = request.args.get('month', default='1', type=str)
-    day_of_week = request.args.get('day', default='Friday', type=str)
-    hour = int(request.args.get('hour', default='8', type=str).split(':')[0])
+    air_pollutant = request.args.get('air_pollutant', default='no2', type=str)
+    month, day_of_week, hour = time_slot_args()
+    changes = changes_arg()
 
-    print(f"Feature Vector Requested: {data_type}")
-    print(f"Month: {month}, Day: {day_of_week}, Hour: {hour}")
+    app.logger.info(f"Modified Predicted Air Pollutant Requested: {air_pollutant}, Month: {month}, Day: {day_of_week}, Hour: {hour}")
+    app.logger.info(f"Feature Vector Changes: {changes}")
 
-    # Read the GeoPackage file
-    grids = gpd.read_file(GPKG_FILE)
+    try:
+        grid_ids = viewport_grid_ids()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    # Serve repeated scenarios from the prediction cache
+    zoom = zoom_arg()
+    cache_key = scenario_key(
+        air_pollutant, month, day_of_week, hour, changes,
+        scenario_version(air_pollutant) + (request.args.get('bbox'), request.args.get('bbox_crs'), zoom)
+    )
+    cached_response = prediction_cache.get(cache_key)
+    if cached_response is not None:
+        return app.response_class(cached_response, mimetype='application/json')
 
-    # Reproject to EPSG:4326 (WGS 84)
-    grids = grids.to_crs(epsg=4326)
+    computed = []
 
-    # Create a connection to the database
-    conn = sqlite3.connect(DATABASE_FILE)
+    def compute():
+        updated_predictions = predict_scenario(air_pollutant, month, day_of_week, hour, changes, grid_ids)
 
-    # Construct table name and SQL query
-    table_name = f"feature_vector_Month_{month}_Day_{day_of_week}_Hour_{hour}"
-    feature_column = f'"{data_type}"'
-    sql_query = f'SELECT "Grid ID", {feature_column} FROM {table_name}'
+        # Band the scenario's predictions with the vectorised AQI lookup
+        with timings.stage('aqi_banding'):
+            aqi.add_aqi_columns(updated_predictions, air_pollutant, air_pollutant + " Prediction 0.5")
+        computed.append(True)
+        return updated_predictions
 
+    # Until it is cached, the same scenario in flight is predicted once for every request
     try:
-        feature_vector_data = pd.read_sql_query(sql_query, conn)
-    except Exception as e:
-        print(f"Error reading table {table_name}: {e}")
-        conn.close()
-        return jsonify({"error": f"Could not find table {table_name} in the database."}), 400
-
-    # Close the connection
-    conn.close()
+        updated_predictions = in_flight.do(('predict',) + cache_key, compute)
+    except database.TimeSlotNotFound as e:
+        app.logger.warning(f"Error reading feature vectors for Month {month}, Day {day_of_week}, Hour {hour}: {e}")
+        return jsonify({"error": time_slot_error(month, day_of_week, hour)}), 400
+
+    if app.logger.isEnabledFor(logging.DEBUG):
+        app.logger.debug(updated_predictions[air_pollutant + " Prediction 0.5"].describe())
+
+    # Stream {"updated_geojson": "<GeoJSON>"} with the GeoJSON escaped as a string, as before
+    chunks = itertools.chain(
+        ['{"updated_geojson": "'],
+        geojson_stream.json_string(grid_store.stream_geojson(updated_predictions, zoom)),
+        ['"}'],
+    )
+    if not computed:
+        # Requests that shared another's prediction leave filling the cache to it
+        return app.response_class((chunk.encode() for chunk in chunks), mimetype='application/json')
+    return app.response_class(cached_stream(cache_key, chunks), mimetype='application/json')
+
+def cached_stream(cache_key, chunks):
+    # Send chunks as they are made, keeping a copy for the prediction cache only while it fits the budget
+    kept, size = [], 0
+    for chunk in chunks:
+        chunk = chunk.encode()
+        yield chunk
+        if kept is not None:
+            size += len(chunk)
+            if size <= prediction_cache.max_bytes:
+                kept.append(chunk)
+            else:
+                kept = None
+    if kept is not None:
+        prediction_cache.put(cache_key, b''.join(kept))
+
+@app.route('/grid-geometry', methods=['GET'])
+def grid_geometry():
+    # Geometry and Grid IDs in the fixed order the values endpoints use; fetched once by the client
+    response = app.response_class(grid_store.geojson(zoom_arg()), mimetype='application/json')
+    response.headers['X-Grid-Count'] = str(len(grid_store.grid_ids()))
+    return response
+
+@app.route('/values/air-pollution-concentrations', methods=['GET'])
+def air_pollution_values():
+    # Same parameters as /air-pollution-concentrations, returned as grid-aligned values
+    data_type = request.args.get('dataType', default='nox', type=str)
+    month, day_of_week, hour = time_slot_args()
 
-    # Merge the data
-    merged_data = grids.merge(feature_vector_data, left_on='Grid ID', right_on='Grid ID')
+    try:
+        air_pollution_concentrations = read_air_pollution_concentrations(data_type, month, day_of_week, hour)
+    except Exception as e:
+        app.logger.warning(f"Error reading {data_type} for Month {month}, Day {day_of_week}, Hour {hour}: {e}")
+        return jsonify({"error": time_slot_error(month, day_of_week, hour)}), 400
 
-    # Simplify geometry
-    merged_data['geometry'] = merged_data['geometry'].simplify(0.001, preserve_topology=True)
+    return values_response(air_pollution_concentrations, scenarios.prediction_column(data_type), data_type)
 
-    print(merged_data.columns)
+@app.route('/values/feature-vector', methods=['GET'])
+def feature_vector_values():
+    # Same parameters as /feature-vector, returned as grid-aligned values
+    data_type = request.args.get('dataType', default='Bicycle Score', type=str)
+    month, day_of_week, hour = time_slot_args()
 
-    # Convert to GeoJSON
-    geojson_data = merged_data.to_json()
+    try:
+        feature_vector_data = read_feature_vectors(month, day_of_week, hour, [data_type])
+    except Exception as e:
+        app.logger.warning(f"Error reading {data_type} for Month {month}, Day {day_of_week}, Hour {hour}: {e}")
+        return jsonify({"error": time_slot_error(month, day_of_week, hour)}), 400
 
-    return geojson_data
+    return values_response(feature_vector_data, data_type)
 
-@app.route('/predict', methods=['GET'])
-def predict():
-    # Extract parameters from the query
+@app.route('/values/predict', methods=['GET'])
+def predict_values():
+    # Same parameters as /predict, returned as grid-aligned values
     air_pollutant = request.args.get('air_pollutant', default='no2', type=str)
-    month = request.args.get('month', default='1', type=str)
-    day_of_week = request.args.get('day', default='Friday', type=str)
-    hour = int(request.args.get('hour', default='8', type=str).split(':')[0])
-    changes_str = request.args.get('changes', default='', type=str)
-    changes = {item.split(':')[0]: float(item.split(':')[1]) for item in changes_str.split(',') if ':' in item}
+    month, day_of_week, hour = time_slot_args()
+    changes = changes_arg()
 
-    print(f"Modified Predicted Air Pollutant Requested: {air_pollutant}")
-    print(f"Month: {month}, Day: {day_of_week}, Hour: {hour}")
-    print(f"Feature Vector Changes: {changes}")
+    try:
+        updated_predictions = predict_scenario(air_pollutant, month, day_of_week, hour, changes)
+    except database.TimeSlotNotFound as e:
+        app.logger.warning(f"Error reading feature vectors for Month {month}, Day {day_of_week}, Hour {hour}: {e}")
+        return jsonify({"error": time_slot_error(month, day_of_week, hour)}), 400
+
+    return values_response(updated_predictions, scenarios.prediction_column(air_pollutant), air_pollutant)
+
+def statistics_response(cache_key, compute):
+    # Statistics from the per-process cache, computed on a miss
+    statistics = statistics_cache.get(cache_key)
+    if statistics is None:
+        statistics = compute()
+        statistics_cache.put(cache_key, statistics)
+    return jsonify(statistics)
+
+@app.route('/statistics/air-pollution-concentrations', methods=['GET'])
+def air_pollution_statistics():
+    # Summary, quantiles, value histogram and AQI band counts for one pollutant and time slot
+    data_type = request.args.get('dataType', default='nox', type=str)
+    month, day_of_week, hour = time_slot_args()
+    column = scenarios.prediction_column(data_type)
 
-    # Read the GeoPackage file
-    grids = gpd.read_file(GPKG_FILE)
-    grids = grids.to_crs(epsg=4326)
+    def compute():
+        # Baselines are precomputed by the builder; older databases are summarised here
+        conn = sqlite3.connect(DATABASE_FILE)
+        try:
+            statistics = slot_statistics.read_statistics(
+                conn, database.AIR_POLLUTION_CONCENTRATION, month, day_of_week, hour, column
+            )
+        finally:
+            conn.close()
+        if statistics is None:
+            data = read_air_pollution_concentrations(data_type, month, day_of_week, hour)
+            statistics = slot_statistics.compute_statistics(data[column], data[aqi.aqi_column(data_type)])
+        return statistics
 
-    # Create a connection to the database
-    conn = None
     try:
-        conn = sqlite3.connect(DATABASE_FILE)
-        table_name = f"feature_vector_Month_{month}_Day_{day_of_week}_Hour_{hour}"
-        sql_query = f'SELECT * FROM {table_name}'
-        observation_data = pd.read_sql_query(sql_query, conn)
+        return statistics_response(('air_pollution', column, month, day_of_week, hour, os.path.getmtime(DATABASE_FILE)), compute)
     except Exception as e:
-        print(f"Error reading table {table_name}: {e}")
-        return jsonify({"error": f"Could not find table {table_name} in the database."}), 400
-    finally:
-        if conn:
-            conn.close()
+        app.logger.warning(f"Error reading {data_type} for Month {month}, Day {day_of_week}, Hour {hour}: {e}")
+        return jsonify({"error": time_slot_error(month, day_of_week, hour)}), 400
 
-    print(observation_data)
+@app.route('/statistics/feature-vector', methods=['GET'])
+def feature_vector_statistics():
+    # Summary, quantiles and value histogram for one feature and time slot
+    data_type = request.args.get('dataType', default='Bicycle Score', type=str)
+    month, day_of_week, hour = time_slot_args()
 
-    # Apply changes to observation_data
-    for feature, change in changes.items():
-        if feature in observation_data.columns:
-            observation_data[feature] = observation_data[feature] * (1 + change / 100)
+    def compute():
+        data = read_feature_vectors(month, day_of_week, hour, [data_type])
+        return slot_statistics.compute_statistics(data[data_type])
 
-    # Load the model
-    model_type, model_dataset = "0.5", "All"
-    model_filepath = os.path.join(BASE_DIR, "models", "uk", f"dataset_{model_dataset}_quantile_regression_{model_type}_air_pollutant_{air_pollutant}.txt")
-    print(model_filepath)
-    model = lgb.Booster(model_file=model_filepath)
+    version = tuple(os.path.getmtime(path) if os.path.exists(path) else None for path in [DATABASE_FILE, feature_cube.cube_file])
+    try:
+        return statistics_response(('feature_vector', data_type, month, day_of_week, hour, version), compute)
+    except Exception as e:
+        app.logger.warning(f"Error reading {data_type} for Month {month}, Day {day_of_week}, Hour {hour}: {e}")
+        return jsonify({"error": time_slot_error(month, day_of_week, hour)}), 400
 
-    # Rename columns for consistency with the model
-    observation_data = observation_data.rename(columns={"Grid ID": "UK Model Grid ID"})
+@app.route('/statistics/predict', methods=['GET'])
+def predict_statistics():
+    # Same parameters as /predict; statistics and AQI band counts of the scenario's predictions
+    air_pollutant = request.args.get('air_pollutant', default='no2', type=str)
+    month, day_of_week, hour = time_slot_args()
+    changes = changes_arg()
+    column = scenarios.prediction_column(air_pollutant)
 
-    print(model)
-    print(observation_data)
-    print(featureVectorColumnNames)
+    def compute():
+        predictions = predict_scenario(air_pollutant, month, day_of_week, hour, changes)[column]
+        return slot_statistics.compute_statistics(predictions, aqi.aqi_bands(air_pollutant, predictions))
 
-    # Make predictions
-    updated_predictions = ei_models.make_concentration_predicitions_united_kingdom(
-        model, observation_data, featureVectorColumnNames
-    )
+    try:
+        return statistics_response(
+            ('predict',) + scenario_key(air_pollutant, month, day_of_week, hour, changes, scenario_version(air_pollutant)),
+            compute
+        )
+    except database.TimeSlotNotFound as e:
+        app.logger.warning(f"Error reading feature vectors for Month {month}, Day {day_of_week}, Hour {hour}: {e}")
+        return jsonify({"error": time_slot_error(month, day_of_week, hour)}), 400
+
+def region_weights(data):
+    # Weight table for a named region set or for the GeoJSON regions in the request
+    grid_version = os.path.getmtime(GPKG_FILE)
+    if data.get('regionSet'):
+        path = regions.region_set_path(REGIONS_DIR, data['regionSet'])
+        key = ('region_set', data['regionSet'], os.path.getmtime(path), grid_version)
+        source = lambda: regions.read_region_set(path)
+    elif data.get('geometry'):
+        names, geometries = regions.parse_regions(data['geometry'])
+        key = ('regions', regions.regions_key(names, geometries), grid_version)
+        source = lambda: (names, geometries)
+    else:
+        raise ValueError("Give either a regionSet or a GeoJSON geometry.")
+
+    def compute():
+        names, geometries = source()
+        conn = sqlite3.connect(DATABASE_FILE)
+        try:
+            return regions.compute_weights(conn, region_grid_store.get(), names, geometries)
+        finally:
+            conn.close()
 
-    # Rename columns back for merging
-    updated_predictions = updated_predictions.rename(columns={"UK Model Grid ID": "Grid ID"})
-    updated_predictions = updated_predictions.rename(columns={"Model Predicition": air_pollutant + " Prediction 0.5"})
+    return region_weight_cache.get(key, compute)
+
+@app.route('/regions', methods=['GET'])
+def region_sets():
+    return jsonify({"region_sets": regions.list_region_sets(REGIONS_DIR)})
+
+@app.route('/aggregate', methods=['POST'])
+def aggregate_regions():
+    # Area-weighted statistics of a pollutant or feature over polygons, for one hour or a whole day
+    data = request.get_json() or {}
+    kind = data.get('kind', 'air-pollution-concentrations')
+    month = str(data.get('month', '1'))
+    day_of_week = data.get('day', 'Friday')
+    hours = data.get('hours', data.get('hour', 8))
+    threshold = data.get('threshold')
+    quantiles = data.get('quantiles') or regions.DEFAULT_QUANTILES
+
+    if kind == 'air-pollution-concentrations':
+        data_type = data.get('dataType', 'nox')
+        column = scenarios.prediction_column(data_type)
+        database_kind = database.AIR_POLLUTION_CONCENTRATION
+    elif kind == 'feature-vector':
+        data_type = data.get('dataType', 'Bicycle Score')
+        column = data_type
+        database_kind = database.FEATURE_VECTOR
+    else:
+        return jsonify({"error": f"Unknown kind {kind}; use air-pollution-concentrations or feature-vector."}), 400
 
-    # Merge with the grids data
-    merged_data = grids.merge(updated_predictions, left_on='Grid ID', right_on='Grid ID')
+    try:
+        month_number = int(month)
+        weights = region_weights(data)
+        threshold = None if threshold is None else float(threshold)
+        quantiles = [float(q) for q in quantiles]
+        if not all(0 <= q <= 1 for q in quantiles):
+            raise ValueError("Quantiles must be between 0 and 1.")
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    # Every stored hour of the day, or the requested ones
+    if hours == 'all':
+        conn = sqlite3.connect(DATABASE_FILE)
+        try:
+            hours = [
+                hour for slot_month, slot_day, hour in database.list_time_slots(conn, database_kind)
+                if slot_month == month_number and slot_day == day_of_week
+            ]
+        finally:
+            conn.close()
+    elif not isinstance(hours, list):
+        hours = [hours]
+    hours = [int(str(hour).split(':')[0]) for hour in hours]
+
+    # Read only the cells the regions cover, one row per hour
+    grid_ids = region_grid_store.grid_ids()
+    covered_ids = grid_ids[weights.covered_positions()]
+    values = np.full((len(hours), len(covered_ids)), np.nan)
+    try:
+        for row, hour in enumerate(hours):
+            if database_kind == database.AIR_POLLUTION_CONCENTRATION:
+                slot = read_air_pollution_concentrations(data_type, month, day_of_week, hour, covered_ids.tolist())
+            else:
+                slot = read_feature_vectors(month, day_of_week, hour, [column], covered_ids.tolist())
+            values[row] = value_encoding.align_values(covered_ids, slot['Grid ID'], slot[column], dtype=np.float64)
+    except Exception as e:
+        app.logger.warning(f"Error reading {data_type} for Month {month}, Day {day_of_week}: {e}")
+        return jsonify({"error": f"Could not find data for Month {month}, Day {day_of_week}, Hours {hours} in the database."}), 400
+
+    return jsonify({
+        "kind": kind,
+        "dataType": data_type,
+        "month": month,
+        "day": day_of_week,
+        "hours": hours,
+        "threshold": threshold,
+        "regions": regions.aggregate(weights, values, quantiles, threshold),
+    })
+
+def parse_range(value, parse=int):
+    # "0-23" -> [0, ..., 23]; "1,5,9" -> [1, 5, 9]; None -> None (no restriction)
+    if value is None or value == '':
+        return None
+    parsed = []
+    for part in value.split(','):
+        if '-' in part and parse is int:
+            start, end = part.split('-', 1)
+            parsed.extend(range(int(start), int(end) + 1))
+        else:
+            parsed.append(parse(part.strip()))
+    return parsed
+
+def time_series_axes(kind):
+    # Sorted months, days and hours of the stored time slots within the months, days and hours query parameters
+    months = parse_range(request.args.get('months', default=request.args.get('month', default='1', type=str), type=str))
+    days = parse_range(request.args.get('days', default=request.args.get('day', default='Friday', type=str), type=str), str)
+    hours = parse_range(request.args.get('hours', default=None, type=str))
+    conn = sqlite3.connect(DATABASE_FILE)
+    try:
+        slots = database.list_time_slots(conn, kind)
+    finally:
+        conn.close()
+    matched = [
+        (month, day, hour) for month, day, hour in slots
+        if month in months and day in days and (hours is None or hour in hours)
+    ]
+    return [sorted({slot[axis] for slot in matched}) for axis in range(3)]
+
+def time_series_grid_ids():
+    # Grid IDs from "gridIds" or "bbox", or None for every cell
+    grid_ids_arg = request.args.get('gridIds', default='', type=str)
+    if grid_ids_arg:
+        grid_ids = grid_store.grid_ids()
+        parse = int if pd.api.types.is_integer_dtype(grid_ids.dtype) else str
+        return [parse(grid_id) for grid_id in grid_ids_arg.split(',')]
+    return viewport_grid_ids()
+
+def read_sql_time_series(kind, column, months, days, hours, grid_ids):
+    # Every slot from one query on one connection, closed when the stream ends or the client disconnects
+    conn = sqlite3.connect(DATABASE_FILE)
+    try:
+        yield from timings.timed_iter('sql_read', database.read_time_series(conn, kind, column, months, days, hours, grid_ids))
+    finally:
+        conn.close()
 
-    # Simplify geometries for performance
-    merged_data['geometry'] = merged_data['geometry'].simplify(0.001, preserve_topology=True)
+def time_series_response(kind, column, read_slots):
+    """Stream one column across a range of time slots as grid-aligned rows.
+
+    The slots are every combination of the stored months, days and hours the
+    query asks for, month first and hour last, with NaN (null) rows for any
+    that are not stored. ``format=raw`` sends one float32 row per slot, with
+    the months, days and hours in headers; ``format=json`` sends the slots,
+    the Grid IDs, optionally the geometry of those cells
+    (``includeGeometry=true``, once) and one array per slot.
+    """
+    fmt = request.args.get('format', default='raw', type=str)
+    include_geometry = request.args.get('includeGeometry', default='false', type=str).lower() == 'true'
+    zoom = zoom_arg()
+    if fmt not in ('raw', 'json'):
+        return jsonify({"error": f"Unknown time series format {fmt}; use raw or json."}), 400
+    try:
+        grid_ids = time_series_grid_ids()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    months, days, hours = time_series_axes(kind)
+    if not months:
+        return jsonify({"error": "No stored time slots match the requested months, days and hours."}), 400
+    slots = list(itertools.product(months, days, hours))
+    order = grid_store.grid_ids() if grid_ids is None else pd.Index(grid_ids)
+
+    def read_rows():
+        # Slots arrive in order from read_slots, and each is sent as soon as it is aligned
+        for _, data in read_slots(months, days, hours, grid_ids):
+            yield value_encoding.align_values(order, data['Grid ID'], data[column])
+
+    # Read the first slot before streaming, so a bad column is still a 400
+    rows = read_rows()
+    try:
+        rows = itertools.chain([next(rows)], rows)
+    except Exception as e:
+        app.logger.warning(f"Error reading {column} for {slots[0]}: {e}")
+        return jsonify({"error": f"Could not read {column} for the requested time slots."}), 400
+
+    if fmt == 'raw':
+        response = app.response_class((value_encoding.encode_row(row) for row in rows), mimetype=value_encoding.RAW_MIMETYPE)
+        response.headers.update({
+            'X-Slot-Count': str(len(slots)),
+            'X-Grid-Count': str(len(order)),
+            'X-Values-Dtype': 'float32-le',
+            'X-Time-Slot-Months': ','.join(map(str, months)),
+            'X-Time-Slot-Days': ','.join(days),
+            'X-Time-Slot-Hours': ','.join(map(str, hours)),
+        })
+        return response
+
+    def stream_json():
+        yield '{"time_slots": ' + json.dumps(slots) + ', "grid_ids": ' + json.dumps(order.tolist())
+        if include_geometry:
+            grids = grid_store.level(zoom)
+            yield ', "geometry": ' + grids.loc[grids.index.intersection(order), ['Grid ID', 'geometry']].to_json()
+        yield ', "values": ['
+        for i, row in enumerate(rows):
+            yield (',\n' if i else '\n') + value_encoding.json_row(row)
+        yield '\n]}'
+
+    return app.response_class(stream_json(), mimetype='application/json')
+
+@app.route('/time-series/air-pollution-concentrations', methods=['GET'])
+def air_pollution_time_series():
+    # One pollutant across a month, day and hour range, for the requested cells or every cell
+    data_type = request.args.get('dataType', default='nox', type=str)
+    column = scenarios.prediction_column(data_type)
 
-    ei_air_pollution_functions.air_pollution_concentrations_to_UK_daily_air_quality_index(
-        merged_data, air_pollutant, air_pollutant + " Prediction 0.5"
-    )
+    def read_slots(months, days, hours, grid_ids):
+        return read_sql_time_series(database.AIR_POLLUTION_CONCENTRATION, column, months, days, hours, grid_ids)
 
-    print(merged_data[air_pollutant + " Prediction 0.5"].describe())
+    return time_series_response(database.AIR_POLLUTION_CONCENTRATION, column, read_slots)
 
-    # Convert to GeoJSON
-    updated_geojson = merged_data.to_json()
+@app.route('/time-series/feature-vector', methods=['GET'])
+def feature_vector_time_series():
+    # One feature across a month, day and hour range, for the requested cells or every cell
+    data_type = request.args.get('dataType', default='Bicycle Score', type=str)
 
-    return jsonify({"updated_geojson": updated_geojson})
+    def read_slots(months, days, hours, grid_ids):
+        if not (feature_cube.available() and feature_cube.has_columns([data_type])):
+            return read_sql_time_series(database.FEATURE_VECTOR, data_type, months, days, hours, grid_ids)
+        return cube_time_series(months, days, hours, grid_ids)
+
+    def cube_time_series(months, days, hours, grid_ids):
+        # Memory-mapped slices of the feature cube, which need no query per slot
+        for slot in itertools.product(months, days, hours):
+            try:
+                with timings.stage('cube_read'):
+                    data = feature_cube.frame(*slot, [data_type], grid_ids)
+            except database.TimeSlotNotFound:
+                data = pd.DataFrame({'Grid ID': [], data_type: []})
+            yield slot, data
+
+    return time_series_response(database.FEATURE_VECTOR, data_type, read_slots)
+
+@app.route('/tiles/<layer>/<int:z>/<int:x>/<int:y>.mvt', methods=['GET'])
+def vector_tile(layer, z, x, y):
+    # Mapbox Vector Tile of the grid with one time slot's pollutant or feature value attached
+    if layer not in TILE_LAYERS or not tiles.valid_tile(z, x, y):
+        return jsonify({"error": f"Unknown tile {layer}/{z}/{x}/{y}."}), 404
+    data_type = request.args.get('dataType', default=TILE_LAYERS[layer], type=str)
+    month, day_of_week, hour = time_slot_args()
+
+    # Tiles are cached per layer, value, time slot and database version
+    cache_key = '|'.join(str(part) for part in (layer, data_type, month, day_of_week, hour, os.path.getmtime(DATABASE_FILE)))
+    tile = tile_cache.get(cache_key, z, x, y)
+    if tile is not None:
+        return app.response_class(tile, mimetype=tiles.MVT_MIMETYPE)
 
-@app.route('/generate-report', methods=['POST'])
-def generate_report():
     try:
-        # Extract the data from the request
-        data = request.get_json()
-
-        selected_air_pollution = data.get('selectedAirPollution')
-        selected_feature_vector = data.get('selectedFeatureVector')
-        selected_month = data.get('selectedMonth')
-        selected_day = data.get('selectedDay')
-        selected_hour = data.get('selectedHour')
-        changes = data.get('changes')
-        slider_value = data.get('sliderValue')
-
-        # Log the received data
-        app.logger.info(f"Selected Air Pollution: {selected_air_pollution}")
-        app.logger.info(f"Selected Feature Vector: {selected_feature_vector}")
-        app.logger.info(f"Selected Month: {selected_month}")
-        app.logger.info(f"Selected Day: {selected_day}")
-        app.logger.info(f"Selected Hour: {selected_hour}")
-        app.logger.info(f"Changes: {changes}")
-        app.logger.info(f"Slider Value: {slider_value}")
-
-        # Create a data dictionary for processing
-        report_data = {
-            'selectedAirPollution': selected_air_pollution,
-            'selectedFeatureVector': selected_feature_vector,
-            'selectedMonth': selected_month,
-            'selectedDay': selected_day,
-            'selectedHour': selected_hour,
-            'changes': changes,
-            'sliderValue': slider_value
-        }
+        if layer == 'air-pollution-concentrations':
+            values = read_air_pollution_concentrations(data_type, month, day_of_week, hour)
+        else:
+            values = read_feature_vectors(month, day_of_week, hour, [data_type])
+    except Exception as e:
+        app.logger.warning(f"Error reading {data_type} for Month {month}, Day {day_of_week}, Hour {hour}: {e}")
+        return jsonify({"error": time_slot_error(month, day_of_week, hour)}), 400
 
-        # Process the data and generate the report
-        report = generate_pdf.process_data(report_data)
+    try:
+        tile = tiles.render_tile(tile_grid_store.get(), values.set_index("Grid ID"), z, x, y, layer)
+    except RuntimeError as e:
+        return jsonify({"error": str(e)}), 501
+
+    tile_cache.put(cache_key, z, x, y, tile)
+    return app.response_class(tile, mimetype=tiles.MVT_MIMETYPE)
+
+def batch_scenario(scenario):
+    # (month, day, hour, changes) of one /predict-batch scenario; ValueError describes what is wrong with it
+    if not isinstance(scenario, dict):
+        raise ValueError("each scenario must be an object with month, day, hour and changes.")
+    changes = scenario.get('changes') or {}
+    if not isinstance(changes, dict):
+        raise ValueError("changes must be an object mapping features to percentage changes.")
+    try:
+        month = str(int(scenario.get('month', 1)))
+        hour = int(str(scenario.get('hour', '8')).split(':')[0])
+        changes = {str(feature): float(change) for feature, change in changes.items()}
+    except (TypeError, ValueError):
+        raise ValueError("month, hour and every change must be numbers.")
+    if not all(np.isfinite(change) for change in changes.values()):
+        raise ValueError("every change must be a finite number.")
+    day_of_week = scenario.get('day', 'Friday')
+    if not isinstance(day_of_week, str):
+        raise ValueError("day must be a day name.")
+    return month, day_of_week, hour, changes
+
+@app.route('/predict-batch', methods=['POST'])
+def predict_batch():
+    # Evaluate many (time slot, changes) scenarios with one model pass per pollutant
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({"error": "Send a JSON object with a scenarios list."}), 400
+    air_pollutants = data.get('airPollutants') or ['no2']
+    scenario_list = data.get('scenarios') or []
+    include_values = bool(data.get('includeValues', False))
+
+    if not isinstance(air_pollutants, list) or not all(isinstance(pollutant, str) for pollutant in air_pollutants):
+        return jsonify({"error": "airPollutants must be a list of pollutant names."}), 400
+    if not isinstance(scenario_list, list):
+        return jsonify({"error": "scenarios must be a list."}), 400
+    if not scenario_list:
+        return jsonify({"error": "No scenarios given."}), 400
+    if len(scenario_list) > MAX_BATCH_SCENARIOS:
+        return jsonify({"error": f"At most {MAX_BATCH_SCENARIOS} scenarios can be evaluated per request."}), 400
+
+    parsed_scenarios = []
+    for i, scenario in enumerate(scenario_list):
+        try:
+            parsed_scenarios.append(batch_scenario(scenario))
+        except ValueError as e:
+            return jsonify({"error": f"Scenario {i}: {e}"}), 400
+    for air_pollutant in air_pollutants:
+        if not os.path.exists(model_registry.model_path(air_pollutant)):
+            return jsonify({"error": f"No model for air pollutant {air_pollutant}."}), 400
+
+    app.logger.info(f"Batch Scenarios Requested: {len(scenario_list)} for {air_pollutants}")
+
+    # Read each distinct time slot once
+    time_slots = {}
+    scenario_changes = []
+    results = []
+    for month, day_of_week, hour, changes in parsed_scenarios:
+        if (month, day_of_week, hour) not in time_slots:
+            try:
+                time_slots[(month, day_of_week, hour)] = read_feature_vectors(month, day_of_week, hour)
+            except Exception as e:
+                app.logger.warning(f"Error reading feature vectors for Month {month}, Day {day_of_week}, Hour {hour}: {e}")
+                return jsonify({"error": time_slot_error(month, day_of_week, hour)}), 400
+
+        scenario_changes.append(((month, day_of_week, hour), changes))
+        results.append({"month": month, "day": day_of_week, "hour": hour, "changes": changes})
+
+    # Score all scenarios together, one stacked call per pollutant
+    grid_ids = grid_store.grid_ids()
+    for air_pollutant in air_pollutants:
+        model = model_registry.get(air_pollutant)
+        baselines = {
+            time_slot: read_baseline_predictions(model, air_pollutant, *time_slot, observation_data)
+            for time_slot, observation_data in time_slots.items()
+        }
+        with timings.stage('predict'):
+            predictions = scenarios.predict_scenarios(
+                model,
+                [(time_slots[time_slot], changes, baselines[time_slot]) for time_slot, changes in scenario_changes],
+                featureVectorColumnNames
+            )
+        for result, (time_slot, _), values in zip(results, scenario_changes, predictions):
+            frame = time_slots[time_slot]
+            result[air_pollutant] = {"summary": slot_statistics.summarise(values)}
+            if include_values:
+                # Align to the fixed grid order; cells without data are null
+                aligned = value_encoding.align_values(grid_ids, frame["Grid ID"], values, dtype=np.float64).round(4)
+                result[air_pollutant]["values"] = [None if np.isnan(value) else value for value in aligned.tolist()]
+
+    response = {"results": results}
+    if include_values:
+        response["grid_ids"] = grid_ids.tolist()
+    return jsonify(response)
+
+def report_request_data():
+    # Report parameters from the JSON body, as generate_pdf expects them
+    data = request.get_json()
+    report_data = {
+        'selectedAirPollution': data.get('selectedAirPollution'),
+        'selectedFeatureVector': data.get('selectedFeatureVector'),
+        'selectedMonth': data.get('selectedMonth'),
+        'selectedDay': data.get('selectedDay'),
+        'selectedHour': data.get('selectedHour'),
+        'changes': data.get('changes'),
+        'sliderValue': data.get('sliderValue')
+    }
+
+    # Log the received data
+    for name, value in report_data.items():
+        app.logger.info(f"{name}: {value}")
+    return report_data
+
+def report_version():
+    # Reports are keyed on the data and geometry they are rendered from
+    return tuple(os.path.getmtime(path) if os.path.exists(path) else None for path in [DATABASE_FILE, GPKG_FILE])
+
+def report_job_response(job_id, status):
+    return {
+        "job_id": job_id,
+        **status,
+        "status_url": f"/reports/{job_id}",
+        "download_url": f"/reports/{job_id}/pdf",
+    }
+
+@app.route('/reports', methods=['POST'])
+def submit_report():
+    # Queue a report and return its job ID straight away; identical requests share one job
+    try:
+        job_id = report_queue.submit(report_request_data(), report_version())
+    except Exception as e:
+        app.logger.error(f"Error submitting report: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+    return jsonify(report_job_response(job_id, report_queue.status(job_id))), 202
+
+@app.route('/reports/<job_id>', methods=['GET'])
+def report_status(job_id):
+    status = report_queue.status(job_id)
+    if status is None:
+        return jsonify({"error": f"Unknown or expired report job {job_id}."}), 404
+    return jsonify(report_job_response(job_id, status))
+
+@app.route('/reports/<job_id>/pdf', methods=['GET'])
+def report_pdf(job_id):
+    status = report_queue.status(job_id)
+    if status is None:
+        return jsonify({"error": f"Unknown or expired report job {job_id}."}), 404
+    if status["status"] == report_jobs.FAILED:
+        return jsonify({"error": status["error"]}), 500
+    if status["status"] != report_jobs.DONE:
+        return jsonify(report_job_response(job_id, status)), 409
+    return send_file(report_queue.pdf_path(job_id), as_attachment=True, download_name=report_jobs.REPORT_FILENAME)
 
-        # Generate the PDF report
-        pdf_filename = os.path.join(BASE_DIR, "pdf_report.pdf")
-        generate_pdf.generate_pdf_report(report, pdf_filename)
+@app.route('/generate-report', methods=['POST'])
+def generate_report():
+    # Synchronous form kept for existing clients: submit a job and wait for its PDF
+    try:
+        job_id = report_queue.submit(report_request_data(), report_version())
+        pdf_filename = report_queue.wait(job_id, REPORT_TIMEOUT)
 
         # Check if the PDF file is generated correctly
         if not os.path.exists(pdf_filename):
             raise FileNotFoundError(f"PDF file {pdf_filename} not found.")
 
         # Return the PDF file
-        return send_file(pdf_filename, as_attachment=True)
+        return send_file(pdf_filename, as_attachment=True, download_name=report_jobs.REPORT_FILENAME)
     except Exception as e:
         app.logger.error(f"Error generating report: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
+@app.route('/cache-stats', methods=['GET'])
+def cache_stats():
+    return jsonify({
+        "predictions": prediction_cache.stats(), "models": model_registry.stats(), "reports": report_queue.stats(),
+        "coalesced": in_flight.stats(),
+    })
+
 @app.route('/num-tables', methods=['GET'])
 def num_tables():
     # Create a connection to the database
@@ -429,10 +1042,20 @@ def num_tables():
     num_tables = len(tables)
     table_names = [table[0] for table in tables]
 
+    # Number of time slots per kind, read from the time slot index
+    time_slots = database.count_time_slots(conn)
+
     # Close the connection
     conn.close()
 
-    return jsonify({"num_tables": num_tables, "table_names": table_names})
+    return jsonify({"num_tables": num_tables, "table_names": table_names, "time_slots": time_slots})
+
+# Spawned report workers import this module as __mp_main__ when it is run as a script; they need no warm-up
+if WARM_UP == 'background' and __name__ != '__mp_main__':
+    threading.Thread(target=run_warm_up, name='warm-up', daemon=True).start()
 
 if __name__ == '__main__':
+    # Load the grid geometry, models and feature cube before serving the first request
+    if WARM_UP == 'preload':
+        run_warm_up()
     app.run(port=3000)
@@ -0,0 +1,103 @@
+import logging
+import threading
+
+import numpy as np
+import pandas as pd
+
+# UK Daily Air Quality Index breakpoints, as used by environmental_insights: band b covers [edges[b-1], edges[b])
+AQI_BREAKPOINTS = {
+    "o3":    np.array([0, 33.5, 66.5, 100.5, 120.5, 140.5, 160.5, 187.5, 213.5, 240.5, np.inf]),
+    "no2":   np.array([0, 67.5, 134.5, 200.5, 267.5, 334.5, 400.5, 467.5, 534.5, 600.5, np.inf]),
+    "so2":   np.array([0, 88.5, 177.5, 266.5, 354.5, 443.5, 532.5, 710.5, 887.5, 1064.5, np.inf]),
+    "pm2p5": np.array([0, 11.5, 23.5, 35.5, 41.5, 47.5, 53.5, 58.5, 64.5, 70.5, np.inf]),
+    "pm10":  np.array([0, 16.5, 33.5, 50.5, 58.5, 66.5, 75.5, 83.5, 91.5, 100.5, np.inf]),
+}
+NUM_BANDS = 10
+
+# Band names by AQI, index 0 being "no band"
+BAND_NAMES = np.array([None] + ["Low"] * 3 + ["Moderate"] * 3 + ["High"] * 3 + ["Very High"], dtype=object)
+
+logger = logging.getLogger(__name__)
+
+_verified = {}
+_verified_lock = threading.Lock()
+
+
+def aqi_column(pollutant):
+    return f"{pollutant} AQI"
+
+
+def band_name_column(pollutant):
+    return f"{pollutant} Air Quality Index AQI Band"
+
+
+def _searchsorted_bands(pollutant, concentrations):
+    bands = np.searchsorted(AQI_BREAKPOINTS[pollutant], concentrations, side='right')
+    # Below zero, infinite and NaN concentrations have no band
+    bands[(bands < 1) | (bands > NUM_BANDS)] = 0
+    return bands.astype(np.uint8)
+
+
+def _library_bands(pollutant, concentrations):
+    from environmental_insights import air_pollution_functions as ei_air_pollution_functions
+
+    frame = pd.DataFrame({"concentration": concentrations})
+    ei_air_pollution_functions.air_pollution_concentrations_to_UK_daily_air_quality_index(frame, pollutant, "concentration")
+    return frame[aqi_column(pollutant)].astype(float).fillna(0).to_numpy(dtype=np.uint8)
+
+
+def vectorised_banding_matches(pollutant):
+    """Whether the searchsorted banding agrees with the library function for ``pollutant``.
+
+    Checked once per process on values either side of every breakpoint. A
+    pollutant without breakpoints here, or any disagreement, sends banding
+    back to the library. Without the library there is nothing to check
+    against, so the copied breakpoints are trusted.
+    """
+    with _verified_lock:
+        if pollutant in _verified:
+            return _verified[pollutant]
+
+    if pollutant not in AQI_BREAKPOINTS:
+        matches = False
+    else:
+        edges = AQI_BREAKPOINTS[pollutant][:-1]
+        probes = np.concatenate([
+            edges, edges - 1e-6, edges + 1e-6, edges - 0.5, edges + 0.5,
+            [-1.0, np.nan, np.inf, edges[-1] * 10],
+        ])
+        try:
+            matches = bool(np.array_equal(_searchsorted_bands(pollutant, probes), _library_bands(pollutant, probes)))
+        except ImportError:
+            matches = True
+        if not matches:
+            logger.warning(f"Vectorised AQI banding disagrees with environmental_insights for {pollutant}; using the library.")
+
+    with _verified_lock:
+        _verified[pollutant] = matches
+    return matches
+
+
+def aqi_bands(pollutant, concentrations):
+    # uint8 AQI band (1-10) per concentration, 0 where there is no band
+    concentrations = np.asarray(concentrations, dtype=float)
+    if not vectorised_banding_matches(pollutant):
+        return _library_bands(pollutant, concentrations)
+    return _searchsorted_bands(pollutant, concentrations)
+
+
+def add_aqi_columns(frame, pollutant, column):
+    """Add the "<pollutant> AQI" and band name columns the library function adds, in place.
+
+    An AQI column already in ``frame`` (read from the database, where the
+    builder stores it) is kept unless it has gaps, so the stored baseline
+    bands cost nothing per request.
+    """
+    stored = frame.get(aqi_column(pollutant))
+    if stored is None or stored.isna().any():
+        bands = aqi_bands(pollutant, frame[column])
+    else:
+        bands = stored.to_numpy(dtype=np.uint8)
+    frame[aqi_column(pollutant)] = bands
+    frame[band_name_column(pollutant)] = BAND_NAMES[bands]
+    return frame
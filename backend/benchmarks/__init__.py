@@ -0,0 +1 @@
+# Synthetic data generation and endpoint timings; see benchmarks/run.py
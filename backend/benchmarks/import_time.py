@@ -0,0 +1,70 @@
+"""Check how long importing the app takes, and that the heavy stacks stay out of it.
+
+Run from the backend directory::
+
+    python -m benchmarks.import_time --budget 2.0
+
+Imports app in a fresh interpreter with warm-up off, and exits non-zero if
+the import is over budget or pulls in a module that should load lazily.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Seconds importing app may take on a warm disk cache
+DEFAULT_BUDGET = 2.0
+
+# Imported on first use only: the report stack and the model stack
+LAZY_MODULES = ('generate_pdf', 'matplotlib', 'reportlab', 'lightgbm', 'environmental_insights', 'geopandas')
+
+MEASURE = """
+import json, sys, time
+start = time.perf_counter()
+import app
+seconds = time.perf_counter() - start
+print(json.dumps({"seconds": seconds, "modules": sorted(sys.modules)}))
+"""
+
+
+def measure_import(runs=3):
+    # Fastest of a few fresh interpreters, so one cold disk read does not fail the check
+    results = []
+    env = dict(os.environ, EII_WARM_UP='off', EII_PRELOAD_MODELS='0')
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, '-c', MEASURE], cwd=BACKEND_DIR, env=env, capture_output=True, text=True, check=True
+        ).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+    return min(results, key=lambda result: result["seconds"])
+
+
+def check(budget=DEFAULT_BUDGET, runs=3):
+    result = measure_import(runs)
+    loaded = [module for module in LAZY_MODULES if module in result["modules"]]
+    return {
+        "seconds": result["seconds"],
+        "budget": budget,
+        "eagerly_imported": loaded,
+        "passed": result["seconds"] <= budget and not loaded,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--budget', type=float, default=float(os.environ.get('EII_IMPORT_BUDGET', DEFAULT_BUDGET)))
+    parser.add_argument('--runs', type=int, default=3)
+    args = parser.parse_args(argv)
+
+    result = check(args.budget, args.runs)
+    print(f"import app: {result['seconds']:.2f}s (budget {result['budget']:.2f}s)")
+    if result["eagerly_imported"]:
+        print(f"Imported eagerly: {', '.join(result['eagerly_imported'])}")
+    return 0 if result["passed"] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,550 @@
+"""Benchmark the backend on a synthetic database.
+
+Run from the backend directory, one grid size per process (the app reads
+its paths when imported)::
+
+    python -m benchmarks.run --size london
+    python -m benchmarks.run --size uk --hours 8 --repeat 3 --check-incremental
+
+Results are written as JSON to benchmarks/results/<size>-<timestamp>.json.
+"""
+import argparse
+import importlib
+import json
+import math
+import os
+import platform
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from importlib import metadata
+
+import geopandas as gpd
+import numpy as np
+
+import database
+from benchmarks import import_time, synthetic
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+DEFAULT_REPEAT = 5
+REPORT_TIMEOUT = 600
+
+# Packages whose versions are recorded with every result
+RECORDED_PACKAGES = ('numpy', 'pandas', 'geopandas', 'shapely', 'pyogrio', 'lightgbm', 'flask', 'environmental-insights')
+
+# Tables compared between an incremental and a full build of the same sources
+COMPARED_TABLES = (
+    database.FEATURE_VECTOR_TABLE, database.AIR_POLLUTION_TABLE, database.SLOT_STATISTICS_TABLE,
+    database.GRID_GEOMETRIES_TABLE, database.GEOMETRY_LEVELS_TABLE,
+)
+
+
+def timed(function, *args, **kwargs):
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def environment():
+    versions = {}
+    for package in RECORDED_PACKAGES:
+        try:
+            versions[package] = metadata.version(package)
+        except metadata.PackageNotFoundError:
+            versions[package] = None
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "commit": commit,
+        "packages": versions,
+    }
+
+
+def table_rows(conn, table):
+    # Every row of a table in a fixed order
+    if not database.table_exists(conn, table):
+        return None
+    columns = [row[1] for row in conn.execute(f'PRAGMA table_info({database.quote_identifier(table)});')]
+    order = ', '.join(database.quote_identifier(column) for column in columns)
+    return conn.execute(f'SELECT * FROM {database.quote_identifier(table)} ORDER BY {order};').fetchall()
+
+
+def check_incremental(work_paths, slot, seed, workers):
+    """Change one time slot's CSVs and compare an incremental build against a full one.
+
+    Runs on a copy of the sources and database, so the benchmark database is
+    left as it was. Returns the two build times and any tables that differ.
+    """
+    import build_database
+    from feature_cube import feature_cube_paths
+
+    with tempfile.TemporaryDirectory(prefix='eii-incremental-') as copy_dir:
+        copy_paths = synthetic.paths(copy_dir)
+        for name in ('feature_vector_dir', 'air_pollution_dir', 'models_dir'):
+            shutil.copytree(work_paths[name], copy_paths[name])
+        shutil.copy2(work_paths['gpkg'], copy_paths['gpkg'])
+        shutil.copy2(work_paths['database'], copy_paths['database'])
+        synthetic.rewrite_time_slot(copy_paths, *slot, seed)
+
+        sources = (copy_paths['gpkg'], copy_paths['feature_vector_dir'], copy_paths['air_pollution_dir'])
+        full_database = os.path.join(copy_dir, 'full.db')
+        _, incremental_seconds = timed(build_database.create_spatial_database, *sources, copy_paths['database'], workers)
+        _, full_seconds = timed(build_database.create_spatial_database, *sources, full_database, workers, full_rebuild=True)
+
+        mismatched = []
+        incremental_conn, full_conn = sqlite3.connect(copy_paths['database']), sqlite3.connect(full_database)
+        try:
+            for table in COMPARED_TABLES:
+                if table_rows(incremental_conn, table) != table_rows(full_conn, table):
+                    mismatched.append(table)
+        finally:
+            incremental_conn.close()
+            full_conn.close()
+        incremental_cube, _ = feature_cube_paths(copy_paths['database'])
+        full_cube, _ = feature_cube_paths(full_database)
+        if not np.array_equal(np.load(incremental_cube), np.load(full_cube)):
+            mismatched.append('feature cube')
+
+    return {
+        "changed_time_slot": list(slot),
+        "incremental_seconds": incremental_seconds,
+        "full_seconds": full_seconds,
+        "equivalent": not mismatched,
+        "mismatched": mismatched,
+    }
+
+
+# Change sets checked against a full recompute: none, traffic features that are zero in most cells, and a
+# feature that is non-zero everywhere
+SCENARIO_CHECKS = (
+    {},
+    {'Bicycle Score': 10},
+    {'Bicycle Score': 10, 'Car and Taxi Score': -5},
+    {synthetic.TRAFFIC_COLUMNS[-1]: 50},
+    {'Month Number': 20},
+)
+
+
+# Share of unaffected cells in synthetic.DRIFT_SLOT whose reused baseline may differ from a full recompute by more
+# than the baseline tolerance: a feature rounded to float32 next to a split threshold takes the other branch
+DRIFT_CELL_FRACTION = 1e-3
+
+
+def check_scenarios(app_module, slot, drift=False):
+    """Check that rescoring only the affected cells gives the same predictions as rescoring every cell.
+
+    For every pollutant and change set, the app's predict_scenario (stored
+    baseline for unaffected cells, the model for the rest) is compared with
+    predict_frames over the whole changed time slot. Affected cells must
+    match exactly. Reused baselines went through the CSV sources, which
+    read_csv parses to within a unit in the last place, so they must match
+    to 1e-12 relative. With ``drift``, for a slot whose features are not
+    float32-exact, they must match to the tolerance the app checks
+    baselines with, in all but DRIFT_CELL_FRACTION of the cells. A check
+    that found no baseline to reuse fails.
+    """
+    import scenarios
+    from feature_vector_columns import featureVectorColumnNames
+
+    if drift:
+        rtol, atol, drift_fraction = scenarios.BASELINE_RTOL, scenarios.BASELINE_ATOL, DRIFT_CELL_FRACTION
+    else:
+        rtol, atol, drift_fraction = 1e-12, 0, 0
+    month, day, hour = slot
+    observation_data = app_module.read_feature_vectors(month, day, hour)
+    checks = []
+    for pollutant in synthetic.POLLUTANTS:
+        model = app_module.model_registry.get(pollutant)
+        baseline = app_module.read_baseline_predictions(model, pollutant, month, day, hour, observation_data)
+        for changes in SCENARIO_CHECKS:
+            affected = scenarios.affected_rows(observation_data, changes)
+            incremental = app_module.predict_scenario(pollutant, month, day, hour, changes)
+            incremental = incremental[scenarios.prediction_column(pollutant)].to_numpy()
+            full = scenarios.predict_frames(
+                model, [scenarios.apply_changes(observation_data, changes)], featureVectorColumnNames
+            )[0]
+            drifted_cells = int(np.sum(~np.isclose(incremental, full, rtol=rtol, atol=atol)))
+            checks.append({
+                "pollutant": pollutant,
+                "changes": changes,
+                "affected_cells": int(affected.sum()),
+                "baseline_reused": baseline is not None,
+                "drifted_cells": drifted_cells,
+                "max_difference": float(np.max(np.abs(incremental - full))) if len(full) else 0.0,
+                "equivalent": (
+                    baseline is not None
+                    and np.array_equal(incremental[affected], full[affected])
+                    and drifted_cells <= drift_fraction * len(full)
+                ),
+            })
+    return {
+        "time_slot": list(slot), "rtol": rtol, "atol": atol, "drift_fraction": drift_fraction,
+        "checks": checks, "equivalent": all(check["equivalent"] for check in checks),
+    }
+
+
+def check_geometry_levels(app_module):
+    """Check every stored geometry level against the unsimplified grid.
+
+    A level must hold a geometry for every cell, in the grid's Grid ID order,
+    and each geometry may be no further from its full-resolution cell than
+    the tolerance it was simplified with (in degrees, as the builder
+    simplifies in EPSG:4326).
+    """
+    import shapely
+    from grid_store import get_grid_store
+
+    full = get_grid_store(app_module.GPKG_FILE, tolerance=None).get()
+    checks = []
+    for level, (min_zoom, tolerance) in sorted(app_module.grid_store.levels().items()):
+        grids = app_module.grid_store.level(min_zoom)
+        geometry = np.asarray(grids.geometry)
+        present = ~(shapely.is_missing(geometry) | shapely.is_empty(geometry))
+        aligned = grids.index.equals(full.index) and np.array_equal(grids['Grid ID'].to_numpy(), full.index.to_numpy())
+        distance = None
+        if aligned and present.any():
+            distance = float(np.max(shapely.hausdorff_distance(geometry[present], np.asarray(full.geometry)[present])))
+        checks.append({
+            "level": level, "min_zoom": min_zoom, "tolerance": tolerance, "cells": len(grids),
+            "missing_geometries": int((~present).sum()), "aligned": aligned, "max_distance": distance,
+            "valid": aligned and bool(present.all()) and distance <= tolerance + 1e-9,
+        })
+    return {"checks": checks, "valid": bool(checks) and all(check["valid"] for check in checks)}
+
+
+def tile_for(lon, lat, z):
+    # XYZ tile holding a point
+    x = int((lon + 180) / 360 * 2 ** z)
+    y = int((1 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2 * 2 ** z)
+    return x, y
+
+
+def endpoint_requests(bounds, slot, hours):
+    """(name, URL rule, method, path, query, JSON body) for every endpoint, around the middle of the grid.
+
+    ``/reports/<job_id>`` and its PDF are added once a report job exists.
+    """
+    min_x, min_y, max_x, max_y = bounds
+    centre = ((min_x + max_x) / 2, (min_y + max_y) / 2)
+    quarter = (
+        min_x + (max_x - min_x) / 4, min_y + (max_y - min_y) / 4,
+        max_x - (max_x - min_x) / 4, max_y - (max_y - min_y) / 4,
+    )
+    polygon = {
+        "type": "Polygon",
+        "coordinates": [[
+            [quarter[0], quarter[1]], [quarter[2], quarter[1]], [quarter[2], quarter[3]],
+            [quarter[0], quarter[3]], [quarter[0], quarter[1]],
+        ]],
+    }
+    month, day, hour = slot
+    time_slot = {'month': month, 'day': day, 'hour': hour}
+    changes = 'Bicycle Score:10,Car and Taxi Score:-5'
+    hour_range = f"{min(hours)}-{max(hours)}"
+    tile_x, tile_y = tile_for(*centre, 10)
+    report = {
+        'selectedAirPollution': 'no2', 'selectedFeatureVector': 'Bicycle Score',
+        'selectedMonth': str(month), 'selectedDay': day, 'selectedHour': f"{hour}:00",
+        'changes': {'Bicycle Score': 10, 'Car and Taxi Score': -5}, 'sliderValue': 10,
+    }
+
+    return [
+        ('index', '/', 'GET', '/', {}, None),
+        ('status', '/status', 'GET', '/status', {}, None),
+        ('air pollution geojson', '/air-pollution-concentrations', 'GET', '/air-pollution-concentrations',
+         {'dataType': 'no2', **time_slot}, None),
+        ('air pollution geojson, zoom 8', '/air-pollution-concentrations', 'GET', '/air-pollution-concentrations',
+         {'dataType': 'no2', 'zoom': 8, **time_slot}, None),
+        ('air pollution geojson, zoom 14', '/air-pollution-concentrations', 'GET', '/air-pollution-concentrations',
+         {'dataType': 'no2', 'zoom': 14, **time_slot}, None),
+        ('air pollution geojson, bbox', '/air-pollution-concentrations', 'GET', '/air-pollution-concentrations',
+         {'dataType': 'no2', 'bbox': ','.join(map(str, quarter)), 'bbox_crs': 4326, **time_slot}, None),
+        ('feature vector geojson', '/feature-vector', 'GET', '/feature-vector', {'dataType': 'Bicycle Score', **time_slot}, None),
+        ('predict', '/predict', 'GET', '/predict', {'air_pollutant': 'no2', 'changes': changes, **time_slot}, None),
+        ('grid geometry', '/grid-geometry', 'GET', '/grid-geometry', {}, None),
+        ('air pollution values', '/values/air-pollution-concentrations', 'GET', '/values/air-pollution-concentrations',
+         {'dataType': 'no2', **time_slot}, None),
+        ('feature vector values', '/values/feature-vector', 'GET', '/values/feature-vector',
+         {'dataType': 'Bicycle Score', **time_slot}, None),
+        ('predict values', '/values/predict', 'GET', '/values/predict', {'air_pollutant': 'no2', 'changes': changes, **time_slot}, None),
+        ('air pollution statistics', '/statistics/air-pollution-concentrations', 'GET', '/statistics/air-pollution-concentrations',
+         {'dataType': 'no2', **time_slot}, None),
+        ('feature vector statistics', '/statistics/feature-vector', 'GET', '/statistics/feature-vector',
+         {'dataType': 'Bicycle Score', **time_slot}, None),
+        ('predict statistics', '/statistics/predict', 'GET', '/statistics/predict',
+         {'air_pollutant': 'no2', 'changes': changes, **time_slot}, None),
+        ('region sets', '/regions', 'GET', '/regions', {}, None),
+        ('aggregate, all hours', '/aggregate', 'POST', '/aggregate', {},
+         {'dataType': 'no2', 'month': month, 'day': day, 'hours': 'all', 'threshold': 40, 'geometry': polygon}),
+        ('air pollution time series, raw', '/time-series/air-pollution-concentrations', 'GET',
+         '/time-series/air-pollution-concentrations', {'dataType': 'no2', 'months': month, 'days': day, 'hours': hour_range}, None),
+        ('air pollution time series, json', '/time-series/air-pollution-concentrations', 'GET',
+         '/time-series/air-pollution-concentrations',
+         {'dataType': 'no2', 'months': month, 'days': day, 'hours': hour_range, 'format': 'json'}, None),
+        ('feature vector time series, raw', '/time-series/feature-vector', 'GET', '/time-series/feature-vector',
+         {'dataType': 'Bicycle Score', 'months': month, 'days': day, 'hours': hour_range}, None),
+        ('air pollution tile', '/tiles/<layer>/<int:z>/<int:x>/<int:y>.mvt', 'GET',
+         f'/tiles/air-pollution-concentrations/10/{tile_x}/{tile_y}.mvt', {'dataType': 'no2', **time_slot}, None),
+        ('predict batch, 10 scenarios', '/predict-batch', 'POST', '/predict-batch', {}, {
+            'airPollutants': ['no2'],
+            'scenarios': [{**time_slot, 'changes': {'Bicycle Score': 10 * i}} for i in range(10)],
+        }),
+        ('submit report', '/reports', 'POST', '/reports', {}, report),
+        ('generate report', '/generate-report', 'POST', '/generate-report', {}, {**report, 'sliderValue': 20}),
+        ('cache stats', '/cache-stats', 'GET', '/cache-stats', {}, None),
+        ('num tables', '/num-tables', 'GET', '/num-tables', {}, None),
+        ('metrics', '/metrics', 'GET', '/metrics', {}, None),
+    ]
+
+
+def payload_problem(response, data):
+    # What makes a response unusable as an answer, or None; GeoJSON must have features, each with a geometry
+    if not 200 <= response.status_code < 300:
+        return f"status {response.status_code}"
+    if not data:
+        return "empty body"
+    if response.mimetype == 'application/json':
+        try:
+            payload = json.loads(data)
+        except ValueError:
+            return "invalid JSON"
+        if isinstance(payload, dict) and payload.get('type') == 'FeatureCollection':
+            features = payload.get('features') or []
+            missing = sum(feature.get('geometry') is None for feature in features)
+            if not features:
+                return "no features"
+            if missing:
+                return f"{missing} of {len(features)} features without geometry"
+    elif response.mimetype == 'application/pdf' and not data.startswith(b'%PDF'):
+        return "not a PDF"
+    return None
+
+
+def time_request(client, method, path, query, body, repeat):
+    # First (cold) and later (warm) timings of one request; streamed bodies are read to the end and then checked
+    seconds, sizes, status_codes, problems, server_timing = [], [], set(), set(), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        response = client.open(path, method=method, query_string=query, json=body)
+        data = response.get_data()
+        seconds.append(time.perf_counter() - start)
+        response.close()
+        sizes.append(len(data))
+        status_codes.add(response.status_code)
+        problem = payload_problem(response, data)
+        if problem is not None:
+            problems.add(problem)
+        server_timing = server_timing or response.headers.get('Server-Timing')
+    warm = seconds[1:] or seconds
+    return {
+        "status_codes": sorted(status_codes),
+        "problems": sorted(problems),
+        "bytes": max(sizes),
+        "first_ms": seconds[0] * 1000,
+        "median_ms": statistics.median(warm) * 1000,
+        "min_ms": min(warm) * 1000,
+        "max_ms": max(warm) * 1000,
+        "server_timing": server_timing,
+    }, data
+
+
+def benchmark_endpoints(app_module, bounds, slot, hours, repeat):
+    client = app_module.app.test_client()
+    results = []
+    covered = set()
+
+    def record(name, rule, method, path, query, body, times=repeat):
+        timing, data = time_request(client, method, path, query, body, times)
+        results.append({"name": name, "rule": rule, "method": method, **timing})
+        covered.add(rule)
+        print(f"{name}: first {timing['first_ms']:.1f} ms, median {timing['median_ms']:.1f} ms, {timing['bytes']:,} bytes")
+        if timing["problems"]:
+            print(f"{name}: {', '.join(timing['problems'])}")
+        return data, not timing["problems"]
+
+    for name, rule, method, path, query, body in endpoint_requests(bounds, slot, hours):
+        data, ok = record(name, rule, method, path, query, body)
+        if rule == '/reports' and ok:
+            # Status and download of the job just submitted, once it has rendered
+            job_id = json.loads(data)['job_id']
+            app_module.report_queue.wait(job_id, REPORT_TIMEOUT)
+            record('report status', '/reports/<job_id>', 'GET', f'/reports/{job_id}', {}, None)
+            record('report pdf', '/reports/<job_id>/pdf', 'GET', f'/reports/{job_id}/pdf', {}, None)
+
+    # Scenarios that miss the prediction cache, one change per repeat
+    month, day, hour = slot
+    name, rule = 'predict, uncached', '/predict'
+    seconds = []
+    for i in range(repeat):
+        query = {'air_pollutant': 'no2', 'changes': f'Bicycle Score:{11 + i}', 'month': month, 'day': day, 'hour': hour}
+        timing, _ = time_request(client, 'GET', '/predict', query, None, 1)
+        seconds.append(timing)
+    results.append({
+        "name": name, "rule": rule, "method": 'GET',
+        "status_codes": sorted({code for timing in seconds for code in timing["status_codes"]}),
+        "problems": sorted({problem for timing in seconds for problem in timing["problems"]}),
+        "bytes": max(timing["bytes"] for timing in seconds),
+        "first_ms": seconds[0]["first_ms"],
+        "median_ms": statistics.median(timing["first_ms"] for timing in seconds),
+        "min_ms": min(timing["first_ms"] for timing in seconds),
+        "max_ms": max(timing["first_ms"] for timing in seconds),
+        "server_timing": seconds[0]["server_timing"],
+    })
+
+    rules = {rule.rule for rule in app_module.app.url_map.iter_rules() if rule.endpoint != 'static'}
+    return results, sorted(rules - covered)
+
+
+def benchmark_process_data(generate_pdf, slot, repeat):
+    # generate_pdf.process_data with an empty map cache, then with the maps cached
+    month, day, hour = slot
+    data = {
+        'selectedAirPollution': 'no2', 'selectedFeatureVector': 'Bicycle Score',
+        'selectedMonth': str(month), 'selectedDay': day, 'selectedHour': f"{hour}:00",
+        'changes': {'Bicycle Score': 10, 'Car and Taxi Score': -5}, 'sliderValue': 10,
+    }
+    shutil.rmtree(generate_pdf.MAP_CACHE_DIR, ignore_errors=True)
+    seconds = []
+    with tempfile.TemporaryDirectory(prefix='eii-process-data-') as output_dir:
+        for _ in range(repeat):
+            _, elapsed = timed(generate_pdf.process_data, data, output_dir)
+            seconds.append(elapsed)
+    warm = seconds[1:] or seconds
+    return {"first_ms": seconds[0] * 1000, "median_ms": statistics.median(warm) * 1000, "min_ms": min(warm) * 1000}
+
+
+def parse_list(value, parse=int):
+    return [parse(item) for item in value.split(',') if item]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--size', choices=sorted(synthetic.GRID_SIZES), default='london')
+    parser.add_argument('--cells', type=int, help="Number of grid cells, instead of a preset size")
+    parser.add_argument('--months', default='1', help="Comma-separated months to generate")
+    parser.add_argument('--days', default='Friday', help="Comma-separated days to generate")
+    parser.add_argument('--hours', default='7,8,9', help="Comma-separated hours to generate")
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT, help="Requests per endpoint; the first is reported as cold")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=None, help="CSV parsing processes for the builder")
+    parser.add_argument('--work-dir', help="Where the synthetic data and database are kept between runs")
+    parser.add_argument('--output-dir', default=RESULTS_DIR)
+    parser.add_argument('--import-budget', type=float, default=import_time.DEFAULT_BUDGET, help="Seconds importing app may take")
+    parser.add_argument('--check-incremental', action='store_true', help="Also check an incremental build against a full one")
+    args = parser.parse_args(argv)
+
+    num_cells = args.cells or synthetic.GRID_SIZES[args.size]
+    size_name = args.size if not args.cells else f"{args.cells}-cells"
+    months, days, hours = parse_list(args.months), parse_list(args.days, str), parse_list(args.hours)
+    slot = (months[0], days[0], hours[len(hours) // 2])
+    work_dir = args.work_dir or os.path.join(tempfile.gettempdir(), f'eii-benchmark-{size_name}-{args.seed}')
+    os.makedirs(work_dir, exist_ok=True)
+
+    # Step 1: synthetic sources and models, reused when already generated with these parameters
+    print(f"Generating {num_cells:,} cells x {len(months) * len(days) * len(hours)} time slots in {work_dir}")
+    work_paths, generate_seconds = timed(synthetic.generate, work_dir, num_cells, months, days, hours, args.seed)
+
+    # Step 2: full build, then a rebuild with nothing changed
+    import build_database
+    sources = (work_paths['gpkg'], work_paths['feature_vector_dir'], work_paths['air_pollution_dir'], work_paths['database'])
+    _, full_seconds = timed(build_database.create_spatial_database, *sources, args.workers, full_rebuild=True)
+    _, noop_seconds = timed(build_database.create_spatial_database, *sources, args.workers)
+    incremental = check_incremental(work_paths, slot, args.seed, args.workers) if args.check_incremental else None
+
+    # Step 3: point the app at the synthetic build, time importing it in a fresh interpreter (which inherits these
+    # paths), then import it here
+    os.environ.update({
+        'EII_GPKG_FILE': work_paths['gpkg'],
+        'EII_DATABASE_FILE': work_paths['database'],
+        'EII_MODELS_DIR': work_paths['models_dir'],
+        'EII_TILE_CACHE_FILE': os.path.join(work_dir, 'tiles.mbtiles'),
+        'EII_REPORT_DIR': os.path.join(work_dir, 'reports'),
+        'EII_REPORT_MAP_CACHE_DIR': os.path.join(work_dir, 'report-maps'),
+        'EII_LOG_LEVEL': os.environ.get('EII_LOG_LEVEL', 'WARNING'),
+        'EII_WARM_UP': 'off',
+    })
+    import_check = import_time.check(args.import_budget)
+    # Tiles and reports from an earlier run would make every request a cache hit
+    shutil.rmtree(os.path.join(work_dir, 'reports'), ignore_errors=True)
+    if os.path.exists(os.path.join(work_dir, 'tiles.mbtiles')):
+        os.remove(os.path.join(work_dir, 'tiles.mbtiles'))
+    app_module, import_seconds = timed(importlib.import_module, 'app')
+    generate_pdf = importlib.import_module('generate_pdf')
+
+    # Step 4: scenario rescoring against a full recompute, every endpoint through the test client, and the report
+    # data processing
+    bounds = gpd.read_file(work_paths['gpkg']).to_crs(epsg=4326).total_bounds.tolist()
+    scenario_check = check_scenarios(app_module, slot)
+    drift_check = check_scenarios(app_module, synthetic.DRIFT_SLOT, drift=True)
+    geometry_check = check_geometry_levels(app_module)
+    endpoints, uncovered = benchmark_endpoints(app_module, bounds, slot, hours, args.repeat)
+    process_data = benchmark_process_data(generate_pdf, slot, args.repeat)
+    if uncovered:
+        print(f"Endpoints without a benchmark: {', '.join(uncovered)}")
+
+    result = {
+        "benchmark": {
+            "size": size_name, "cells": num_cells, "months": months, "days": days, "hours": hours,
+            "time_slot": list(slot), "repeat": args.repeat, "seed": args.seed,
+        },
+        "environment": environment(),
+        "generate_seconds": generate_seconds,
+        "build": {"full_seconds": full_seconds, "unchanged_seconds": noop_seconds, "incremental_check": incremental},
+        "app_import_seconds": import_seconds,
+        "import_check": import_check,
+        "scenario_check": scenario_check,
+        "drift_check": drift_check,
+        "geometry_check": geometry_check,
+        "endpoints": endpoints,
+        "process_data": process_data,
+        "uncovered_rules": uncovered,
+    }
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    timestamp = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+    output_file = os.path.join(args.output_dir, f"{size_name}-{timestamp}.json")
+    with open(output_file, 'w') as f:
+        json.dump(result, f, indent=2)
+    print(f"Wrote {output_file}")
+    failed = False
+    if not import_check["passed"]:
+        print(f"Importing app took {import_check['seconds']:.2f}s (budget {import_check['budget']:.2f}s); "
+              f"imported eagerly: {', '.join(import_check['eagerly_imported']) or 'nothing'}")
+        failed = True
+    for check in (scenario_check, drift_check):
+        if not check["equivalent"]:
+            mismatched = [scenario for scenario in check["checks"] if not scenario["equivalent"]]
+            print(f"Rescoring affected cells differs from a full recompute in {len(mismatched)} of "
+                  f"{len(check['checks'])} scenarios for time slot {check['time_slot']}, e.g. {mismatched[0]}")
+            failed = True
+    failed_endpoints = [endpoint for endpoint in endpoints if endpoint["problems"]]
+    if failed_endpoints:
+        print(f"{len(failed_endpoints)} endpoints gave unusable responses: "
+              + '; '.join(f"{endpoint['name']} ({', '.join(endpoint['problems'])})" for endpoint in failed_endpoints))
+        failed = True
+    if not geometry_check["valid"]:
+        invalid = [check for check in geometry_check["checks"] if not check["valid"]]
+        print(f"Stored geometry levels differ from the grid: {invalid or 'no levels stored'}")
+        failed = True
+    if incremental is not None and not incremental["equivalent"]:
+        print(f"Incremental build differs from a full build in: {', '.join(incremental['mismatched'])}")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
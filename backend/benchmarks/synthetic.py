@@ -0,0 +1,179 @@
+import json
+import os
+import shutil
+
+import geopandas as gpd
+import lightgbm as lgb
+import numpy as np
+import pandas as pd
+from shapely import box
+
+from feature_vector_columns import featureVectorColumnNames
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LONDON_GPKG_FILE = os.path.join(BASE_DIR, 'data', 'raw_data', 'uk_1km_landGrids_3395_london.gpkg')
+
+# Number of 1 km cells per preset: the shipped London grid, a region, and roughly the UK's land grid
+GRID_SIZES = {'london': 4332, 'region': 25000, 'uk': 245000}
+
+# South-west corner of the London grid in EPSG:3395, where synthetic grids start
+GRID_ORIGIN = (-57291.4429, 6638331.988)
+CELL_SIZE = 1000
+
+POLLUTANTS = ('no2', 'nox', 'o3', 'pm10', 'pm2p5', 'so2')
+
+# Rough typical concentration of each pollutant, so the synthetic predictions span several AQI bands
+POLLUTANT_SCALES = {'no2': 60, 'nox': 90, 'o3': 70, 'pm10': 30, 'pm2p5': 20, 'so2': 10}
+
+DAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+
+# Traffic scores are zero in most cells, so scenario changes touch only part of the grid
+TRAFFIC_COLUMNS = featureVectorColumnNames[:5]
+TRAFFIC_ZERO_FRACTION = 0.7
+
+TRAINING_ROWS = 5000
+BOOSTING_ROUNDS = 50
+
+MANIFEST_FILE = 'synthetic.json'
+
+# Time slot written with features that are not float32-exact, as real sources are, so the feature cube's
+# float32 copy drifts from the CSVs the baseline predictions were made from
+DRIFT_SLOT = (12, 'Sunday', 3)
+
+
+def paths(work_dir):
+    # Where the synthetic sources, models and database of one benchmark size live
+    return {
+        'gpkg': os.path.join(work_dir, 'grid.gpkg'),
+        'feature_vector_dir': os.path.join(work_dir, 'feature_vectors'),
+        'air_pollution_dir': os.path.join(work_dir, 'air_pollution_concentrations'),
+        'models_dir': os.path.join(work_dir, 'models'),
+        'database': os.path.join(work_dir, 'database.db'),
+    }
+
+
+def model_filename(pollutant):
+    # Named as ModelRegistry.model_path expects for the default quantile and dataset
+    return f"dataset_All_quantile_regression_0.5_air_pollutant_{pollutant}.txt"
+
+
+def time_slot_filename(month, day, hour):
+    return f"Month_{month}_Day_{day}_Hour_{hour}.csv"
+
+
+def write_grid(gpkg_file, num_cells):
+    # The shipped London grid when its size is asked for, otherwise a near-square block of 1 km cells
+    if num_cells == GRID_SIZES['london'] and os.path.exists(LONDON_GPKG_FILE):
+        shutil.copyfile(LONDON_GPKG_FILE, gpkg_file)
+        return
+
+    columns = int(np.ceil(np.sqrt(num_cells)))
+    positions = np.arange(num_cells)
+    x = GRID_ORIGIN[0] + (positions // columns) * CELL_SIZE
+    y = GRID_ORIGIN[1] + (positions % columns) * CELL_SIZE
+    grids = gpd.GeoDataFrame(
+        {'Grid ID': positions + 1},
+        geometry=box(x, y, x + CELL_SIZE, y + CELL_SIZE),
+        crs=3395,
+    )
+    grids.to_file(gpkg_file, driver='GPKG')
+
+
+def random_features(rng, num_rows, float32_exact=True):
+    # float32-exact values by default, so the builder's float32 feature cube and the CSVs hold the same numbers
+    features = rng.gamma(2.0, 1.0, size=(num_rows, len(featureVectorColumnNames)))
+    if float32_exact:
+        features = features.astype(np.float32).astype(np.float64)
+    for column in TRAFFIC_COLUMNS:
+        i = featureVectorColumnNames.index(column)
+        features[rng.random(num_rows) < TRAFFIC_ZERO_FRACTION, i] = 0
+    return pd.DataFrame(features, columns=featureVectorColumnNames)
+
+
+def train_models(models_dir, seed):
+    # One small quantile LightGBM model per pollutant, driven mostly by traffic so changes move the predictions
+    os.makedirs(models_dir, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    features = random_features(rng, TRAINING_ROWS)
+    traffic = features[TRAFFIC_COLUMNS].sum(axis=1).to_numpy()
+    models = {}
+    for pollutant in POLLUTANTS:
+        target = POLLUTANT_SCALES[pollutant] * (0.5 + traffic / 10) + rng.normal(0, 1, TRAINING_ROWS)
+        model = lgb.train(
+            {'objective': 'quantile', 'alpha': 0.5, 'num_leaves': 31, 'seed': seed, 'verbose': -1},
+            lgb.Dataset(features, label=np.maximum(target, 0)),
+            num_boost_round=BOOSTING_ROUNDS,
+        )
+        model.save_model(os.path.join(models_dir, model_filename(pollutant)))
+        models[pollutant] = model
+    return models
+
+
+def write_time_slot(work_paths, grid_ids, models, month, day, hour, seed, variant=0, float32_exact=True):
+    # Seeded by the slot itself, so a slot's values do not depend on which other slots are generated
+    rng = np.random.default_rng([seed, int(month), DAYS.index(day), int(hour), variant])
+    features = random_features(rng, len(grid_ids), float32_exact)
+    features["Week Number"] = (int(month) - 1) * 4 + 1
+    features["Month Number"] = int(month)
+    features["Day of Week Number"] = DAYS.index(day)
+    features["Hour Number"] = int(hour)
+
+    # Baseline predictions come from the synthetic models, so the server can reuse them for unchanged cells
+    pollution = pd.DataFrame({'Grid ID': grid_ids})
+    for pollutant, model in models.items():
+        pollution[f"{pollutant} Prediction 0.5"] = model.predict(features[featureVectorColumnNames])
+
+    features.insert(0, 'Grid ID', grid_ids)
+    filename = time_slot_filename(month, day, hour)
+    features.to_csv(os.path.join(work_paths['feature_vector_dir'], filename), index=False)
+    pollution.to_csv(os.path.join(work_paths['air_pollution_dir'], filename), index=False)
+
+
+def generate(work_dir, num_cells, months=(1,), days=('Friday',), hours=(7, 8, 9), seed=0):
+    """Write a synthetic grid, models and time slot CSVs to ``work_dir``.
+
+    Sources already generated with the same parameters are kept as they are,
+    so their mtimes do not change and the builder finds nothing to update.
+    DRIFT_SLOT is written as well, with features that are not float32-exact.
+    Returns the paths of the generated files.
+    """
+    work_paths = paths(work_dir)
+    parameters = {
+        'num_cells': num_cells, 'months': list(months), 'days': list(days), 'hours': list(hours), 'seed': seed,
+        'columns': len(featureVectorColumnNames), 'drift_slot': list(DRIFT_SLOT),
+    }
+    manifest_file = os.path.join(work_dir, MANIFEST_FILE)
+    if os.path.exists(manifest_file):
+        with open(manifest_file) as f:
+            if json.load(f) == parameters:
+                return work_paths
+    for name in ('feature_vector_dir', 'air_pollution_dir', 'models_dir'):
+        shutil.rmtree(work_paths[name], ignore_errors=True)
+        os.makedirs(work_paths[name])
+
+    write_grid(work_paths['gpkg'], num_cells)
+    grid_ids = gpd.read_file(work_paths['gpkg'], columns=['Grid ID'], ignore_geometry=True)['Grid ID'].to_numpy()
+    models = train_models(work_paths['models_dir'], seed)
+
+    for month in months:
+        for day in days:
+            for hour in hours:
+                if (month, day, hour) != DRIFT_SLOT:
+                    write_time_slot(work_paths, grid_ids, models, month, day, hour, seed)
+    write_time_slot(work_paths, grid_ids, models, *DRIFT_SLOT, seed, float32_exact=False)
+
+    with open(manifest_file, 'w') as f:
+        json.dump(parameters, f)
+    return work_paths
+
+
+def rewrite_time_slot(work_paths, month, day, hour, seed, variant=1):
+    # Different values for one existing time slot, as a changed source file for incremental builds
+    filename = time_slot_filename(month, day, hour)
+    grid_ids = pd.read_csv(os.path.join(work_paths['feature_vector_dir'], filename), usecols=['Grid ID'])['Grid ID'].to_numpy()
+    models = {
+        pollutant: lgb.Booster(model_file=os.path.join(work_paths['models_dir'], model_filename(pollutant)))
+        for pollutant in POLLUTANTS
+    }
+    write_time_slot(work_paths, grid_ids, models, month, day, hour, seed, variant)
+
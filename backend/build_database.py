@@ -1,27 +1,90 @@
 import os
+import time
+import hashlib
+import shutil
 import geopandas as gpd
+import numpy as np
 import pandas as pd
 import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+from collections import deque
 from glob import glob
+from itertools import islice
 from tqdm import tqdm
 
-def create_spatial_database(gpkg_path, feature_vector_dir, air_pollution_dir, db_path):
-    # Check if the database already exists
-    if os.path.exists(db_path):
-        os.remove(db_path)
-        print(f"Existing database {db_path} deleted.")
+import database
+import aqi
+import slot_statistics
+from feature_cube import feature_cube_paths, write_feature_cube, replace_feature_cube
+from feature_vector_columns import featureVectorColumnNames
+from grid_store import GEOMETRY_LEVELS
 
-    # Load the .gpkg file
-    gdf = gpd.read_file(gpkg_path)
+# SQLite settings used while building; the database is rebuilt from source, so durability is not needed
+BUILD_PRAGMAS = {
+    'page_size': 65536,
+    'journal_mode': 'OFF',
+    'synchronous': 'OFF',
+    'cache_size': -1048576,  # 1 GiB, in KiB
+    'temp_store': 'MEMORY',
+}
 
-    # Connect to the database
-    conn = sqlite3.connect(db_path)
+# Rows written per transaction
+BATCH_ROWS = 500000
 
-    # Enable spatialite extension
-    conn.enable_load_extension(True)
-    conn.execute('SELECT load_extension("mod_spatialite");')
+# Size, mtime and hash of every source file used by the last build
+MANIFEST_TABLE = 'build_manifest'
+GRIDS_SOURCE = 'grids'
+
+def sql_column_type(dtype):
+    # Same typing as the original per-time-slot tables, with integer keys kept as integers
+    if dtype == 'object':
+        return 'TEXT'
+    if pd.api.types.is_integer_dtype(dtype):
+        return 'INTEGER'
+    return 'REAL'
+
+def apply_pragmas(conn, pragmas):
+    for name, value in pragmas.items():
+        conn.execute(f'PRAGMA {name} = {value};')
 
-    # Create a cursor object
+def report_stage(stage, rows, seconds):
+    rate = rows / seconds if seconds > 0 else float('inf')
+    print(f"{stage}: {rows} rows in {seconds:.1f}s ({rate:,.0f} rows/s)")
+
+def parse_csv_file(kind, csv_file):
+    # Runs in a worker process; returns everything the writer needs for one time slot
+    df = pd.read_csv(csv_file)
+    month, day, hour = database.parse_time_slot(os.path.basename(csv_file))
+    statistics = {}
+    if kind == database.AIR_POLLUTION_CONCENTRATION:
+        add_aqi_columns(df)
+        statistics = slot_statistics.baseline_statistics(df)
+    return kind, csv_file, month, day, hour, df, statistics
+
+def add_aqi_columns(df):
+    # Integer "<pollutant> AQI" band next to each baseline prediction, so requests never band stored data
+    for pollutant in aqi.AQI_BREAKPOINTS:
+        column = f"{pollutant} Prediction 0.5"
+        if column in df.columns:
+            df[aqi.aqi_column(pollutant)] = aqi.aqi_bands(pollutant, df[column])
+
+def parse_csv_files(jobs, workers):
+    # Yield parsed CSVs in order, keeping at most a few files per worker in flight
+    if workers <= 1:
+        for kind, csv_file in jobs:
+            yield parse_csv_file(kind, csv_file)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        jobs = iter(jobs)
+        pending = deque(executor.submit(parse_csv_file, *job) for job in islice(jobs, 2 * workers))
+        while pending:
+            yield pending.popleft().result()
+            job = next(jobs, None)
+            if job is not None:
+                pending.append(executor.submit(parse_csv_file, *job))
+
+def load_grids(conn, gdf):
     cur = conn.cursor()
 
     # Create a table for the spatial data
@@ -34,58 +97,323 @@ def create_spatial_database(gpkg_path, feature_vector_dir, air_pollution_dir, db
     ''')
 
     # Add spatial metadata
-    cur.execute('SELECT InitSpatialMetaData();')
+    cur.execute('SELECT InitSpatialMetaData(1);')
 
     # Add a geometry column to the table
     cur.execute('''
     SELECT AddGeometryColumn('grids', 'geom', 3395, 'MULTIPOLYGON', 'XY');
     ''')
 
+    # Insert the spatial data into the grids table in a single transaction
+    rows = zip(gdf['Grid ID'].tolist(), (geom.wkb for geom in gdf.geometry))
+    cur.executemany('''
+    INSERT INTO grids (grid_id, geom)
+    VALUES (?, GeomFromWKB(?, 3395));
+    ''', rows)
+
+    # R*Tree on the cell geometries, built once after the bulk insert
+    cur.execute("SELECT CreateSpatialIndex('grids', 'geom');")
     conn.commit()
 
-    # Insert the spatial data into the grids table
-    for _, row in gdf.iterrows():
-        geom_wkb = row['geometry'].wkb
-        cur.execute('''
-        INSERT INTO grids (grid_id, geom)
-        VALUES (?, GeomFromWKB(?, 3395));
-        ''', (row['Grid ID'], geom_wkb))
+def load_grid_geometries(conn, gdf):
+    # Grid cells in EPSG:4326, simplified once per level of detail so the server never has to
+    grid_id_type = sql_column_type(gdf['Grid ID'].dtype)
+    conn.execute(f'''
+    CREATE TABLE {database.GEOMETRY_LEVELS_TABLE} (
+        level INTEGER PRIMARY KEY,
+        min_zoom INTEGER NOT NULL,
+        tolerance REAL NOT NULL
+    );
+    ''')
+    conn.execute(f'''
+    CREATE TABLE {database.GRID_GEOMETRIES_TABLE} (
+        level INTEGER NOT NULL,
+        position INTEGER NOT NULL,
+        grid_id {grid_id_type} NOT NULL,
+        geometry BLOB NOT NULL,
+        PRIMARY KEY (level, position)
+    ) WITHOUT ROWID;
+    ''')
 
+    # Rows keep the GeoPackage order, which is the fixed grid order of the values endpoints
+    geometry = gdf.geometry.to_crs(epsg=4326)
+    grid_ids = gdf['Grid ID'].tolist()
+    for level, (min_zoom, tolerance) in enumerate(GEOMETRY_LEVELS):
+        simplified = geometry.simplify(tolerance, preserve_topology=True) if tolerance else geometry
+        conn.execute(
+            f'INSERT INTO {database.GEOMETRY_LEVELS_TABLE} (level, min_zoom, tolerance) VALUES (?, ?, ?);',
+            (level, min_zoom, tolerance)
+        )
+        conn.executemany(
+            f'INSERT INTO {database.GRID_GEOMETRIES_TABLE} (level, position, grid_id, geometry) VALUES (?, ?, ?, ?);',
+            ((level, position, grid_id, wkb) for position, (grid_id, wkb) in enumerate(zip(grid_ids, simplified.to_wkb())))
+        )
     conn.commit()
 
-    # Function to create a table from a DataFrame
-    def create_table_from_df(df, table_name):
-        cols = ', '.join([f'"{col}" TEXT' if df[col].dtype == 'object' else f'"{col}" REAL' for col in df.columns])
-        cur.execute(f'CREATE TABLE {table_name} ({cols});')
+def load_time_slots(conn, csv_files, workers, table_columns=None):
+    # table_columns maps each kind to the (name, SQL type) columns of its existing table, if any
+    cur = conn.cursor()
+    table_columns = dict(table_columns or {})
+    rows_written = {kind: 0 for kind in csv_files}
+    seconds = {kind: 0.0 for kind in csv_files}
+    rows_since_commit = 0
+
+    jobs = [(kind, csv_file) for kind, files in csv_files.items() for csv_file in files]
+    slot_statistics.create_statistics_table(conn)
+    started = time.perf_counter()
+    for kind, csv_file, month, day, hour, df, statistics in tqdm(parse_csv_files(jobs, workers), total=len(jobs), desc="Loading time slots"):
+        table_name = database.LONG_FORMAT_TABLES[kind]
+        columns = table_columns.get(kind)
+        if columns is None:
+            columns = [(col, sql_column_type(df[col].dtype)) for col in df.columns]
+            database.create_long_format_tables(conn, kind, columns)
+            table_columns[kind] = columns
+        else:
+            # Add any columns that earlier files did not have
+            known = {col for col, _ in columns}
+            for col in df.columns:
+                if col not in known:
+                    col_type = sql_column_type(df[col].dtype)
+                    cur.execute(f'ALTER TABLE {table_name} ADD COLUMN {database.quote_identifier(col)} {col_type};')
+                    columns.append((col, col_type))
 
-    # Get all CSV files in the directories
-    feature_vector_files = glob(os.path.join(feature_vector_dir, '*.csv'))
-    air_pollution_files = glob(os.path.join(air_pollution_dir, '*.csv'))
-
-    # Process feature vector CSV files
-    for csv_file in tqdm(feature_vector_files, desc="Processing feature vector files"):
-        df = pd.read_csv(csv_file)
-        filename = os.path.basename(csv_file).replace('.csv', '')
-        table_name = f"feature_vector_{filename}".replace("-", "_")
-        create_table_from_df(df, table_name)
-        df.to_sql(table_name, conn, if_exists='append', index=False)
-
-    # Process air pollution concentration CSV files
-    for csv_file in tqdm(air_pollution_files, desc="Processing air pollution files"):
-        df = pd.read_csv(csv_file)
-        filename = os.path.basename(csv_file).replace('.csv', '')
-        table_name = f"air_pollution_concentration_{filename}".replace("-", "_")
-        create_table_from_df(df, table_name)
-        df.to_sql(table_name, conn, if_exists='append', index=False)
+        # Key columns joined in one concat; inserting them one by one fragments the ~180-column frame
+        df = df.rename(columns={'Grid ID': 'grid_id'})
+        slot = pd.DataFrame({'month': month, 'day': day, 'hour': hour}, index=df.index)
+        df = pd.concat([slot, df], axis=1)
+
+        column_list = ', '.join(database.quote_identifier(col) for col in df.columns)
+        placeholders = ', '.join('?' for _ in df.columns)
+        cur.executemany(
+            f'INSERT INTO {table_name} ({column_list}) VALUES ({placeholders});',
+            df.itertuples(index=False, name=None)
+        )
+        cur.execute(
+            f'INSERT INTO {database.TIME_SLOTS_TABLE} (kind, month, day, hour, source, num_rows) VALUES (?, ?, ?, ?, ?, ?);',
+            (kind, month, day, hour, os.path.basename(csv_file), len(df))
+        )
+        slot_statistics.write_statistics(conn, kind, month, day, hour, statistics)
+
+        # Commit in large transactions rather than per file
+        rows_written[kind] += len(df)
+        rows_since_commit += len(df)
+        if rows_since_commit >= BATCH_ROWS:
+            conn.commit()
+            rows_since_commit = 0
+
+        now = time.perf_counter()
+        seconds[kind] += now - started
+        started = now
+
+    conn.commit()
+    for kind in csv_files:
+        report_stage(f"Loaded {kind.replace('_', ' ')} rows", rows_written[kind], seconds[kind])
+    return table_columns
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def source_name(kind, path):
+    return f"{kind}/{os.path.basename(path)}"
+
+def read_manifest(db_path):
+    # {source: (size, mtime, sha256)} from the previous build, or None if there is nothing to update
+    if not os.path.exists(db_path):
+        return None
+    conn = sqlite3.connect(db_path)
+    try:
+        if not database.table_exists(conn, MANIFEST_TABLE):
+            return None
+        rows = conn.execute(f'SELECT source, size, mtime, sha256 FROM {MANIFEST_TABLE};').fetchall()
+    finally:
+        conn.close()
+    return {source: (size, mtime, sha256) for source, size, mtime, sha256 in rows}
+
+def scan_sources(sources, previous):
+    # Stat every source file, hashing only those whose size or mtime differ from the previous build
+    manifest = {}
+    for source, path in sources.items():
+        stat = os.stat(path)
+        entry = (previous or {}).get(source)
+        if entry is not None and entry[0] == stat.st_size and entry[1] == stat.st_mtime:
+            sha256 = entry[2]
+        else:
+            sha256 = file_sha256(path)
+        manifest[source] = (stat.st_size, stat.st_mtime, sha256)
+    return manifest
+
+def write_manifest(conn, manifest):
+    conn.execute(f'''
+    CREATE TABLE IF NOT EXISTS {MANIFEST_TABLE} (
+        source TEXT PRIMARY KEY,
+        size INTEGER,
+        mtime REAL,
+        sha256 TEXT
+    );
+    ''')
+    conn.execute(f'DELETE FROM {MANIFEST_TABLE};')
+    conn.executemany(
+        f'INSERT INTO {MANIFEST_TABLE} (source, size, mtime, sha256) VALUES (?, ?, ?, ?);',
+        [(source, *entry) for source, entry in manifest.items()]
+    )
+    conn.commit()
+
+def build_full(conn, gpkg_path, csv_files, workers):
+    # Load the .gpkg file
+    stage_started = time.perf_counter()
+    gdf = gpd.read_file(gpkg_path)
+    report_stage("Read grid cells", len(gdf), time.perf_counter() - stage_started)
+
+    # Enable spatialite extension
+    conn.enable_load_extension(True)
+    conn.execute('SELECT load_extension("mod_spatialite");')
+
+    stage_started = time.perf_counter()
+    load_grids(conn, gdf)
+    report_stage("Loaded grid cells", len(gdf), time.perf_counter() - stage_started)
+
+    stage_started = time.perf_counter()
+    load_grid_geometries(conn, gdf)
+    report_stage("Simplified grid geometry levels", len(gdf) * len(GEOMETRY_LEVELS), time.perf_counter() - stage_started)
 
+    # Parse CSVs in a process pool and write them through this single connection
+    table_columns = load_time_slots(conn, csv_files, workers)
+
+    # Index after loading, so inserts do not maintain the index row by row
+    for kind in table_columns:
+        stage_started = time.perf_counter()
+        database.create_long_format_indexes(conn, kind)
+        conn.commit()
+        num_rows = conn.execute(f'SELECT COUNT(*) FROM {database.LONG_FORMAT_TABLES[kind]}').fetchone()[0]
+        report_stage(f"Indexed {kind.replace('_', ' ')} rows", num_rows, time.perf_counter() - stage_started)
+
+def build_incremental(conn, changed, removed, csv_files, workers):
+    # Drop the time slots of changed and removed files
+    for source in sorted(changed | removed):
+        kind, filename = source.split('/', 1)
+        table_name = database.LONG_FORMAT_TABLES[kind]
+        if not database.table_exists(conn, table_name):
+            continue
+        month, day, hour = database.parse_time_slot(filename)
+        conn.execute(f'DELETE FROM {table_name} WHERE month = ? AND day = ? AND hour = ?;', (month, day, hour))
+        conn.execute(
+            f'DELETE FROM {database.TIME_SLOTS_TABLE} WHERE kind = ? AND month = ? AND day = ? AND hour = ?;',
+            (kind, month, day, hour)
+        )
+        if database.table_exists(conn, database.SLOT_STATISTICS_TABLE):
+            conn.execute(
+                f'DELETE FROM {database.SLOT_STATISTICS_TABLE} WHERE kind = ? AND month = ? AND day = ? AND hour = ?;',
+                (kind, month, day, hour)
+            )
     conn.commit()
+
+    # Re-ingest the new and changed files into the existing tables
+    changed_files = {
+        kind: [path for path in files if source_name(kind, path) in changed]
+        for kind, files in csv_files.items()
+    }
+    existing_columns = {
+        kind: database.table_columns(conn, kind)
+        for kind in csv_files if database.table_exists(conn, database.LONG_FORMAT_TABLES[kind])
+    }
+    table_columns = load_time_slots(conn, changed_files, workers, existing_columns)
+
+    # Tables created by this run still need their indexes
+    for kind in table_columns:
+        database.create_long_format_indexes(conn, kind)
+    conn.commit()
+
+def build_feature_cube(source_path, db_path):
+    # Memory-mapped float32 copy of the model's feature columns in source_path, staged next to db_path
+    stage_started = time.perf_counter()
+    conn = sqlite3.connect(source_path)
+    cube_file = write_feature_cube(conn, db_path, featureVectorColumnNames)
     conn.close()
+    cube = np.load(cube_file, mmap_mode='r')
+    report_stage("Wrote feature cube", cube.shape[0] * cube.shape[1], time.perf_counter() - stage_started)
+
+def create_spatial_database(gpkg_path, feature_vector_dir, air_pollution_dir, db_path, workers=None, full_rebuild=False, feature_cube=True):
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    # Get all CSV files in the directories
+    csv_files = {
+        database.FEATURE_VECTOR: sorted(glob(os.path.join(feature_vector_dir, '*.csv'))),
+        database.AIR_POLLUTION_CONCENTRATION: sorted(glob(os.path.join(air_pollution_dir, '*.csv'))),
+    }
+    grids_source = source_name(GRIDS_SOURCE, gpkg_path)
+    sources = {grids_source: gpkg_path}
+    for kind, files in csv_files.items():
+        sources.update({source_name(kind, path): path for path in files})
+
+    # Compare the source files against the manifest of the previous build
+    previous = None if full_rebuild else read_manifest(db_path)
+    manifest = scan_sources(sources, previous)
+    incremental = previous is not None and previous.get(grids_source) == manifest[grids_source]
+
+    # Build next to the live database and swap it in at the end, so servers never see a partial build
+    build_path = db_path + '.building'
+    if os.path.exists(build_path):
+        os.remove(build_path)
+
+    if incremental:
+        changed = {source for source, entry in manifest.items() if source not in previous or previous[source][2] != entry[2]}
+        removed = set(previous) - set(manifest)
+        if not changed and not removed:
+            # Record any moved mtimes so the next run does not hash those files again. The data is unchanged, so
+            # the live database keeps its mtime, which the server's caches are keyed on
+            if manifest != previous:
+                stat = os.stat(db_path)
+                conn = sqlite3.connect(db_path)
+                write_manifest(conn, manifest)
+                conn.close()
+                os.utime(db_path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+            if feature_cube and not all(os.path.exists(path) for path in feature_cube_paths(db_path)):
+                build_feature_cube(db_path, db_path)
+                replace_feature_cube(db_path)
+            print(f"Database {db_path} is up to date.")
+            return
+
+        print(f"Updating {db_path}: {len(changed)} new or changed and {len(removed)} removed source files.")
+        shutil.copyfile(db_path, build_path)
+        conn = sqlite3.connect(build_path)
+        apply_pragmas(conn, BUILD_PRAGMAS)
+        build_incremental(conn, changed, removed, csv_files, workers)
+
+        # Databases built before geometry levels existed get them once
+        if not database.table_exists(conn, database.GRID_GEOMETRIES_TABLE):
+            load_grid_geometries(conn, gpd.read_file(gpkg_path))
+    else:
+        # Connect to the database and apply the build-time settings before any table exists
+        conn = sqlite3.connect(build_path)
+        apply_pragmas(conn, BUILD_PRAGMAS)
+        build_full(conn, gpkg_path, csv_files, workers)
+
+    write_manifest(conn, manifest)
+
+    # Restore a journal so the finished database is safe to serve from
+    conn.execute('PRAGMA journal_mode = DELETE;')
+    conn.close()
+
+    # Build the cube from the new database before it goes live, so servers never pair one build's database
+    # with another's cube for longer than the two renames take
+    if feature_cube:
+        build_feature_cube(build_path, db_path)
+        replace_feature_cube(db_path)
+
+    # Atomically replace the live database; open connections keep reading the old file
+    os.replace(build_path, db_path)
     print(f"New database {db_path} created and populated.")
 
-# Paths to your files
-gpkg_path = 'data/raw_data/uk_1km_landGrids_3395_london.gpkg'
-feature_vector_dir = 'data/raw_data/england_typical_day_london_feature_vector_complete'
-air_pollution_dir = 'data/raw_data/england_typical_day_london_air_pollution_concentrations_complete'
-db_path = 'data/database.db'
+if __name__ == '__main__':
+    # Paths to your files
+    gpkg_path = 'data/raw_data/uk_1km_landGrids_3395_london.gpkg'
+    feature_vector_dir = 'data/raw_data/england_typical_day_london_feature_vector_complete'
+    air_pollution_dir = 'data/raw_data/england_typical_day_london_air_pollution_concentrations_complete'
+    db_path = 'data/database.db'
 
-create_spatial_database(gpkg_path, feature_vector_dir, air_pollution_dir, db_path)
+    create_spatial_database(gpkg_path, feature_vector_dir, air_pollution_dir, db_path)
@@ -0,0 +1,249 @@
+import itertools
+import json
+import re
+
+import pandas as pd
+
+# Long-format tables, one row per (month, day, hour, grid cell)
+FEATURE_VECTOR_TABLE = 'feature_vectors'
+AIR_POLLUTION_TABLE = 'air_pollution_concentrations'
+TIME_SLOTS_TABLE = 'time_slots'
+
+# Grid cell geometry precomputed per level of detail, and the zoom range of each level
+GRID_GEOMETRIES_TABLE = 'grid_geometries'
+GEOMETRY_LEVELS_TABLE = 'geometry_levels'
+
+# Summary statistics of baseline columns, precomputed per time slot by the builder
+SLOT_STATISTICS_TABLE = 'slot_statistics'
+
+# Data kinds, named after the prefixes of the legacy per-time-slot tables
+FEATURE_VECTOR = 'feature_vector'
+AIR_POLLUTION_CONCENTRATION = 'air_pollution_concentration'
+
+LONG_FORMAT_TABLES = {
+    FEATURE_VECTOR: FEATURE_VECTOR_TABLE,
+    AIR_POLLUTION_CONCENTRATION: AIR_POLLUTION_TABLE,
+}
+
+SLOT_COLUMNS = ['month', 'day', 'hour']
+KEY_COLUMNS = SLOT_COLUMNS + ['grid_id']
+
+# Rows fetched from the cursor at a time while streaming a time series
+TIME_SERIES_FETCH_ROWS = 65536
+
+TIME_SLOT_PATTERN = re.compile(r'Month_(?P<month>\d+)_Day_(?P<day>[A-Za-z]+)_Hour_(?P<hour>\d+)')
+
+
+class TimeSlotNotFound(LookupError):
+    pass
+
+
+def quote_identifier(name):
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def parse_time_slot(name):
+    # "Month_1_Day_Friday_Hour_8" (a CSV file or legacy table name) -> (1, "Friday", 8)
+    match = TIME_SLOT_PATTERN.search(name)
+    if match is None:
+        raise ValueError(f"Could not parse a time slot from {name}")
+    return int(match['month']), match['day'], int(match['hour'])
+
+
+def legacy_table_name(kind, month, day, hour):
+    return f"{kind}_Month_{month}_Day_{day}_Hour_{hour}"
+
+
+def table_exists(conn, table_name):
+    cur = conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (table_name,))
+    return cur.fetchone() is not None
+
+
+def is_long_format(conn):
+    return table_exists(conn, TIME_SLOTS_TABLE)
+
+
+def value_columns(conn, kind):
+    # Data columns of the long-format table for this kind, excluding the key columns
+    table_name = LONG_FORMAT_TABLES[kind]
+    rows = conn.execute(f"PRAGMA table_info({quote_identifier(table_name)})").fetchall()
+    return [row[1] for row in rows if row[1] not in KEY_COLUMNS]
+
+
+def table_columns(conn, kind):
+    # (name, SQL type) pairs of the long-format table, with grid_id reported as "Grid ID"
+    table_name = LONG_FORMAT_TABLES[kind]
+    rows = conn.execute(f"PRAGMA table_info({quote_identifier(table_name)})").fetchall()
+    return [('Grid ID' if row[1] == 'grid_id' else row[1], row[2]) for row in rows if row[1] not in SLOT_COLUMNS]
+
+
+def read_time_slot(conn, kind, month, day, hour, columns=None, grid_ids=None):
+    """Read one time slot as a DataFrame with a "Grid ID" column followed by ``columns``.
+
+    ``columns=None`` reads every data column and ``grid_ids=None`` every
+    cell. Databases built with the old one-table-per-time-slot layout are
+    read through the same interface.
+    """
+    month, hour = int(month), int(hour)
+    if grid_ids is not None:
+        grid_ids = json.dumps([_json_value(grid_id) for grid_id in grid_ids])
+
+    if is_long_format(conn):
+        table_name = LONG_FORMAT_TABLES[kind]
+        if columns is None:
+            columns = value_columns(conn, kind)
+        selected = ', '.join(['grid_id AS "Grid ID"'] + [quote_identifier(col) for col in columns])
+        sql_query = f'SELECT {selected} FROM {table_name} WHERE month = ? AND day = ? AND hour = ?'
+        params = (month, day, hour)
+        if grid_ids is not None:
+            sql_query += ' AND grid_id IN (SELECT value FROM json_each(?))'
+            params += (grid_ids,)
+        data = pd.read_sql_query(sql_query + ' ORDER BY grid_id', conn, params=params)
+        if data.empty and not exists_time_slot(conn, kind, month, day, hour):
+            raise TimeSlotNotFound(f"No {kind} data for Month {month}, Day {day}, Hour {hour}.")
+        return data
+
+    # Compatibility adapter for the legacy per-time-slot tables
+    table_name = legacy_table_name(kind, month, day, hour)
+    if not table_exists(conn, table_name):
+        raise TimeSlotNotFound(f"Could not find table {table_name} in the database.")
+    if columns is None:
+        selected = '*'
+    else:
+        selected = ', '.join(['"Grid ID"'] + [quote_identifier(col) for col in columns])
+    sql_query = f'SELECT {selected} FROM {quote_identifier(table_name)}'
+    params = ()
+    if grid_ids is not None:
+        sql_query += ' WHERE "Grid ID" IN (SELECT value FROM json_each(?))'
+        params = (grid_ids,)
+    return pd.read_sql_query(sql_query, conn, params=params)
+
+
+def read_time_series(conn, kind, column, months, days, hours, grid_ids=None):
+    """Yield ((month, day, hour), DataFrame) for every time slot of ``months`` x ``days`` x ``hours``.
+
+    Slots come in sorted order, each with a "Grid ID" column and ``column``;
+    slots without stored rows are empty. The long-format table is read with
+    one query whose rows are streamed from the cursor, through the
+    (grid_id, month, day, hour) index when ``grid_ids`` is given. Legacy
+    databases are read slot by slot on the same connection.
+    """
+    months, days, hours = sorted(int(month) for month in months), sorted(days), sorted(int(hour) for hour in hours)
+    slots = list(itertools.product(months, days, hours))
+    empty = pd.DataFrame({'Grid ID': [], column: []})
+
+    if not is_long_format(conn):
+        for slot in slots:
+            try:
+                yield slot, read_time_slot(conn, kind, *slot, [column], grid_ids)
+            except TimeSlotNotFound:
+                yield slot, empty
+        return
+
+    table_name = LONG_FORMAT_TABLES[kind]
+    grid_id_index = f'idx_{table_name}_grid_id'
+    sql_query = f'SELECT month, day, hour, grid_id, {quote_identifier(column)} FROM {table_name}'
+    params = (json.dumps(months), json.dumps(days), json.dumps(hours))
+    if grid_ids is not None and _index_exists(conn, grid_id_index):
+        sql_query += f' INDEXED BY {grid_id_index}'
+    sql_query += (
+        ' WHERE month IN (SELECT value FROM json_each(?)) AND day IN (SELECT value FROM json_each(?))'
+        ' AND hour IN (SELECT value FROM json_each(?))'
+    )
+    if grid_ids is not None:
+        sql_query += ' AND grid_id IN (SELECT value FROM json_each(?))'
+        params += (json.dumps([_json_value(grid_id) for grid_id in grid_ids]),)
+    cursor = conn.execute(sql_query + ' ORDER BY month, day, hour, grid_id', params)
+
+    rows = itertools.chain.from_iterable(iter(lambda: cursor.fetchmany(TIME_SERIES_FETCH_ROWS), []))
+    groups = itertools.groupby(rows, key=lambda row: row[:3])
+    group = next(groups, None)
+    for slot in slots:
+        if group is None or group[0] != slot:
+            yield slot, empty
+            continue
+        yield slot, pd.DataFrame.from_records([row[3:] for row in group[1]], columns=['Grid ID', column])
+        group = next(groups, None)
+
+
+def _index_exists(conn, index_name):
+    cur = conn.execute("SELECT 1 FROM sqlite_master WHERE type='index' AND name=?", (index_name,))
+    return cur.fetchone() is not None
+
+
+def exists_time_slot(conn, kind, month, day, hour):
+    cur = conn.execute(
+        f'SELECT 1 FROM {TIME_SLOTS_TABLE} WHERE kind = ? AND month = ? AND day = ? AND hour = ?',
+        (kind, int(month), day, int(hour))
+    )
+    return cur.fetchone() is not None
+
+
+def _json_value(value):
+    # numpy scalars are not JSON serialisable
+    return value.item() if hasattr(value, 'item') else value
+
+
+def list_time_slots(conn, kind):
+    # Sorted (month, day, hour) tuples available for this kind
+    if is_long_format(conn):
+        cur = conn.execute(f"SELECT month, day, hour FROM {TIME_SLOTS_TABLE} WHERE kind = ?", (kind,))
+        return sorted(cur.fetchall())
+
+    cur = conn.execute("SELECT name FROM sqlite_master WHERE type='table' AND name LIKE ?", (kind + '_Month_%',))
+    return sorted(parse_time_slot(name) for (name,) in cur.fetchall())
+
+
+def create_long_format_tables(conn, kind, columns):
+    """Create the long-format table for ``kind`` from (name, SQL type) pairs.
+
+    ``columns`` must include "Grid ID", which becomes the ``grid_id`` key.
+    Air pollution rows are narrow, so they are clustered on the key in a
+    WITHOUT ROWID table; feature vector rows carry ~180 values, which is too
+    wide for that layout, so they use a rowid table with a unique key index.
+    """
+    table_name = LONG_FORMAT_TABLES[kind]
+    column_types = dict(columns)
+    definitions = [
+        'month INTEGER NOT NULL',
+        'day TEXT NOT NULL',
+        'hour INTEGER NOT NULL',
+        f'grid_id {column_types.pop("Grid ID")} NOT NULL',
+    ]
+    definitions += [f'{quote_identifier(col)} {col_type}' for col, col_type in column_types.items()]
+
+    if kind == AIR_POLLUTION_CONCENTRATION:
+        conn.execute(
+            f'CREATE TABLE {table_name} ({", ".join(definitions)}, '
+            f'PRIMARY KEY (month, day, hour, grid_id)) WITHOUT ROWID;'
+        )
+    else:
+        conn.execute(f'CREATE TABLE {table_name} ({", ".join(definitions)});')
+
+    conn.execute(f'''
+    CREATE TABLE IF NOT EXISTS {TIME_SLOTS_TABLE} (
+        kind TEXT NOT NULL,
+        month INTEGER NOT NULL,
+        day TEXT NOT NULL,
+        hour INTEGER NOT NULL,
+        source TEXT,
+        num_rows INTEGER,
+        PRIMARY KEY (kind, month, day, hour)
+    ) WITHOUT ROWID;
+    ''')
+
+
+def create_long_format_indexes(conn, kind):
+    table_name = LONG_FORMAT_TABLES[kind]
+    if kind != AIR_POLLUTION_CONCENTRATION:
+        conn.execute(
+            f'CREATE UNIQUE INDEX IF NOT EXISTS idx_{table_name}_slot '
+            f'ON {table_name} (month, day, hour, grid_id);'
+        )
+    # Cross-slot reads for a set of cells
+    conn.execute(f'CREATE INDEX IF NOT EXISTS idx_{table_name}_grid_id ON {table_name} (grid_id, month, day, hour);')
+
+
+def count_time_slots(conn):
+    # Number of time slots per kind, e.g. {"feature_vector": 2016, ...}
+    return {kind: len(list_time_slots(conn, kind)) for kind in LONG_FORMAT_TABLES}
@@ -0,0 +1,146 @@
+import json
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+import database
+
+# Suffix of cube files written but not yet moved into place
+STAGED_SUFFIX = '.tmp'
+
+
+def feature_cube_paths(db_path):
+    # Sidecar files next to the database: the float32 cube and its axis labels
+    root = os.path.splitext(db_path)[0]
+    return root + '.features.npy', root + '.features.json'
+
+
+class FeatureCube:
+    """Memory-mapped float32 feature vectors, shaped (time slot, grid cell, feature column).
+
+    The cube is opened read-only with ``mmap_mode='r'``, so slicing a time slot
+    is a view onto the page cache that every worker process shares. It is
+    re-opened when the cube or meta file changes, once both are from the
+    same build.
+    """
+
+    def __init__(self, db_path):
+        self.cube_file, self.meta_file = feature_cube_paths(db_path)
+        self._lock = threading.Lock()
+        self._state = None
+        self._version = None
+
+    def available(self):
+        return os.path.exists(self.cube_file) and os.path.exists(self.meta_file) and self._load() is not None
+
+    def _load(self):
+        # The meta records the size and mtime of the cube written with it; while a rebuild is swapping the
+        # two files they do not match, and the cube already open is kept (or None returned, if there is none)
+        try:
+            version = (os.stat(self.cube_file).st_mtime_ns, os.stat(self.meta_file).st_mtime_ns)
+        except FileNotFoundError:
+            return self._state
+        with self._lock:
+            if self._state is None or version != self._version:
+                with open(self.meta_file) as f:
+                    meta = json.load(f)
+                # Stat around the load, so a cube swapped in between is not taken for the one that was checked
+                before = os.stat(self.cube_file)
+                cube = np.load(self.cube_file, mmap_mode='r')
+                after = os.stat(self.cube_file)
+                if before.st_ino != after.st_ino or ('cube' in meta and meta['cube'] != [after.st_size, after.st_mtime_ns]):
+                    return self._state
+                self._state = {
+                    'cube': cube,
+                    'columns': meta['columns'],
+                    'column_index': {col: i for i, col in enumerate(meta['columns'])},
+                    'grid_ids': np.asarray(meta['grid_ids']),
+                    'slot_index': {tuple(slot): i for i, slot in enumerate(meta['time_slots'])},
+                }
+                self._version = version
+            return self._state
+
+    @property
+    def columns(self):
+        return self._load()['columns']
+
+    @property
+    def grid_ids(self):
+        return self._load()['grid_ids']
+
+    def has_columns(self, columns):
+        column_index = self._load()['column_index']
+        return all(col in column_index for col in columns)
+
+    def slot(self, month, day, hour):
+        # (grid cell, feature column) view of one time slot, without copying
+        state = self._load()
+        index = state['slot_index'].get((int(month), day, int(hour)))
+        if index is None:
+            raise database.TimeSlotNotFound(f"No feature vectors for Month {month}, Day {day}, Hour {hour}.")
+        return state['cube'][index]
+
+    def frame(self, month, day, hour, columns=None, grid_ids=None, grid_id_column='Grid ID'):
+        # DataFrame over the cube slice, with the grid ids as the first column
+        state = self._load()
+        values = self.slot(month, day, hour)
+        frame_grid_ids = state['grid_ids']
+        if grid_ids is not None:
+            # Only the requested cells; fancy indexing copies just those rows
+            rows = np.flatnonzero(np.isin(frame_grid_ids, list(grid_ids)))
+            values = values[rows]
+            frame_grid_ids = frame_grid_ids[rows]
+        if columns is None:
+            frame = pd.DataFrame(values, columns=state['columns'], copy=False)
+        else:
+            frame = pd.DataFrame(
+                {col: values[:, state['column_index'][col]] for col in columns}, copy=False
+            )
+        frame.insert(0, grid_id_column, frame_grid_ids)
+        return frame
+
+
+def write_feature_cube(conn, db_path, columns):
+    """Write the feature vectors of every time slot in ``conn`` to staged sidecar files for ``db_path``.
+
+    Only ``columns`` present in the feature vector table are stored. The files
+    get temporary names until replace_feature_cube moves them into place, so
+    the cube can be built from a database that is not live yet and swapped
+    in with it. Returns the staged cube file.
+    """
+    cube_file, meta_file = feature_cube_paths(db_path)
+    available = set(database.value_columns(conn, database.FEATURE_VECTOR))
+    columns = [col for col in columns if col in available]
+    time_slots = database.list_time_slots(conn, database.FEATURE_VECTOR)
+    grid_ids = [row[0] for row in conn.execute(
+        f'SELECT DISTINCT grid_id FROM {database.FEATURE_VECTOR_TABLE} ORDER BY grid_id;'
+    )]
+
+    # np.save-compatible file, written slot by slot through a memory map
+    cube = np.lib.format.open_memmap(
+        cube_file + STAGED_SUFFIX, mode='w+', dtype=np.float32, shape=(len(time_slots), len(grid_ids), len(columns))
+    )
+    for i, (month, day, hour) in enumerate(time_slots):
+        data = database.read_time_slot(conn, database.FEATURE_VECTOR, month, day, hour, columns)
+        data = data.set_index('Grid ID').reindex(grid_ids)
+        cube[i] = data[columns].to_numpy(dtype=np.float32)
+    cube.flush()
+    del cube
+
+    # Written after the cube, with the size and mtime that pair it with this cube (os.replace keeps both)
+    stat = os.stat(cube_file + STAGED_SUFFIX)
+    with open(meta_file + STAGED_SUFFIX, 'w') as f:
+        json.dump({
+            'columns': columns, 'grid_ids': grid_ids, 'time_slots': time_slots,
+            'cube': [stat.st_size, stat.st_mtime_ns],
+        }, f)
+    return cube_file + STAGED_SUFFIX
+
+
+def replace_feature_cube(db_path):
+    # Cube first, then its meta; readers keep the cube they have open until the two match again
+    cube_file, meta_file = feature_cube_paths(db_path)
+    os.replace(cube_file + STAGED_SUFFIX, cube_file)
+    os.replace(meta_file + STAGED_SUFFIX, meta_file)
@@ -7,10 +7,23 @@ from reportlab.lib import colors
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, Image
 import matplotlib.pyplot as plt
-import geopandas as gpd
-import pandas as pd
 import sqlite3
-import numpy as np
+import os
+import hashlib
+import shutil
+import tempfile
+
+from grid_store import get_grid_store
+import database
+
+# Reprojected and simplified grid geometry, shared with the API when run in the same process
+GPKG_FILE = os.environ.get('EII_GPKG_FILE', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'raw_data', 'uk_1km_landGrids_3395_london.gpkg'))
+DATABASE_FILE = os.environ.get('EII_DATABASE_FILE', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'database.db'))
+grid_store = get_grid_store(GPKG_FILE, database_file=DATABASE_FILE)
+
+# Rendered baseline maps shared by every report, keyed by column, time slot and data version
+MAP_CACHE_DIR = os.environ.get('EII_REPORT_MAP_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'eii-report-maps'))
+MAP_CACHE_MAX_FILES = 2000
 
 def get_dummy_data():
     # Default values for testing
@@ -40,8 +53,71 @@ def get_dummy_data():
 
     return dummy_data
 
-def process_data(data):
-    # Simulated processing logic
+class ReportContext:
+    """Everything one report reads, loaded in a single pass.
+
+    One SQLite connection reads the feature and pollution columns of the
+    time slot. The grid geometry comes from the shared store and is merged
+    with the values only when a map has to be drawn.
+    """
+
+    def __init__(self, data):
+        self.feature_column = data['selectedFeatureVector']
+        self.pollution_column = f"{data['selectedAirPollution']} Prediction 0.5"
+        self.month = data['selectedMonth']
+        self.day = data['selectedDay']
+        self.hour = int(data['selectedHour'].split(':')[0])
+
+        conn = sqlite3.connect(DATABASE_FILE)
+        try:
+            feature_data = database.read_time_slot(
+                conn, database.FEATURE_VECTOR, self.month, self.day, self.hour, [self.feature_column]
+            )
+            pollution_data = database.read_time_slot(
+                conn, database.AIR_POLLUTION_CONCENTRATION, self.month, self.day, self.hour, [self.pollution_column]
+            )
+        finally:
+            conn.close()
+        self.values = feature_data.merge(pollution_data, on='Grid ID', how='outer')
+        self._merged_data = None
+
+    @property
+    def merged_data(self):
+        # Values on the cached, simplified grid, merged once for both maps
+        if self._merged_data is None:
+            self._merged_data = grid_store.merge(self.values)
+        return self._merged_data
+
+    def map_key(self, column):
+        # Maps depend on the column, the time slot and the data and geometry they are drawn from
+        version = tuple(os.path.getmtime(path) for path in (DATABASE_FILE, GPKG_FILE))
+        return (column, int(self.month), self.day, self.hour, version)
+
+def cached_map(key, output_file, render):
+    # Copy a map from the shared PNG cache, drawing it with render(path) first on a miss
+    cache_file = os.path.join(MAP_CACHE_DIR, hashlib.sha256(repr(key).encode()).hexdigest() + '.png')
+    if not os.path.exists(cache_file):
+        os.makedirs(MAP_CACHE_DIR, exist_ok=True)
+        tmp_file = f"{cache_file}.{os.getpid()}.tmp.png"
+        render(tmp_file)
+        os.replace(tmp_file, cache_file)
+        prune_map_cache()
+    shutil.copyfile(cache_file, output_file)
+
+def prune_map_cache():
+    # Keep the most recently drawn MAP_CACHE_MAX_FILES maps
+    files = [os.path.join(MAP_CACHE_DIR, name) for name in os.listdir(MAP_CACHE_DIR) if name.endswith('.png') and '.tmp' not in name]
+    if len(files) <= MAP_CACHE_MAX_FILES:
+        return
+    files.sort(key=os.path.getmtime)
+    for path in files[:len(files) - MAP_CACHE_MAX_FILES]:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+def process_data(data, output_dir='.'):
+    # Simulated processing logic; maps and plots are written to output_dir
     report = {
         "summary": "This is a sample report generated from dummy data",
         "details": {
@@ -52,15 +128,23 @@ def process_data(data):
             "changes": data['changes'],
             "sliderValue": data['sliderValue'],
             "modelType": "All feature vector",
-            "comparisonMaps": ["feature_vector_map.png", "air_pollution_map.png"],
+            "comparisonMaps": [
+                os.path.join(output_dir, "feature_vector_map.png"),
+                os.path.join(output_dir, "air_pollution_map.png"),
+            ],
+            "histogram": os.path.join(output_dir, "histogram.png"),
             "histogramChanges": list(data["changes"].values())
         }
     }
 
+    # Read the report's data once and share it between the maps and the analysis
+    context = ReportContext(data)
+
     # Generate plots and maps
-    generate_feature_vector_map(data)
-    least_polluted, most_polluted = generate_air_pollution_map(data)
-    generate_histogram(data['changes'])
+    generate_feature_vector_map(context, output_dir)
+    generate_air_pollution_map(context, output_dir)
+    least_polluted, most_polluted = find_pollution_extremes(context)
+    generate_histogram(data['changes'], output_dir)
 
     # Add pollution analysis to the report
     report["details"]["pollutionAnalysis"] = {
@@ -71,87 +155,47 @@ def process_data(data):
 
     return report
 
-def generate_feature_vector_map(data):
-    # Connect to the database and query the data
-    conn = sqlite3.connect('data/database.db')
-    feature_column = data['selectedFeatureVector']
-    month = data['selectedMonth']
-    day = data['selectedDay']
-    hour = int(data['selectedHour'].split(':')[0])
-    
-    query = f'''
-        SELECT "Grid ID", "{feature_column}"
-        FROM feature_vector_Month_{month}_Day_{day}_Hour_{hour}
-    '''
-    feature_data = pd.read_sql(query, conn)
-    conn.close()
-
-    # Read the GeoPackage file for the grids layer
-    grids = gpd.read_file('data/raw_data/uk_1km_landGrids_3395_london.gpkg')
-    grids = grids.to_crs(epsg=4326)
-
-    # Merge the feature data with the grids
-    merged_data = grids.merge(feature_data, on='Grid ID')
-    merged_data = merged_data.to_crs(epsg=4326)
-    merged_data['geometry'] = merged_data['geometry'].simplify(0.001, preserve_topology=True)
-
-    # Plot the feature vector map
-    fig, ax = plt.subplots(1, 1, figsize=(10, 6))
-    merged_data.plot(column=feature_column, ax=ax, legend=True, cmap='OrRd')
-    plt.title("Feature Vector Map")
-    plt.savefig("feature_vector_map.png")
-    plt.close()
-
-def generate_air_pollution_map(data):
-    # Connect to the database and query the data
-    conn = sqlite3.connect('data/database.db')
-    pollution_column = f"{data['selectedAirPollution']} Prediction 0.5"
-    month = data['selectedMonth']
-    day = data['selectedDay']
-    hour = int(data['selectedHour'].split(':')[0])
-    
-    query = f'''
-        SELECT "Grid ID", "{pollution_column}"
-        FROM air_pollution_concentration_Month_{month}_Day_{day}_Hour_{hour}
-    '''
-    pollution_data = pd.read_sql(query, conn)
-    conn.close()
-
-    # Read the GeoPackage file for the grids layer
-    grids = gpd.read_file('data/raw_data/uk_1km_landGrids_3395_london.gpkg')
-    grids = grids.to_crs(epsg=4326)
-
-    # Merge the pollution data with the grids
-    merged_data = grids.merge(pollution_data, on='Grid ID')
-    merged_data = merged_data.to_crs(epsg=4326)
-    merged_data['geometry'] = merged_data['geometry'].simplify(0.001, preserve_topology=True)
-
-    # Find the least and most polluted areas
-    least_polluted_idx = merged_data[pollution_column].idxmin()
-    most_polluted_idx = merged_data[pollution_column].idxmax()
-
-    least_polluted = {
-        'location': merged_data.loc[least_polluted_idx, 'Grid ID'],
-        'lat': merged_data.loc[least_polluted_idx, 'geometry'].centroid.y,
-        'long': merged_data.loc[least_polluted_idx, 'geometry'].centroid.x
-    }
-
-    most_polluted = {
-        'location': merged_data.loc[most_polluted_idx, 'Grid ID'],
-        'lat': merged_data.loc[most_polluted_idx, 'geometry'].centroid.y,
-        'long': merged_data.loc[most_polluted_idx, 'geometry'].centroid.x
-    }
-
-    # Plot the air pollution map
-    fig, ax = plt.subplots(1, 1, figsize=(10, 6))
-    merged_data.plot(column=pollution_column, ax=ax, legend=True, cmap='Blues')
-    plt.title("Air Pollution Map")
-    plt.savefig("air_pollution_map.png")
-    plt.close()
-
+def generate_feature_vector_map(context, output_dir='.'):
+    def render(path):
+        # Plot the feature vector map
+        fig, ax = plt.subplots(1, 1, figsize=(10, 6))
+        context.merged_data.plot(column=context.feature_column, ax=ax, legend=True, cmap='OrRd')
+        plt.title("Feature Vector Map")
+        plt.savefig(path)
+        plt.close()
+
+    cached_map(
+        ('feature_vector',) + context.map_key(context.feature_column),
+        os.path.join(output_dir, "feature_vector_map.png"), render
+    )
+
+def generate_air_pollution_map(context, output_dir='.'):
+    def render(path):
+        # Plot the air pollution map
+        fig, ax = plt.subplots(1, 1, figsize=(10, 6))
+        context.merged_data.plot(column=context.pollution_column, ax=ax, legend=True, cmap='Blues')
+        plt.title("Air Pollution Map")
+        plt.savefig(path)
+        plt.close()
+
+    cached_map(
+        ('air_pollution',) + context.map_key(context.pollution_column),
+        os.path.join(output_dir, "air_pollution_map.png"), render
+    )
+
+def find_pollution_extremes(context):
+    # Least and most polluted cells, with the centroids of just those two cells
+    pollution = context.values.set_index('Grid ID')[context.pollution_column]
+    cells = [pollution.idxmin(), pollution.idxmax()]
+    centroids = grid_store.level().loc[cells].geometry.centroid
+
+    least_polluted, most_polluted = (
+        {'location': grid_id, 'lat': centroid.y, 'long': centroid.x}
+        for grid_id, centroid in zip(cells, centroids)
+    )
     return least_polluted, most_polluted
 
-def generate_histogram(changes):
+def generate_histogram(changes, output_dir='.'):
     # Generate a histogram
     features = list(changes.keys())
     values = list(changes.values())
@@ -162,7 +206,7 @@ def generate_histogram(changes):
     plt.ylabel('Change (%)')
     plt.title('Histogram of Changes')
     plt.xticks(rotation=45, ha='right')
-    plt.savefig('histogram.png')
+    plt.savefig(os.path.join(output_dir, 'histogram.png'))
     plt.close()
 
 def generate_pdf_report(report, filename):
@@ -245,7 +289,7 @@ def generate_pdf_report(report, filename):
     histogram_title = Paragraph("Histogram of Changes:", styles['Heading2'])
     elements.append(histogram_title)
     elements.append(Spacer(1, 12))
-    elements.append(Image('histogram.png', width=400, height=300))
+    elements.append(Image(details['histogram'], width=400, height=300))
     elements.append(Spacer(1, 12))
 
     # Pollution Analysis
@@ -0,0 +1,50 @@
+import json
+
+import numpy as np
+import shapely
+
+# Features formatted and sent per chunk of a streamed FeatureCollection
+FEATURE_CHUNK_SIZE = 5000
+
+
+def geometry_fragments(geometries):
+    # GeoJSON text of each geometry, encoded once and reused by every response
+    fragments = shapely.to_geojson(np.asarray(geometries))
+    return np.array(['null' if fragment is None else fragment for fragment in fragments], dtype=object)
+
+
+def grid_order(grid_ids, values):
+    """Rows of ``values`` that have a grid cell, in grid order, and each row's grid position.
+
+    Matches an inner merge of ``values`` onto the grid on "Grid ID".
+    """
+    positions = grid_ids.get_indexer(values['Grid ID'])
+    keep = positions >= 0
+    order = np.argsort(positions[keep], kind='stable')
+    return values[keep].iloc[order].reset_index(drop=True), positions[keep][order]
+
+
+def feature_collection(fragments, values, positions, chunk_size=FEATURE_CHUNK_SIZE):
+    """Yield a GeoJSON FeatureCollection as text, ``chunk_size`` features at a time.
+
+    Features are laid out as GeoDataFrame.to_json() writes them, with
+    ``values`` as the properties and the pre-encoded geometry fragment of
+    each row's grid position. Only one chunk of properties is formatted at
+    a time, so memory does not grow with the grid.
+    """
+    yield '{"type": "FeatureCollection", "features": ['
+    for start in range(0, len(values), chunk_size):
+        chunk = values.iloc[start:start + chunk_size]
+        records = chunk.to_json(orient='records', lines=True).splitlines()
+        features = [
+            f'{{"id": "{start + i}", "type": "Feature", "properties": {record}, "geometry": {fragments[position]}}}'
+            for i, (record, position) in enumerate(zip(records, positions[start:start + chunk_size]))
+        ]
+        yield (', ' if start else '') + ', '.join(features)
+    yield ']}'
+
+
+def json_string(chunks):
+    # The chunks of a document, escaped as the contents of one JSON string; escaping never spans chunks
+    for chunk in chunks:
+        yield json.dumps(chunk)[1:-1]
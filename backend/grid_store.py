@@ -0,0 +1,198 @@
+import os
+import sqlite3
+import threading
+
+import pandas as pd
+
+import database
+import geojson_stream
+import timings
+
+# Tolerance (in degrees) used to simplify the grid cells for display
+SIMPLIFY_TOLERANCE = 0.001
+
+# Levels of detail the builder stores, as (lowest map zoom served, tolerance in degrees).
+# Each tolerance is roughly half a 256px tile pixel at that zoom; the last level is unsimplified.
+GEOMETRY_LEVELS = ((0, 0.005), (9, SIMPLIFY_TOLERANCE), (11, 0.0002), (13, 0.0))
+
+
+def level_for_zoom(levels, zoom=None):
+    # Level whose zoom range holds ``zoom``; without a zoom, the level simplified at SIMPLIFY_TOLERANCE
+    if zoom is None:
+        return next((level for level, (_, tolerance) in levels.items() if tolerance == SIMPLIFY_TOLERANCE), None)
+    return max((level for level, (min_zoom, _) in levels.items() if min_zoom <= zoom), default=min(levels))
+
+
+class GridStore:
+    """Reprojected and simplified grid geometry, loaded once and shared per process.
+
+    The GeoPackage is read lazily on first use and re-read only when its
+    modification time changes. Callers must treat the returned GeoDataFrame
+    as read-only; merging values onto it returns a new frame.
+
+    With a ``database_file`` built with geometry levels, ``level(zoom)`` serves
+    the EPSG:4326 geometry the builder simplified for that zoom, so requests
+    never reproject or simplify. Without one it falls back to ``get()``.
+    """
+
+    def __init__(self, gpkg_file, epsg=4326, tolerance=SIMPLIFY_TOLERANCE, database_file=None):
+        self.gpkg_file = gpkg_file
+        self.epsg = epsg
+        self.tolerance = tolerance
+        self.database_file = database_file
+        self._lock = threading.Lock()
+        self._grids = None
+        self._mtime = None
+        self._geojson = {}
+        self._fragments = {}
+        self._levels = None
+        self._level_grids = {}
+        self._database_mtime = None
+
+    def _load(self):
+        import geopandas as gpd
+
+        # Read the GeoPackage file
+        with timings.stage('gpkg_load'):
+            grids = gpd.read_file(self.gpkg_file)
+
+        # Reproject, to EPSG:4326 (WGS 84) unless asked otherwise
+        with timings.stage('reproject'):
+            grids = grids.to_crs(epsg=self.epsg)
+
+        # Simplify geometry
+        if self.tolerance:
+            with timings.stage('simplify'):
+                grids['geometry'] = grids['geometry'].simplify(self.tolerance, preserve_topology=True)
+
+        # Index by Grid ID (unnamed, so merges on the "Grid ID" column stay unambiguous)
+        grids.index = pd.Index(grids['Grid ID'].values)
+        return grids
+
+    def get(self):
+        mtime = os.path.getmtime(self.gpkg_file)
+        with self._lock:
+            if self._grids is None or mtime != self._mtime:
+                self._grids = self._load()
+                self._mtime = mtime
+                self._geojson = {}
+                self._fragments = {}
+                self._level_grids = {}
+            return self._grids
+
+    def levels(self):
+        # {level: (lowest zoom, tolerance)} stored in the database, empty if there are none
+        if self.database_file is None or self.epsg != 4326 or not os.path.exists(self.database_file):
+            return {}
+        mtime = os.path.getmtime(self.database_file)
+        with self._lock:
+            if self._levels is None or mtime != self._database_mtime:
+                conn = sqlite3.connect(self.database_file)
+                try:
+                    if database.table_exists(conn, database.GEOMETRY_LEVELS_TABLE):
+                        rows = conn.execute(
+                            f'SELECT level, min_zoom, tolerance FROM {database.GEOMETRY_LEVELS_TABLE};'
+                        ).fetchall()
+                    else:
+                        rows = []
+                finally:
+                    conn.close()
+                self._levels = {level: (min_zoom, tolerance) for level, min_zoom, tolerance in rows}
+                self._level_grids = {}
+                self._geojson = {}
+                self._fragments = {}
+                self._database_mtime = mtime
+            return self._levels
+
+    def level(self, zoom=None):
+        # Precomputed geometry for a map zoom, in the same Grid ID order as get()
+        levels = self.levels()
+        level = level_for_zoom(levels, zoom) if levels else None
+        if level is None:
+            return self.get()
+
+        grid_ids = self.grid_ids()
+        with self._lock:
+            grids = self._level_grids.get(level)
+            if grids is None:
+                with timings.stage('geometry_level_load'):
+                    conn = sqlite3.connect(self.database_file)
+                    try:
+                        rows = conn.execute(
+                            f'SELECT grid_id, geometry FROM {database.GRID_GEOMETRIES_TABLE} WHERE level = ? ORDER BY position;',
+                            (level,)
+                        ).fetchall()
+                    finally:
+                        conn.close()
+                import geopandas as gpd
+
+                # The geometry carries the Grid ID index too, or the frame would align it with a RangeIndex
+                level_grid_ids = pd.Index([row[0] for row in rows])
+                grids = gpd.GeoDataFrame(
+                    {'Grid ID': level_grid_ids},
+                    geometry=gpd.GeoSeries.from_wkb([row[1] for row in rows], index=level_grid_ids, crs=4326),
+                    index=level_grid_ids,
+                )
+                # A GeoPackage changed since the build keeps its order; cells it lacks have no geometry
+                if not grids.index.equals(grid_ids):
+                    grids = grids.reindex(grid_ids)
+                    grids['Grid ID'] = grid_ids
+                self._level_grids[level] = grids
+            return grids
+
+    def grid_ids(self):
+        # The fixed Grid ID order that values endpoints are aligned to
+        return self.get().index
+
+    def _level_key(self, zoom=None):
+        levels = self.levels()
+        return level_for_zoom(levels, zoom) if levels else None
+
+    def geojson(self, zoom=None):
+        # Serialised geometry and Grid IDs in grid order, encoded once per load and level
+        grids = self.level(zoom)
+        key = self._level_key(zoom)
+        with self._lock:
+            if key not in self._geojson:
+                self._geojson[key] = grids[['Grid ID', 'geometry']].to_json().encode()
+            return self._geojson[key]
+
+    def geometry_fragments(self, zoom=None):
+        # GeoJSON text of each cell's geometry in grid order, encoded once per load and level
+        grids = self.level(zoom)
+        key = self._level_key(zoom)
+        with self._lock:
+            if key not in self._fragments:
+                with timings.stage('geometry_encode'):
+                    self._fragments[key] = geojson_stream.geometry_fragments(grids.geometry.values)
+            return self._fragments[key]
+
+    def stream_geojson(self, values, zoom=None):
+        # Chunks of the FeatureCollection that merge(values, zoom).to_json() would build, without building it
+        fragments = self.geometry_fragments(zoom)
+        with timings.stage('merge'):
+            values, positions = geojson_stream.grid_order(self.grid_ids(), values)
+        return timings.timed_iter('serialise', geojson_stream.feature_collection(fragments, values, positions))
+
+    def merge(self, values, zoom=None):
+        # Attach a "Grid ID"-keyed DataFrame of values to the cached geometry for this zoom
+        grids = self.level(zoom)
+        with timings.stage('merge'):
+            return grids.merge(values, left_on='Grid ID', right_on='Grid ID')
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_grid_store(gpkg_file, epsg=4326, tolerance=SIMPLIFY_TOLERANCE, database_file=None):
+    # One store per GeoPackage path, projection and database, shared by the API and the report generator
+    if database_file is not None:
+        database_file = os.path.abspath(database_file)
+    key = (os.path.abspath(gpkg_file), epsg, tolerance, database_file)
+    with _stores_lock:
+        store = _stores.get(key)
+        if store is None:
+            store = GridStore(key[0], epsg=epsg, tolerance=tolerance, database_file=database_file)
+            _stores[key] = store
+        return store
@@ -0,0 +1,39 @@
+# Production serving: gunicorn -c gunicorn.conf.py (from the backend directory, with gunicorn installed)
+#
+# The app is imported and warmed up once in the parent process, then forked into workers, so the grid geometry and
+# feature cube mapping are shared copy-on-write instead of being loaded once per worker. LightGBM boosters are the
+# exception: parsing one starts libgomp's OpenMP thread pool, which can hang workers forked after it, so each worker
+# loads its own after the fork.
+import gc
+import os
+
+wsgi_app = 'app:app'
+bind = os.environ.get('EII_BIND', '0.0.0.0:3000')
+workers = int(os.environ.get('EII_WORKERS', os.cpu_count() or 1))
+threads = int(os.environ.get('EII_THREADS', 4))
+worker_class = 'gthread'
+timeout = 600
+preload_app = True
+
+# Warm-up runs in when_ready below rather than in a thread, which would not survive the fork
+os.environ.setdefault('EII_WARM_UP', 'preload')
+
+# The collector writes to every object it scans, which would copy the parent's pages into each worker;
+# it stays off while the app loads and is frozen before workers fork
+gc.disable()
+
+
+def when_ready(server):
+    # Runs in the parent after the app is imported and before any worker is forked; nothing here may use OpenMP
+    import app
+    app.startup.run()
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    # Objects from the parent stay in the frozen generation; the worker collects only what it allocates itself
+    gc.enable()
+
+    # Boosters (with EII_PRELOAD_MODELS=1), in the background so the worker answers /status while they load
+    import app
+    app.worker_startup.start()
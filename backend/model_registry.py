@@ -0,0 +1,89 @@
+import os
+import re
+import threading
+from collections import OrderedDict
+from glob import glob
+
+import timings
+
+# Default memory budget for loaded boosters, in bytes
+DEFAULT_MEMORY_BUDGET = 1024 * 1024 * 1024
+
+MODEL_FILE_PATTERN = re.compile(
+    r'^dataset_(?P<dataset>.+)_quantile_regression_(?P<quantile>[0-9.]+)_air_pollutant_(?P<pollutant>.+)\.txt$'
+)
+
+
+class ModelRegistry:
+    """LRU cache of LightGBM boosters keyed by (pollutant, quantile, dataset).
+
+    The size of each model file stands in for the memory the parsed booster
+    occupies. Least recently used boosters are evicted once the total exceeds
+    the memory budget, and an entry is reloaded when its model file's mtime
+    changes.
+    """
+
+    def __init__(self, models_dir, memory_budget=DEFAULT_MEMORY_BUDGET):
+        self.models_dir = models_dir
+        self.memory_budget = memory_budget
+        self._lock = threading.Lock()
+        self._models = OrderedDict()
+        self._total_size = 0
+
+    def model_path(self, pollutant, quantile="0.5", dataset="All"):
+        return os.path.join(
+            self.models_dir, f"dataset_{dataset}_quantile_regression_{quantile}_air_pollutant_{pollutant}.txt"
+        )
+
+    def get(self, pollutant, quantile="0.5", dataset="All"):
+        key = (pollutant, quantile, dataset)
+        model_filepath = self.model_path(pollutant, quantile, dataset)
+        mtime = os.path.getmtime(model_filepath)
+
+        with self._lock:
+            entry = self._models.get(key)
+            if entry is not None and entry[1] == mtime:
+                self._models.move_to_end(key)
+                return entry[0]
+
+        # Parse the model outside the lock so other lookups are not blocked; lightgbm is imported on first use
+        import lightgbm as lgb
+        with timings.stage('model_load'):
+            model = lgb.Booster(model_file=model_filepath)
+        size = os.path.getsize(model_filepath)
+
+        with self._lock:
+            self._discard(key)
+            self._models[key] = (model, mtime, size)
+            self._total_size += size
+            # Evict least recently used boosters, always keeping the newest one
+            while self._total_size > self.memory_budget and len(self._models) > 1:
+                oldest_key = next(iter(self._models))
+                self._discard(oldest_key)
+        return model
+
+    def _discard(self, key):
+        entry = self._models.pop(key, None)
+        if entry is not None:
+            self._total_size -= entry[2]
+
+    def available(self, quantile="0.5", dataset="All"):
+        # Pollutants with a model file on disk for this quantile and dataset
+        pollutants = []
+        for model_filepath in glob(os.path.join(self.models_dir, '*.txt')):
+            match = MODEL_FILE_PATTERN.match(os.path.basename(model_filepath))
+            if match and match['quantile'] == quantile and match['dataset'] == dataset:
+                pollutants.append(match['pollutant'])
+        return sorted(pollutants)
+
+    def preload(self, quantile="0.5", dataset="All"):
+        for pollutant in self.available(quantile, dataset):
+            self.get(pollutant, quantile, dataset)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "models": ['/'.join(key) for key in self._models],
+                "total_size": self._total_size,
+                "memory_budget": self.memory_budget,
+            }
@@ -0,0 +1,113 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+# Default in-memory budget for cached responses, in bytes
+DEFAULT_CACHE_BYTES = 256 * 1024 * 1024
+
+# Decimal places kept when canonicalising feature vector changes
+CHANGE_DECIMALS = 2
+
+
+def canonical_changes(changes, decimals=CHANGE_DECIMALS):
+    # Sorted (feature, rounded change) pairs with no-op changes dropped
+    canonical = []
+    for feature, change in sorted(changes.items()):
+        change = round(float(change), decimals)
+        if change != 0:
+            canonical.append((feature, change))
+    return tuple(canonical)
+
+
+def scenario_key(pollutant, month, day, hour, changes, version=None):
+    # ``version`` identifies the data and model the result came from, e.g. their mtimes
+    return (pollutant, int(month), day, int(hour), canonical_changes(changes), version)
+
+
+class PredictionCache:
+    """LRU cache of serialised scenario responses under a byte budget.
+
+    With ``cache_dir`` set, entries are mirrored to disk and reloaded on the
+    next start, most recently used first, until the budget is full.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_CACHE_BYTES, cache_dir=None):
+        self.max_bytes = max_bytes
+        self.cache_dir = cache_dir
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+            self._load_from_disk()
+
+    def _path(self, digest):
+        return os.path.join(self.cache_dir, digest + '.json')
+
+    @staticmethod
+    def _digest(key):
+        return hashlib.sha256(json.dumps(key).encode()).hexdigest()
+
+    def _load_from_disk(self):
+        files = [os.path.join(self.cache_dir, name) for name in os.listdir(self.cache_dir) if name.endswith('.json')]
+        files.sort(key=os.path.getmtime, reverse=True)
+        for path in files:
+            size = os.path.getsize(path)
+            if self._total_bytes + size > self.max_bytes:
+                os.remove(path)
+                continue
+            with open(path, 'rb') as f:
+                value = f.read()
+            digest = os.path.basename(path)[:-len('.json')]
+            self._entries[digest] = value
+            self._entries.move_to_end(digest, last=False)
+            self._total_bytes += size
+
+    def get(self, key):
+        digest = self._digest(key)
+        with self._lock:
+            value = self._entries.get(digest)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(digest)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        if len(value) > self.max_bytes:
+            return
+        digest = self._digest(key)
+        with self._lock:
+            self._discard(digest)
+            self._entries[digest] = value
+            self._total_bytes += len(value)
+            while self._total_bytes > self.max_bytes:
+                self._discard(next(iter(self._entries)))
+            if self.cache_dir:
+                tmp_path = self._path(digest) + '.tmp'
+                with open(tmp_path, 'wb') as f:
+                    f.write(value)
+                os.replace(tmp_path, self._path(digest))
+
+    def _discard(self, digest):
+        value = self._entries.pop(digest, None)
+        if value is None:
+            return
+        self._total_bytes -= len(value)
+        if self.cache_dir and os.path.exists(self._path(digest)):
+            os.remove(self._path(digest))
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "total_bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
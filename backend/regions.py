@@ -0,0 +1,252 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from glob import glob
+
+import numpy as np
+import pandas as pd
+
+import spatial_index
+
+# Properties tried, in order, for the name of each region in a region set file
+REGION_NAME_COLUMNS = ('name', 'Name', 'NAME')
+REGION_SET_EXTENSIONS = ('.gpkg', '.geojson')
+
+DEFAULT_QUANTILES = (0.05, 0.25, 0.5, 0.75, 0.95)
+
+# Weight tables kept in memory per process
+DEFAULT_MAX_WEIGHT_TABLES = 64
+
+
+class RegionWeights:
+    """Cell-to-region weights as a sparse (region, cell) table, sorted by region.
+
+    ``cells`` are positions in the grid order and ``weights`` the fraction
+    of each cell's area inside the region, so an area-weighted aggregate is a
+    bincount over ``regions``.
+    """
+
+    def __init__(self, names, regions, cells, weights):
+        self.names = list(names)
+        self.regions = np.asarray(regions, dtype=np.int64)
+        self.cells = np.asarray(cells, dtype=np.int64)
+        self.weights = np.asarray(weights, dtype=np.float64)
+
+    def covered_positions(self):
+        # Grid positions of every cell any region touches, sorted; values are read for these only
+        return np.unique(self.cells)
+
+    def save(self, path):
+        np.savez(path, names=np.array(json.dumps(self.names)), regions=self.regions, cells=self.cells, weights=self.weights)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(json.loads(str(data['names'])), data['regions'], data['cells'], data['weights'])
+
+
+def list_region_sets(regions_dir):
+    if not os.path.isdir(regions_dir):
+        return []
+    return sorted(
+        os.path.splitext(os.path.basename(path))[0]
+        for extension in REGION_SET_EXTENSIONS for path in glob(os.path.join(regions_dir, '*' + extension))
+    )
+
+
+def region_set_path(regions_dir, name):
+    # Only plain names from the listing are accepted, never paths
+    if name not in list_region_sets(regions_dir):
+        raise ValueError(f"Unknown region set {name}.")
+    for extension in REGION_SET_EXTENSIONS:
+        path = os.path.join(regions_dir, name + extension)
+        if os.path.exists(path):
+            return path
+
+
+def read_region_set(path, epsg=spatial_index.GRID_EPSG):
+    # (names, geometries in the grid CRS) of a region set file
+    import geopandas as gpd
+
+    regions = gpd.read_file(path).to_crs(epsg=epsg)
+    name_column = next((col for col in REGION_NAME_COLUMNS if col in regions.columns), None)
+    names = regions[name_column].astype(str).tolist() if name_column else [str(i) for i in range(len(regions))]
+    return names, regions.geometry
+
+
+def parse_regions(geojson, epsg=spatial_index.GRID_EPSG):
+    """(names, geometries in the grid CRS) from a GeoJSON geometry, Feature or FeatureCollection in EPSG:4326."""
+    if geojson.get('type') == 'FeatureCollection':
+        features = geojson.get('features') or []
+    elif geojson.get('type') == 'Feature':
+        features = [geojson]
+    else:
+        features = [{'type': 'Feature', 'geometry': geojson, 'properties': {}}]
+    if not features:
+        raise ValueError("No region geometries given.")
+
+    import geopandas as gpd
+
+    try:
+        regions = gpd.GeoDataFrame.from_features(features, crs=4326)
+    except Exception as e:
+        raise ValueError(f"Invalid region GeoJSON: {e}")
+    if regions.geometry.isna().any() or not regions.geometry.geom_type.isin(['Polygon', 'MultiPolygon']).all():
+        raise ValueError("Regions must be Polygon or MultiPolygon geometries.")
+
+    name_column = next((col for col in REGION_NAME_COLUMNS if col in regions.columns), None)
+    names = regions[name_column].astype(str).tolist() if name_column else [str(i) for i in range(len(regions))]
+    return names, regions.geometry.to_crs(epsg=epsg)
+
+
+def regions_key(names, geometries):
+    # Content key of ad-hoc regions, so repeated polygons reuse their weight table
+    digest = hashlib.sha256(json.dumps(names).encode())
+    for wkb in geometries.to_wkb():
+        digest.update(wkb)
+    return digest.hexdigest()
+
+
+def compute_weights(conn, grids, names, geometries):
+    """Weight table of regions over ``grids`` (grid CRS, in grid order).
+
+    Candidate cells for each region come from the R*Tree on the grids table,
+    or from the grid's own spatial index if the database has none; each
+    candidate's weight is the share of its area inside the region.
+    """
+    grid_ids = grids.index
+    integer_ids = pd.api.types.is_integer_dtype(grid_ids.dtype)
+    cell_areas = grids.geometry.area.to_numpy()
+
+    regions, cells, weights = [], [], []
+    for region, geometry in enumerate(geometries):
+        candidate_ids = spatial_index.grid_ids_in_bbox(conn, geometry.bounds, integer_ids)
+        if candidate_ids is None:
+            positions = grids.sindex.query(geometry, predicate='intersects')
+        else:
+            positions = grid_ids.get_indexer(candidate_ids)
+            positions = positions[positions >= 0]
+        if positions.size == 0:
+            continue
+
+        overlap = grids.geometry.iloc[positions].intersection(geometry).area.to_numpy() / cell_areas[positions]
+        inside = overlap > 0
+        regions.append(np.full(inside.sum(), region))
+        cells.append(positions[inside])
+        weights.append(np.minimum(overlap[inside], 1.0))
+
+    if not regions:
+        return RegionWeights(names, [], [], [])
+    return RegionWeights(names, np.concatenate(regions), np.concatenate(cells), np.concatenate(weights))
+
+
+class RegionWeightCache:
+    """LRU of weight tables, mirrored to ``cache_dir`` as .npz files when set.
+
+    Keys include the region source and the grid version, so a changed region
+    file or GeoPackage gets a new table.
+    """
+
+    def __init__(self, cache_dir=None, max_entries=DEFAULT_MAX_WEIGHT_TABLES):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, key):
+        digest = hashlib.sha256(json.dumps(key, default=str).encode()).hexdigest()
+        return os.path.join(self.cache_dir, digest + '.npz')
+
+    def get(self, key, compute):
+        # Weight table for key, computed with compute() on a miss
+        with self._lock:
+            weights = self._entries.get(key)
+            if weights is not None:
+                self._entries.move_to_end(key)
+                return weights
+
+        if self.cache_dir and os.path.exists(self._path(key)):
+            weights = RegionWeights.load(self._path(key))
+        else:
+            weights = compute()
+            if self.cache_dir:
+                tmp_path = self._path(key)[:-len('.npz')] + f'.{os.getpid()}.tmp.npz'
+                weights.save(tmp_path)
+                os.replace(tmp_path, self._path(key))
+
+        with self._lock:
+            self._entries[key] = weights
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return weights
+
+
+def weighted_quantiles(values, weights, quantiles):
+    # Quantiles of values where each value counts in proportion to its weight
+    order = np.argsort(values)
+    values, weights = values[order], weights[order]
+    cumulative = (np.cumsum(weights) - 0.5 * weights) / weights.sum()
+    return np.interp(quantiles, cumulative, values)
+
+
+def aggregate(region_weights, values, quantiles=DEFAULT_QUANTILES, threshold=None):
+    """Area-weighted statistics of each region for every row of ``values``.
+
+    ``values`` is (time slots, covered cells), its columns aligned with
+    ``region_weights.covered_positions()``. Means and exceedance fractions
+    for all regions and time slots come from one bincount; the quantiles are
+    weighted by each cell's share of the region. Returns one list of
+    per-slot statistics per region.
+    """
+    values = np.atleast_2d(np.asarray(values, dtype=np.float64))
+    num_slots, num_regions = values.shape[0], len(region_weights.names)
+    local = np.searchsorted(region_weights.covered_positions(), region_weights.cells)
+
+    cell_values = values[:, local]
+    present = ~np.isnan(cell_values)
+    weights = region_weights.weights * present
+    filled = np.where(present, cell_values, 0.0)
+
+    # Flattened (slot, region) bins, so one bincount covers every slot
+    bins = (np.arange(num_slots)[:, None] * num_regions + region_weights.regions).ravel()
+
+    def weighted_sum(terms):
+        return np.bincount(bins, weights=terms.ravel(), minlength=num_slots * num_regions).reshape(num_slots, num_regions)
+
+    total_weight = weighted_sum(weights)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means = weighted_sum(weights * filled) / total_weight
+        exceedance = weighted_sum(weights * (filled > threshold)) / total_weight if threshold is not None else None
+
+    bounds = np.searchsorted(region_weights.regions, np.arange(num_regions + 1))
+    results = []
+    for region in range(num_regions):
+        start, end = bounds[region], bounds[region + 1]
+        slots = []
+        for slot in range(num_slots):
+            keep = present[slot, start:end]
+            region_values = cell_values[slot, start:end][keep]
+            if region_values.size == 0:
+                slots.append({"cells": 0})
+                continue
+            cell_weights = region_weights.weights[start:end][keep]
+            statistics = {
+                "cells": int(region_values.size),
+                "area_cells": float(cell_weights.sum()),
+                "mean": float(means[slot, region]),
+                "min": float(region_values.min()),
+                "max": float(region_values.max()),
+                "quantiles": dict(zip(
+                    (str(q) for q in quantiles),
+                    weighted_quantiles(region_values, cell_weights, quantiles).tolist()
+                )),
+            }
+            if exceedance is not None:
+                statistics["exceedance_fraction"] = float(exceedance[slot, region])
+            slots.append(statistics)
+        results.append({"name": region_weights.names[region], "time_slots": slots})
+    return results
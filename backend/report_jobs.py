@@ -0,0 +1,219 @@
+import hashlib
+import json
+import multiprocessing
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+# Reports rendered at once, seconds a finished report is kept, and seconds after which a claim is taken to
+# belong to a process that died
+DEFAULT_REPORT_WORKERS = 2
+DEFAULT_REPORT_TTL = 3600
+DEFAULT_CLAIM_TIMEOUT = 1800
+
+# Seconds between checks while waiting for a job rendered by another process
+WAIT_INTERVAL = 0.5
+
+REPORT_FILENAME = 'pdf_report.pdf'
+CLAIM_FILENAME = 'claim'
+ERROR_FILENAME = 'error.txt'
+JOB_ID_PATTERN = re.compile(r'[0-9a-f]{64}')
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+
+def report_key(data, version=None):
+    # Content key of a report request; ``version`` identifies the data it is rendered from
+    payload = json.dumps([data, version], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def render_report(data, output_dir):
+    # Runs in a worker process, which is the only place the report stack (matplotlib, reportlab) is imported
+    import generate_pdf
+
+    # Each attempt renders into its own directory, and only the finished PDF is moved into place
+    render_dir = tempfile.mkdtemp(prefix='render-', dir=output_dir)
+    try:
+        report = generate_pdf.process_data(data, render_dir)
+        tmp_file = os.path.join(render_dir, REPORT_FILENAME)
+        generate_pdf.generate_pdf_report(report, tmp_file)
+        os.replace(tmp_file, os.path.join(output_dir, REPORT_FILENAME))
+    finally:
+        shutil.rmtree(render_dir, ignore_errors=True)
+
+
+class ReportJobs:
+    """Report rendering in a bounded process pool, with one output directory per job.
+
+    A job's ID is the content key of its request, so identical requests share
+    one job and a finished PDF is reused until it is ``ttl`` seconds old.
+    Jobs are claimed with a file created exclusively in their directory, and
+    failures are recorded next to it, so every server process sharing
+    ``report_dir`` sees one render per job and can report its status. A
+    claim older than ``claim_timeout`` seconds is taken to belong to a
+    process that died, and the job can be claimed again.
+    """
+
+    def __init__(self, report_dir, max_workers=DEFAULT_REPORT_WORKERS, ttl=DEFAULT_REPORT_TTL,
+                 claim_timeout=DEFAULT_CLAIM_TIMEOUT):
+        self.report_dir = report_dir
+        self.max_workers = max_workers
+        self.ttl = ttl
+        self.claim_timeout = claim_timeout
+        self._lock = threading.Lock()
+        self._executor = None
+        self._jobs = {}
+        os.makedirs(report_dir, exist_ok=True)
+
+    def job_dir(self, job_id):
+        return os.path.join(self.report_dir, job_id)
+
+    def pdf_path(self, job_id):
+        return os.path.join(self.job_dir(job_id), REPORT_FILENAME)
+
+    def claim_path(self, job_id):
+        return os.path.join(self.job_dir(job_id), CLAIM_FILENAME)
+
+    def error_path(self, job_id):
+        return os.path.join(self.job_dir(job_id), ERROR_FILENAME)
+
+    def _claimed(self, job_id):
+        # Whether some process is rendering the job, going by its claim file
+        try:
+            return os.path.getmtime(self.claim_path(job_id)) >= time.time() - self.claim_timeout
+        except FileNotFoundError:
+            return False
+
+    def _claim(self, job_id):
+        # Exclusive creation of the claim file; only one process sharing report_dir gets it
+        os.makedirs(self.job_dir(job_id), exist_ok=True)
+        if os.path.exists(self.claim_path(job_id)) and not self._claimed(job_id):
+            try:
+                os.remove(self.claim_path(job_id))
+            except FileNotFoundError:
+                pass
+        try:
+            fd = os.open(self.claim_path(job_id), os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            return False
+        os.write(fd, str(os.getpid()).encode())
+        os.close(fd)
+        return True
+
+    def _finish(self, job_id, future):
+        # Record a failure for every process to see, then release the claim
+        if future.exception() is not None:
+            with open(self.error_path(job_id), 'w') as f:
+                f.write(str(future.exception()))
+        try:
+            os.remove(self.claim_path(job_id))
+        except FileNotFoundError:
+            pass
+
+    def submit(self, data, version=None):
+        job_id = report_key(data, version)
+        self.evict_expired()
+        with self._lock:
+            future = self._jobs.get(job_id)
+            in_flight_or_done = future is not None and not (future.done() and future.exception() is not None)
+            if in_flight_or_done or os.path.exists(self.pdf_path(job_id)):
+                return job_id
+
+            # New request, or a retry of a failed one, unless another process is rendering it
+            if not self._claim(job_id):
+                return job_id
+            try:
+                os.remove(self.error_path(job_id))
+            except FileNotFoundError:
+                pass
+            if self._executor is None:
+                # Spawned, not forked: a forked worker would inherit locks other threads hold, such as GridStore's
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers, mp_context=multiprocessing.get_context('spawn')
+                )
+            try:
+                future = self._executor.submit(render_report, data, self.job_dir(job_id))
+            except Exception:
+                os.remove(self.claim_path(job_id))
+                raise
+            self._jobs[job_id] = future
+        future.add_done_callback(lambda future: self._finish(job_id, future))
+        return job_id
+
+    def status(self, job_id):
+        # {"status": ...} for a job, with "error" if it failed; None if unknown or expired
+        if not JOB_ID_PATTERN.fullmatch(job_id):
+            return None
+        with self._lock:
+            future = self._jobs.get(job_id)
+        if future is not None:
+            if not future.done():
+                return {"status": RUNNING if future.running() else QUEUED}
+            if future.exception() is not None:
+                return {"status": FAILED, "error": str(future.exception())}
+        if os.path.exists(self.pdf_path(job_id)):
+            return {"status": DONE}
+        if self._claimed(job_id):
+            # Rendered by another process sharing report_dir
+            return {"status": RUNNING}
+        try:
+            with open(self.error_path(job_id)) as f:
+                return {"status": FAILED, "error": f.read()}
+        except FileNotFoundError:
+            return None
+
+    def wait(self, job_id, timeout=None):
+        # Block until a job finishes, in this process or another; re-raises its error
+        with self._lock:
+            future = self._jobs.get(job_id)
+        if future is not None:
+            future.result(timeout)
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            status = self.status(job_id)
+            if status is None:
+                raise FileNotFoundError(f"Unknown or expired report job {job_id}.")
+            if status["status"] == DONE:
+                return self.pdf_path(job_id)
+            if status["status"] == FAILED:
+                raise RuntimeError(status["error"])
+            if deadline is not None and time.monotonic() >= deadline:
+                raise TimeoutError(f"Report job {job_id} did not finish within {timeout} seconds.")
+            time.sleep(WAIT_INTERVAL)
+
+    def evict_expired(self):
+        # Releasing the claim is a job's last write, so the directory mtime is its finish time
+        cutoff = time.time() - self.ttl
+        for job_id in os.listdir(self.report_dir):
+            job_dir = self.job_dir(job_id)
+            with self._lock:
+                future = self._jobs.get(job_id)
+                if (future is not None and not future.done()) or self._claimed(job_id):
+                    continue
+                try:
+                    expired = os.path.getmtime(job_dir) < cutoff
+                except FileNotFoundError:
+                    continue
+                if expired:
+                    shutil.rmtree(job_dir, ignore_errors=True)
+                    self._jobs.pop(job_id, None)
+
+    def stats(self):
+        with self._lock:
+            futures = list(self._jobs.values())
+        return {
+            "running": sum(not future.done() for future in futures),
+            "claimed_on_disk": sum(self._claimed(job_id) for job_id in os.listdir(self.report_dir)),
+            "finished_on_disk": sum(os.path.exists(self.pdf_path(job_id)) for job_id in os.listdir(self.report_dir)),
+            "max_workers": self.max_workers,
+            "ttl": self.ttl,
+        }
@@ -0,0 +1,130 @@
+import numpy as np
+import pandas as pd
+
+# Upper bound on the rows stacked into a single LightGBM call
+MAX_ROWS_PER_CALL = 1000000
+
+# Cells rescored to confirm stored baseline predictions came from the current model
+BASELINE_SAMPLE_SIZE = 64
+
+# How closely the sample must match; the feature cube holds float32 copies of the features the baseline was
+# predicted from
+BASELINE_RTOL = 1e-5
+BASELINE_ATOL = 1e-6
+
+
+def prediction_column(pollutant):
+    return f"{pollutant} Prediction 0.5"
+
+
+def apply_changes(observation_data, changes):
+    # Scale each changed feature by (1 + change / 100); unknown features are ignored
+    observation_data = observation_data.copy(deep=False)
+    for feature, change in changes.items():
+        if feature in observation_data.columns:
+            observation_data[feature] = observation_data[feature] * (1 + change / 100)
+    return observation_data
+
+
+def affected_rows(observation_data, changes):
+    # Rows whose feature vector differs from the baseline: a changed feature is non-zero there
+    affected = np.zeros(len(observation_data), dtype=bool)
+    for feature, change in changes.items():
+        if feature in observation_data.columns and change != 0:
+            affected |= observation_data[feature].to_numpy() != 0
+    return affected
+
+
+def baseline_matches_model(model, observation_data, baseline, feature_columns, sample_size=BASELINE_SAMPLE_SIZE):
+    """Check stored baseline predictions against the model on a sample of cells.
+
+    The baseline can only stand in for unchanged cells if it was produced by
+    this model from these features, so a small evenly spaced sample is
+    rescored and compared before the baseline is trusted.
+    """
+    rows = np.flatnonzero(~np.isnan(baseline))
+    if rows.size == 0:
+        return False
+    rows = rows[np.linspace(0, rows.size - 1, min(sample_size, rows.size)).astype(int)]
+    scored = predict_frames(model, [observation_data.iloc[rows]], feature_columns)[0]
+    return np.allclose(scored, baseline[rows], rtol=BASELINE_RTOL, atol=BASELINE_ATOL)
+
+
+def predict_scenarios(model, scenario_list, feature_columns):
+    """Predict every (observation_data, changes, baseline) scenario, rescoring only affected cells.
+
+    ``baseline`` holds the stored baseline predictions aligned with the rows
+    of ``observation_data`` (NaN where missing), or None to rescore every
+    cell. Cells where no changed feature is non-zero keep their baseline;
+    the affected cells are scored in stacked passes of up to
+    ``MAX_ROWS_PER_CALL`` rows. Each scenario's changed rows are copied only
+    when its pass is scored, so one pass's worth is held at a time.
+    """
+    predictions = []
+    pending = []
+    pending_rows = 0
+    for observation_data, changes, baseline in scenario_list:
+        if baseline is None:
+            rows = np.arange(len(observation_data))
+            values = np.full(len(observation_data), np.nan)
+        else:
+            rows = np.flatnonzero(affected_rows(observation_data, changes) | np.isnan(baseline))
+            values = np.array(baseline, dtype=np.float64)
+        predictions.append(values)
+
+        if pending and pending_rows + len(rows) > MAX_ROWS_PER_CALL:
+            _rescore(model, pending, feature_columns)
+            pending, pending_rows = [], 0
+        pending.append((observation_data, changes, rows, values))
+        pending_rows += len(rows)
+
+    if pending:
+        _rescore(model, pending, feature_columns)
+    return predictions
+
+
+def _rescore(model, pending, feature_columns):
+    # One stacked call over the changed copies of each scenario's affected rows, written into its predictions
+    frames = [apply_changes(observation_data.iloc[rows], changes) for observation_data, changes, rows, _ in pending]
+    for (_, _, rows, values), scored in zip(pending, _predict_chunk(model, frames, feature_columns)):
+        values[rows] = scored
+
+
+def predict_frames(model, frames, feature_columns):
+    """Score a list of observation frames with as few model calls as possible.
+
+    Frames carry a "Grid ID" column and the feature columns. They are stacked
+    into one matrix (split only above ``MAX_ROWS_PER_CALL`` rows), scored with
+    ``make_concentration_predicitions_united_kingdom`` and split back into one
+    prediction array per frame.
+    """
+    predictions = []
+    chunk = []
+    chunk_rows = 0
+    for frame in frames:
+        if chunk and chunk_rows + len(frame) > MAX_ROWS_PER_CALL:
+            predictions.extend(_predict_chunk(model, chunk, feature_columns))
+            chunk, chunk_rows = [], 0
+        chunk.append(frame)
+        chunk_rows += len(frame)
+    if chunk:
+        predictions.extend(_predict_chunk(model, chunk, feature_columns))
+    return predictions
+
+
+def _predict_chunk(model, frames, feature_columns):
+    # Nothing to score, e.g. a scenario whose changes affect no cells
+    if sum(len(frame) for frame in frames) == 0:
+        return [np.empty(0) for _ in frames]
+
+    stacked = pd.concat(
+        [frame[["Grid ID"] + feature_columns] for frame in frames], ignore_index=True
+    )
+    stacked = stacked.rename(columns={"Grid ID": "UK Model Grid ID"}, copy=False)
+
+    # Imported on first use, so the server can start without the library loaded
+    from environmental_insights import models as ei_models
+    scored = ei_models.make_concentration_predicitions_united_kingdom(model, stacked, feature_columns)
+    values = scored["Model Predicition"].to_numpy()
+    offsets = np.cumsum([len(frame) for frame in frames])[:-1]
+    return np.split(values, offsets)
@@ -0,0 +1,71 @@
+import threading
+import time
+
+import timings
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Coalesces concurrent requests for the same key into one computation.
+
+    The first caller for a key computes; callers that arrive while it is in
+    flight wait for it and share its result, or its exception. The key is
+    released as soon as the computation returns or raises, and nothing is
+    kept, so the next caller computes afresh. Only the computation is
+    shared: each caller serialises the result itself. Results are shared
+    between threads and must not be modified.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.leaders = 0
+        self.shared = 0
+
+    def _join(self, key):
+        # (call, whether this caller computes it)
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                self.shared += 1
+                return call, False
+            call = self._calls[key] = _Call()
+            self.leaders += 1
+            return call, True
+
+    def _forget(self, key, call):
+        with self._lock:
+            if self._calls.get(key) is call:
+                del self._calls[key]
+
+    def _wait(self, call):
+        start = time.perf_counter()
+        call.done.wait()
+        timings.observe('coalesced_wait', time.perf_counter() - start)
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def do(self, key, compute):
+        call, leader = self._join(key)
+        if not leader:
+            return self._wait(call)
+        try:
+            call.result = compute()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            self._forget(key, call)
+            call.done.set()
+        return call.result
+
+    def stats(self):
+        with self._lock:
+            return {"in_flight": len(self._calls), "leaders": self.leaders, "shared": self.shared}
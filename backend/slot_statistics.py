@@ -0,0 +1,124 @@
+import json
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+import aqi
+import database
+
+# Bins of the value histogram returned alongside the summary
+HISTOGRAM_BINS = 10
+
+# Computed statistics kept in memory per process
+DEFAULT_MAX_ENTRIES = 4096
+
+
+def summarise(values):
+    # Summary statistics of one column or scenario's predictions, ignoring missing cells
+    values = np.asarray(values, dtype=np.float64)
+    values = values[~np.isnan(values)]
+    if values.size == 0:
+        return {"count": 0}
+    p5, p25, p50, p75, p95 = np.percentile(values, [5, 25, 50, 75, 95])
+    return {
+        "count": int(values.size),
+        "min": float(values.min()),
+        "max": float(values.max()),
+        "mean": float(values.mean()),
+        "std": float(values.std()),
+        "p5": float(p5),
+        "p25": float(p25),
+        "median": float(p50),
+        "p75": float(p75),
+        "p95": float(p95),
+    }
+
+
+def compute_statistics(values, bands=None, bins=HISTOGRAM_BINS):
+    """Summary, quantiles and histograms of one column over the grid cells.
+
+    ``bands`` are the cells' AQI bands (1-10, 0 for none); when given, the
+    result includes their counts per band as ``aqi_histogram``.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    statistics = summarise(values)
+
+    finite = values[np.isfinite(values)]
+    if finite.size:
+        counts, edges = np.histogram(finite, bins=bins)
+        statistics["histogram"] = {"edges": edges.tolist(), "counts": counts.tolist()}
+
+    if bands is not None:
+        bands = np.asarray(bands, dtype=np.int64)
+        counts = np.bincount(bands, minlength=aqi.NUM_BANDS + 1)[1:aqi.NUM_BANDS + 1]
+        statistics["aqi_histogram"] = {"bands": list(range(1, aqi.NUM_BANDS + 1)), "counts": counts.tolist()}
+    return statistics
+
+
+def baseline_statistics(df):
+    # {prediction column: statistics} for every pollutant in one air pollution CSV, with its AQI bands
+    statistics = {}
+    for pollutant in aqi.AQI_BREAKPOINTS:
+        column = f"{pollutant} Prediction 0.5"
+        if column in df.columns:
+            bands = df[aqi.aqi_column(pollutant)] if aqi.aqi_column(pollutant) in df.columns else None
+            statistics[column] = compute_statistics(df[column], bands)
+    return statistics
+
+
+def create_statistics_table(conn):
+    conn.execute(f'''
+    CREATE TABLE IF NOT EXISTS {database.SLOT_STATISTICS_TABLE} (
+        kind TEXT NOT NULL,
+        month INTEGER NOT NULL,
+        day TEXT NOT NULL,
+        hour INTEGER NOT NULL,
+        "column" TEXT NOT NULL,
+        statistics TEXT NOT NULL,
+        PRIMARY KEY (kind, month, day, hour, "column")
+    ) WITHOUT ROWID;
+    ''')
+
+
+def write_statistics(conn, kind, month, day, hour, statistics):
+    conn.executemany(
+        f'INSERT OR REPLACE INTO {database.SLOT_STATISTICS_TABLE} (kind, month, day, hour, "column", statistics) '
+        'VALUES (?, ?, ?, ?, ?, ?);',
+        [(kind, month, day, hour, column, json.dumps(values)) for column, values in statistics.items()]
+    )
+
+
+def read_statistics(conn, kind, month, day, hour, column):
+    # Statistics the builder stored for one column and time slot, or None
+    if not database.table_exists(conn, database.SLOT_STATISTICS_TABLE):
+        return None
+    row = conn.execute(
+        f'SELECT statistics FROM {database.SLOT_STATISTICS_TABLE} '
+        'WHERE kind = ? AND month = ? AND day = ? AND hour = ? AND "column" = ?;',
+        (kind, int(month), day, int(hour), column)
+    ).fetchone()
+    return None if row is None else json.loads(row[0])
+
+
+class StatisticsCache:
+    """Small LRU of computed statistics, keyed by column, time slot, scenario and data version."""
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        with self._lock:
+            statistics = self._entries.get(key)
+            if statistics is not None:
+                self._entries.move_to_end(key)
+            return statistics
+
+    def put(self, key, statistics):
+        with self._lock:
+            self._entries[key] = statistics
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
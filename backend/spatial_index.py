@@ -0,0 +1,46 @@
+from pyproj import Transformer
+
+import database
+
+# CRS of the grids table and the R*Tree SpatiaLite builds on grids.geom
+GRID_EPSG = 3395
+GRIDS_SPATIAL_INDEX = 'idx_grids_geom'
+
+BBOX_EPSG_CODES = (4326, GRID_EPSG)
+
+
+def parse_bbox(value, epsg=4326):
+    # "minx,miny,maxx,maxy" in EPSG:4326 or EPSG:3395 -> bounds in the grid CRS
+    if epsg not in BBOX_EPSG_CODES:
+        raise ValueError(f"bbox_crs must be one of {BBOX_EPSG_CODES}.")
+    minx, miny, maxx, maxy = (float(part) for part in value.split(','))
+    if minx > maxx or miny > maxy:
+        raise ValueError("bbox must be minx,miny,maxx,maxy.")
+    return transform_bbox((minx, miny, maxx, maxy), epsg, GRID_EPSG)
+
+
+def transform_bbox(bbox, from_epsg, to_epsg):
+    if from_epsg == to_epsg:
+        return tuple(bbox)
+    transformer = Transformer.from_crs(from_epsg, to_epsg, always_xy=True)
+    return transformer.transform_bounds(*bbox)
+
+
+def grid_ids_in_bbox(conn, bbox, integer_ids=True):
+    """Grid IDs of the cells whose bounding box intersects ``bbox`` (EPSG:3395).
+
+    Reads the SpatiaLite R*Tree directly, so the extension does not need to
+    be loaded. Returns None if the database has no spatial index on grids.
+    """
+    if not database.table_exists(conn, GRIDS_SPATIAL_INDEX):
+        return None
+    # grids.grid_id is stored as text; cast back to the GeoPackage's integer ids
+    grid_id = 'CAST(grids.grid_id AS INTEGER)' if integer_ids else 'grids.grid_id'
+    minx, miny, maxx, maxy = bbox
+    rows = conn.execute(f'''
+        SELECT {grid_id}
+        FROM {GRIDS_SPATIAL_INDEX} AS idx
+        JOIN grids ON grids.id = idx.pkid
+        WHERE idx.xmin <= ? AND idx.xmax >= ? AND idx.ymin <= ? AND idx.ymax >= ?
+    ''', (maxx, minx, maxy, miny)).fetchall()
+    return [row[0] for row in rows]
@@ -0,0 +1,172 @@
+import math
+import os
+import sqlite3
+import threading
+import time
+
+from shapely.geometry import box
+
+# Half the width of the EPSG:3857 world, in metres
+WEB_MERCATOR_HALF_WIDTH = 20037508.342789244
+
+# Vector tile grid resolution and the margin kept around each tile, in tile units
+TILE_EXTENT = 4096
+TILE_BUFFER = 64
+
+MVT_MIMETYPE = 'application/vnd.mapbox-vector-tile'
+
+# Default on-disk budget for cached tiles, in bytes
+DEFAULT_TILE_CACHE_BYTES = 512 * 1024 * 1024
+
+
+def tile_bounds(z, x, y):
+    # EPSG:3857 bounds (minx, miny, maxx, maxy) of an XYZ tile
+    size = 2 * WEB_MERCATOR_HALF_WIDTH / 2 ** z
+    minx = -WEB_MERCATOR_HALF_WIDTH + x * size
+    maxy = WEB_MERCATOR_HALF_WIDTH - y * size
+    return minx, maxy - size, minx + size, maxy
+
+
+def valid_tile(z, x, y):
+    return 0 <= z <= 24 and 0 <= x < 2 ** z and 0 <= y < 2 ** z
+
+
+def render_tile(grids, values, z, x, y, layer_name):
+    """Encode the grid cells that intersect one tile as a Mapbox Vector Tile.
+
+    ``grids`` is the unsimplified grid in EPSG:3857 indexed by Grid ID and
+    ``values`` a DataFrame of properties indexed by Grid ID. Cells are
+    simplified to the tile's pixel size and clipped to the tile plus its
+    buffer. Needs the mapbox-vector-tile package.
+    """
+    try:
+        import mapbox_vector_tile
+    except ImportError:
+        raise RuntimeError("Vector tiles require the mapbox-vector-tile package.")
+
+    bounds = tile_bounds(z, x, y)
+    pixel = (bounds[2] - bounds[0]) / TILE_EXTENT
+    clip_bounds = (
+        bounds[0] - TILE_BUFFER * pixel, bounds[1] - TILE_BUFFER * pixel,
+        bounds[2] + TILE_BUFFER * pixel, bounds[3] + TILE_BUFFER * pixel,
+    )
+
+    # Cells in the tile, through the grid's spatial index
+    positions = grids.sindex.query(box(*clip_bounds), predicate='intersects')
+    cells = grids.iloc[positions]
+    cells = cells[cells.index.isin(values.index)]
+    geometries = cells.geometry.simplify(pixel, preserve_topology=True).clip_by_rect(*clip_bounds)
+    properties = values.reindex(cells.index).to_dict('records')
+
+    features = []
+    for grid_id, geometry, cell_properties in zip(cells.index.tolist(), geometries, properties):
+        if geometry is None or geometry.is_empty:
+            continue
+        cell_properties = {key: value for key, value in cell_properties.items() if not _is_missing(value)}
+        cell_properties['Grid ID'] = grid_id
+        features.append({'geometry': geometry, 'properties': cell_properties})
+
+    return mapbox_vector_tile.encode(
+        [{'name': layer_name, 'features': features}],
+        default_options={'quantize_bounds': bounds, 'extents': TILE_EXTENT},
+    )
+
+
+def _is_missing(value):
+    return value is None or (isinstance(value, float) and math.isnan(value))
+
+
+class TileCache:
+    """MBTiles-style SQLite cache of rendered tiles with size-based eviction.
+
+    Tiles are stored per ``cache_key`` (layer, value column, time slot and data
+    version) with TMS rows, as in MBTiles. Once the stored tiles exceed
+    ``max_bytes``, the least recently used are deleted down to 90% of it.
+    The file is created when the first tile is stored, not when the cache is
+    constructed, so importing the app leaves the data directory untouched.
+    """
+
+    def __init__(self, cache_file, max_bytes=DEFAULT_TILE_CACHE_BYTES):
+        self.cache_file = cache_file
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._total_bytes = None
+
+    def _create(self):
+        # Creates the file and its table on first use; called with the lock held
+        os.makedirs(os.path.dirname(os.path.abspath(self.cache_file)), exist_ok=True)
+        conn = self._connect()
+        conn.execute('''
+        CREATE TABLE IF NOT EXISTS tiles (
+            cache_key TEXT NOT NULL,
+            zoom_level INTEGER NOT NULL,
+            tile_column INTEGER NOT NULL,
+            tile_row INTEGER NOT NULL,
+            tile_data BLOB NOT NULL,
+            size INTEGER NOT NULL,
+            last_access REAL NOT NULL,
+            PRIMARY KEY (cache_key, zoom_level, tile_column, tile_row)
+        );
+        ''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_tiles_last_access ON tiles (last_access);')
+        conn.commit()
+        self._total_bytes = conn.execute('SELECT COALESCE(SUM(size), 0) FROM tiles;').fetchone()[0]
+        conn.close()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.cache_file, timeout=30)
+        conn.execute('PRAGMA journal_mode = WAL;')
+        return conn
+
+    def get(self, cache_key, z, x, y):
+        tile_row = 2 ** z - 1 - y
+        with self._lock:
+            if self._total_bytes is None:
+                if not os.path.exists(self.cache_file):
+                    return None
+                self._create()
+            conn = self._connect()
+            try:
+                row = conn.execute(
+                    'SELECT tile_data FROM tiles WHERE cache_key = ? AND zoom_level = ? AND tile_column = ? AND tile_row = ?;',
+                    (cache_key, z, x, tile_row)
+                ).fetchone()
+                if row is not None:
+                    conn.execute(
+                        'UPDATE tiles SET last_access = ? WHERE cache_key = ? AND zoom_level = ? AND tile_column = ? AND tile_row = ?;',
+                        (time.time(), cache_key, z, x, tile_row)
+                    )
+                    conn.commit()
+            finally:
+                conn.close()
+        return None if row is None else row[0]
+
+    def put(self, cache_key, z, x, y, tile_data):
+        tile_row = 2 ** z - 1 - y
+        with self._lock:
+            if self._total_bytes is None:
+                self._create()
+            conn = self._connect()
+            try:
+                conn.execute(
+                    'INSERT OR REPLACE INTO tiles (cache_key, zoom_level, tile_column, tile_row, tile_data, size, last_access) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?);',
+                    (cache_key, z, x, tile_row, tile_data, len(tile_data), time.time())
+                )
+                conn.commit()
+                self._total_bytes += len(tile_data)
+                if self._total_bytes > self.max_bytes:
+                    self._evict(conn)
+            finally:
+                conn.close()
+
+    def _evict(self, conn):
+        # Other processes share the file, so start from the true total
+        self._total_bytes = conn.execute('SELECT COALESCE(SUM(size), 0) FROM tiles;').fetchone()[0]
+        target = int(self.max_bytes * 0.9)
+        for rowid, size in conn.execute('SELECT rowid, size FROM tiles ORDER BY last_access;').fetchall():
+            if self._total_bytes <= target:
+                break
+            conn.execute('DELETE FROM tiles WHERE rowid = ?;', (rowid,))
+            self._total_bytes -= size
+        conn.commit()
@@ -0,0 +1,120 @@
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+# Histogram bucket upper bounds, in seconds
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+METRICS_MIMETYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Stage durations of the current request, in the order they finished
+_request_stages = contextvars.ContextVar('request_stages', default=None)
+
+
+class Histograms:
+    """Cumulative Prometheus-style histograms of durations, one per label value.
+
+    Counts are kept per process; with several server workers each one
+    reports its own.
+    """
+
+    def __init__(self, name, label, help_text, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.label = label
+        self.help_text = help_text
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def observe(self, label_value, seconds):
+        with self._lock:
+            series = self._series.get(label_value)
+            if series is None:
+                series = self._series[label_value] = {"counts": [0] * len(self.buckets), "count": 0, "sum": 0.0}
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    series["counts"][i] += 1
+            series["count"] += 1
+            series["sum"] += seconds
+
+    def render(self):
+        # Text exposition format: cumulative buckets, then +Inf, sum and count per series
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = sorted((value, dict(s, counts=list(s["counts"]))) for value, s in self._series.items())
+        for value, s in series:
+            label = f'{self.label}="{escape_label(value)}"'
+            for bound, count in zip(self.buckets, s["counts"]):
+                lines.append(f'{self.name}_bucket{{{label},le="{bound}"}} {count}')
+            lines.append(f'{self.name}_bucket{{{label},le="+Inf"}} {s["count"]}')
+            lines.append(f'{self.name}_sum{{{label}}} {s["sum"]}')
+            lines.append(f'{self.name}_count{{{label}}} {s["count"]}')
+        return '\n'.join(lines) + '\n'
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+stage_durations = Histograms(
+    'eii_stage_duration_seconds', 'stage', 'Time spent in each stage of request handling.'
+)
+request_durations = Histograms(
+    'eii_request_duration_seconds', 'endpoint', 'Time from a request arriving to its response being returned.'
+)
+
+
+def observe(stage_name, seconds):
+    # Record a stage in the histograms and, inside a request, for its Server-Timing header
+    stage_durations.observe(stage_name, seconds)
+    stages = _request_stages.get()
+    if stages is not None:
+        stages.append((stage_name, seconds))
+
+
+@contextmanager
+def stage(stage_name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(stage_name, time.perf_counter() - start)
+
+
+def timed_iter(stage_name, chunks):
+    # Pass a generator's chunks through, recording the time spent producing them once it is exhausted
+    chunks = iter(chunks)
+    elapsed = 0.0
+    try:
+        while True:
+            start = time.perf_counter()
+            try:
+                chunk = next(chunks)
+            except StopIteration:
+                return
+            finally:
+                elapsed += time.perf_counter() - start
+            yield chunk
+    finally:
+        observe(stage_name, elapsed)
+
+
+def start_request():
+    _request_stages.set([])
+
+
+def server_timing():
+    """Server-Timing header value for the stages of the current request so far.
+
+    Repeated stages are summed. Work done while a streamed body is sent
+    happens after the headers, so it only reaches the histograms.
+    """
+    totals = {}
+    for stage_name, seconds in _request_stages.get() or []:
+        totals[stage_name] = totals.get(stage_name, 0.0) + seconds
+    return ', '.join(f'{stage_name};dur={seconds * 1000:.1f}' for stage_name, seconds in totals.items())
+
+
+def render_metrics():
+    return stage_durations.render() + request_durations.render()
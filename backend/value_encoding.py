@@ -0,0 +1,71 @@
+import json
+
+import numpy as np
+import pandas as pd
+
+RAW_MIMETYPE = 'application/octet-stream'
+ARROW_MIMETYPE = 'application/vnd.apache.arrow.stream'
+
+# Response headers describing a raw values payload
+RAW_HEADERS = ['X-Grid-Count', 'X-Values-Dtype', 'X-AQI-Dtype', 'X-AQI-Offset']
+
+# Extra headers of a raw time series: one row of grid-aligned values per time slot
+TIME_SERIES_HEADERS = ['X-Slot-Count', 'X-Time-Slot-Months', 'X-Time-Slot-Days', 'X-Time-Slot-Hours']
+
+
+def align_values(grid_ids, value_grid_ids, values, dtype=np.float32, fill=np.nan):
+    # Reorder values to the fixed grid order; cells without a value get ``fill``
+    positions = pd.Index(value_grid_ids).get_indexer(grid_ids)
+    aligned = np.full(len(grid_ids), fill, dtype=dtype)
+    found = positions >= 0
+    aligned[found] = np.asarray(values)[positions[found]]
+    return aligned
+
+
+def encode_values(values, aqi=None, fmt='raw'):
+    """Encode grid-aligned values (and optional AQI bands) for the values endpoints.
+
+    ``raw`` is the float32 little-endian values followed by one uint8 AQI band
+    per cell (0 where there is no band). ``arrow`` is an Arrow IPC stream with
+    ``value`` and ``aqi`` columns and needs the optional pyarrow package.
+    Returns the body, its mimetype and the headers that describe it.
+    """
+    values = np.ascontiguousarray(values, dtype='<f4')
+    if aqi is not None:
+        aqi = np.ascontiguousarray(aqi, dtype=np.uint8)
+
+    if fmt == 'arrow':
+        try:
+            import pyarrow as pa
+        except ImportError:
+            raise ValueError("Arrow output requires the pyarrow package.")
+        columns = {'value': pa.array(values)}
+        if aqi is not None:
+            columns['aqi'] = pa.array(aqi)
+        table = pa.table(columns)
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return sink.getvalue().to_pybytes(), ARROW_MIMETYPE, {'X-Grid-Count': str(len(values))}
+
+    if fmt != 'raw':
+        raise ValueError(f"Unknown values format {fmt}; use raw or arrow.")
+
+    headers = {'X-Grid-Count': str(len(values)), 'X-Values-Dtype': 'float32-le'}
+    body = values.tobytes()
+    if aqi is not None:
+        headers['X-AQI-Dtype'] = 'uint8'
+        headers['X-AQI-Offset'] = str(len(body))
+        body += aqi.tobytes()
+    return body, RAW_MIMETYPE, headers
+
+
+def encode_row(values):
+    # One time slot of a raw time series: float32 little-endian, NaN where a cell has no value
+    return np.ascontiguousarray(values, dtype='<f4').tobytes()
+
+
+def json_row(values):
+    # One time slot of a JSON time series, with null for missing cells
+    values = np.asarray(values, dtype=np.float64)
+    return json.dumps([None if np.isnan(value) else value for value in values.tolist()])
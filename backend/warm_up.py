@@ -0,0 +1,65 @@
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+NOT_STARTED = 'not started'
+RUNNING = 'running'
+READY = 'ready'
+
+
+class WarmUp:
+    """Named loading steps run once before serving, with their progress for /status.
+
+    A failing step is logged and recorded, and the remaining steps still run;
+    whatever it would have loaded is loaded lazily by the first request that
+    needs it instead. Warm-up is ready once every step has been attempted.
+    """
+
+    def __init__(self, steps):
+        self.steps = list(steps)
+        self._lock = threading.Lock()
+        self._state = NOT_STARTED
+        self._seconds = {}
+        self._errors = {}
+
+    @property
+    def ready(self):
+        with self._lock:
+            return self._state == READY
+
+    def start(self):
+        # Run in a daemon thread, so the server can answer (e.g. /status) while it loads
+        thread = threading.Thread(target=self.run, name='warm-up', daemon=True)
+        thread.start()
+        return thread
+
+    def run(self):
+        with self._lock:
+            if self._state != NOT_STARTED:
+                return
+            self._state = RUNNING
+
+        for name, step in self.steps:
+            start = time.perf_counter()
+            try:
+                step()
+            except Exception as e:
+                logger.exception(f"Warm-up step {name} failed")
+                with self._lock:
+                    self._errors[name] = str(e)
+            with self._lock:
+                self._seconds[name] = time.perf_counter() - start
+
+        with self._lock:
+            self._state = READY
+        logger.info(f"Warm-up finished in {sum(self._seconds.values()):.1f}s")
+
+    def status(self):
+        with self._lock:
+            return {
+                "state": self._state,
+                "steps": {name: round(seconds, 3) for name, seconds in self._seconds.items()},
+                "errors": dict(self._errors),
+            }